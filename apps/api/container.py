@@ -0,0 +1,136 @@
+"""
+Service Container: build the heavy RAG services once per process.
+
+The embedding model, cross-encoder, BM25 index and vector store are loaded
+at startup by the API lifespan and shared by every request through the
+FastAPI dependencies below.
+"""
+from dataclasses import dataclass
+from typing import Optional, Tuple, Union
+from fastapi import Request
+from rag.embeddings.service import EmbeddingService
+from rag.vector_store.qdrant import QdrantService, AsyncQdrantService
+from rag.vector_store.flat import FlatVectorStore
+from rag.sparse.index import BM25Index
+from rag.retrieval.service import RetrievalService
+from rag.rerank.service import RerankerService
+from rag.generation.service import GenerationService
+from rag.ingestion.service import IngestionService
+from rag.cache.generation import IndexGeneration
+from rag.cache.rerank_scores import RerankScoreCache
+from apps.api.settings import settings
+
+WARMUP_QUERY = "warmup"
+
+
+@dataclass
+class ServiceContainer:
+    """Process-wide RAG services, shared across requests."""
+    embedding_service: EmbeddingService
+    qdrant_service: Union[QdrantService, FlatVectorStore]  # per settings.VECTOR_BACKEND
+    async_qdrant_service: Optional[AsyncQdrantService]
+    bm25_index: Optional[BM25Index]  # None when the sparse leg runs in Qdrant
+    retrieval_service: RetrievalService
+    reranker_service: RerankerService
+    generation_service: GenerationService
+    ingestion_service: IngestionService
+
+    @classmethod
+    def build(cls) -> "ServiceContainer":
+        """Load models and indexes once. Retrieval and ingestion share them."""
+        embedding_service = EmbeddingService()
+        qdrant_service, async_qdrant_service = build_vector_store()
+        # Ingestion and BM25 deletes bump it, retrieval keys its cache on it
+        generation = IndexGeneration()
+        # SPARSE_BACKEND=qdrant keeps the sparse leg in Qdrant: no in-process index
+        bm25_index = BM25Index(generation=generation) if settings.SPARSE_BACKEND == "bm25" else None
+        # Ingestion drops the cached rerank scores of chunks it re-indexes
+        score_cache = RerankScoreCache(max_size=settings.RERANK_SCORE_CACHE_SIZE)
+
+        return cls(
+            embedding_service=embedding_service,
+            qdrant_service=qdrant_service,
+            async_qdrant_service=async_qdrant_service,
+            bm25_index=bm25_index,
+            retrieval_service=RetrievalService(
+                embedding_service=embedding_service,
+                qdrant_service=qdrant_service,
+                bm25_index=bm25_index,
+                generation=generation,
+                async_qdrant_service=async_qdrant_service,
+            ),
+            reranker_service=RerankerService(score_cache=score_cache, embedding_service=embedding_service),
+            generation_service=GenerationService(),
+            ingestion_service=IngestionService(
+                embedding_service=embedding_service,
+                qdrant_service=qdrant_service,
+                bm25_index=bm25_index,
+                generation=generation,
+                score_cache=score_cache,
+            ),
+        )
+
+    def warmup(self):
+        """
+        Run a dummy query through embedding, retrieval and reranking so the
+        first real request does not pay for lazy initialisation.
+        """
+        try:
+            candidates = self.retrieval_service.hybrid_search(WARMUP_QUERY, top_k=1)
+            if candidates:
+                self.reranker_service.rerank(WARMUP_QUERY, candidates, top_k=1)
+            else:
+                # Empty index: still exercise both models once
+                self.reranker_service.model.predict([[WARMUP_QUERY, WARMUP_QUERY]])
+            print("Service warmup complete.")
+        except Exception as e:
+            print(f"Service warmup failed: {e}")
+
+    async def aclose(self):
+        """Release network resources and worker processes at shutdown."""
+        if self.async_qdrant_service is not None:
+            await self.async_qdrant_service.close()
+        self.embedding_service.close()
+
+
+def build_vector_store() -> Tuple[Union[QdrantService, FlatVectorStore], Optional[AsyncQdrantService]]:
+    """
+    The dense backend selected by settings.VECTOR_BACKEND, and the async client
+    request handlers use for it. The embedded flat store has no network I/O;
+    RetrievalService runs it on its executor instead.
+    """
+    if settings.SPARSE_BACKEND not in ("bm25", "qdrant"):
+        raise ValueError(f"Unknown sparse backend: {settings.SPARSE_BACKEND}. Available: bm25, qdrant")
+    if settings.VECTOR_BACKEND == "flat":
+        if settings.SPARSE_BACKEND == "qdrant":
+            raise ValueError("SPARSE_BACKEND=qdrant requires VECTOR_BACKEND=qdrant")
+        return FlatVectorStore(persistence_dir=settings.FLAT_VECTOR_DIR, dtype=settings.FLAT_VECTOR_DTYPE), None
+    if settings.VECTOR_BACKEND != "qdrant":
+        raise ValueError(f"Unknown vector backend: {settings.VECTOR_BACKEND}. Available: qdrant, flat")
+    return QdrantService(url=settings.QDRANT_URL), AsyncQdrantService(
+        url=settings.QDRANT_URL,
+        prefer_grpc=settings.QDRANT_PREFER_GRPC,
+        grpc_port=settings.QDRANT_GRPC_PORT,
+        pool_size=settings.QDRANT_POOL_SIZE,
+        timeout=settings.QDRANT_TIMEOUT,
+    )
+
+
+def get_services(request: Request) -> ServiceContainer:
+    return request.app.state.services
+
+
+def get_retrieval_service(request: Request) -> RetrievalService:
+    return get_services(request).retrieval_service
+
+
+def get_reranker_service(request: Request) -> RerankerService:
+    return get_services(request).reranker_service
+
+
+def get_generation_service(request: Request) -> GenerationService:
+    return get_services(request).generation_service
+
+
+def get_ingestion_service(request: Request) -> IngestionService:
+    return get_services(request).ingestion_service
@@ -1,9 +1,10 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
 from apps.api.settings import settings
 from apps.api.routers import ingest, search, ask
 from apps.api.telemetry import setup_telemetry
+from apps.api.container import ServiceContainer, get_services
 
 
 @asynccontextmanager
@@ -11,9 +12,13 @@ async def lifespan(app: FastAPI):
     # Startup logic
     print("Starting RAG Foundry API...")
     setup_telemetry()
+    services = ServiceContainer.build()
+    services.warmup()
+    app.state.services = services
     yield
     # Shutdown logic
     print("Shutting down RAG Foundry API...")
+    await services.aclose()
 
 app = FastAPI(
     title="RAG Foundry API",
@@ -37,6 +42,16 @@ async def health_check():
         "environment": settings.ENV
     }
 
+@app.get("/inference/stats")
+async def inference_stats(services: ServiceContainer = Depends(get_services)):
+    """Micro-batching counters: batch sizes and queue wait vs compute time (ms) per model."""
+    return {
+        "embedding": services.embedding_service.batch_stats(),
+        "rerank": services.reranker_service.batch_stats(),
+        "rerank_token_cache": services.reranker_service.token_cache_stats(),
+        "rerank_score_cache": services.reranker_service.score_cache_stats(),
+    }
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to RAG Foundry"}
@@ -45,9 +60,12 @@ class AgentRequest(BaseModel):
     question: str
 
 @app.post("/agent/ask")
-async def ask_agent(request: AgentRequest):
+async def ask_agent(request: AgentRequest, services: ServiceContainer = Depends(get_services)):
     from rag.agent.runner import AgentRunner
-    runner = AgentRunner()
+    from rag.agent.tools import SearchTool
+    runner = AgentRunner(
+        search_tool=SearchTool(retriever=services.retrieval_service, reranker=services.reranker_service)
+    )
     answer = runner.run(request.question)
     return {"answer": answer}
 
@@ -1,10 +1,14 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from rag.retrieval.service import RetrievalService
 from rag.rerank.service import RerankerService
 from rag.generation.service import GenerationService
 from rag.retrieval.models import ScoredChunk
+from rag.retrieval.filters import InvalidFilterError
+from rag.retrieval.fusion import InvalidFusionError
+from apps.api.container import get_retrieval_service, get_reranker_service, get_generation_service
 
 router = APIRouter(prefix="/ask", tags=["Ask"])
 
@@ -16,31 +20,43 @@ class AskRequest(BaseModel):
 class AskResponse(BaseModel):
     answer: str
     citations: List[ScoredChunk]
+    degraded: bool = False
 
 @router.post("", response_model=AskResponse)
-async def ask(request: AskRequest):
+async def ask(
+    request: AskRequest,
+    retrieval_service: RetrievalService = Depends(get_retrieval_service),
+    reranker_service: RerankerService = Depends(get_reranker_service),
+    generation_service: GenerationService = Depends(get_generation_service)
+):
     try:
         # 1. Retrieval
-        retrieval_service = RetrievalService()
+        degraded = False
         if request.use_hybrid:
             # Fetch more candidates for reranking
-            candidates = retrieval_service.hybrid_search(request.question, top_k=20) 
+            result = await retrieval_service.ahybrid_search_with_status(
+                request.question, top_k=20, filters=request.filters
+            )
+            candidates, degraded = result.chunks, result.degraded
+            # Hits whose payload lookup failed come back without content; /search can
+            # show them, but there is nothing for the reranker or the LLM to read
+            candidates = [c for c in candidates if c.content]
         else:
-            candidates = retrieval_service.search(request.question, top_k=20)
+            candidates = await retrieval_service.asearch(request.question, top_k=20, filters=request.filters)
             
         if not candidates:
-            return AskResponse(answer="I found no relevant information in the knowledge base.", citations=[])
+            return AskResponse(answer="I found no relevant information in the knowledge base.", citations=[], degraded=degraded)
 
-        # 2. Reranking
-        reranker_service = RerankerService()
-        top_chunks = reranker_service.rerank(request.question, candidates, top_k=5)
+        # 2. Reranking, off the event loop so concurrent requests share model calls
+        top_chunks = await run_in_threadpool(reranker_service.rerank, request.question, candidates, top_k=5)
         
-        # 3. Generation
-        generation_service = GenerationService()
-        answer = generation_service.generate_answer(request.question, top_chunks)
+        # 3. Generation: a blocking LLM call, kept off the event loop as well
+        answer = await run_in_threadpool(generation_service.generate_answer, request.question, top_chunks)
         
-        return AskResponse(answer=answer, citations=top_chunks)
+        return AskResponse(answer=answer, citations=top_chunks, degraded=degraded)
         
+    except (InvalidFilterError, InvalidFusionError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         import traceback
         traceback.print_exc()
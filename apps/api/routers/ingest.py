@@ -1,9 +1,12 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Depends
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import shutil
 import os
 import tempfile
 from rag.ingestion.service import IngestionService
+from rag.ingestion.loaders import UnsupportedFileTypeError
+from apps.api.container import get_ingestion_service
 
 router = APIRouter(prefix="/ingest", tags=["Ingestion"])
 
@@ -12,9 +15,10 @@ class IngestResponse(BaseModel):
     chunks_indexed: int
 
 @router.post("/file", response_model=IngestResponse)
-async def ingest_file(file: UploadFile = File(...)):
-    service = IngestionService()
-    
+async def ingest_file(
+    file: UploadFile = File(...),
+    service: IngestionService = Depends(get_ingestion_service)
+):
     # Save uploaded file typically to a temp location
     suffix = os.path.splitext(file.filename)[1]
     with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
@@ -22,9 +26,10 @@ async def ingest_file(file: UploadFile = File(...)):
         tmp_path = tmp.name
         
     try:
-        chunks_count = service.ingest_file(tmp_path)
+        # Parsing, embedding and indexing block; keep them off the event loop
+        chunks_count = await run_in_threadpool(service.ingest_file, tmp_path)
         return IngestResponse(message=f"Successfully ingested {file.filename}", chunks_indexed=chunks_count)
-    except ValueError as e:
+    except UnsupportedFileTypeError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -35,15 +40,16 @@ class LocalIngestRequest(BaseModel):
     path: str
 
 @router.post("/local", response_model=IngestResponse)
-async def ingest_local(request: LocalIngestRequest):
-    service = IngestionService()
-    
+async def ingest_local(
+    request: LocalIngestRequest,
+    service: IngestionService = Depends(get_ingestion_service)
+):
     if not os.path.exists(request.path):
         raise HTTPException(status_code=404, detail="Path not found")
         
     if os.path.isfile(request.path):
-        count = service.ingest_file(request.path)
+        count = await run_in_threadpool(service.ingest_file, request.path)
     else:
-        count = service.ingest_directory(request.path)
+        count = await run_in_threadpool(service.ingest_directory, request.path)
         
     return IngestResponse(message=f"Ingested from {request.path}", chunks_indexed=count)
@@ -1,24 +1,31 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional, Dict, Any
 from rag.retrieval.service import RetrievalService
 from rag.retrieval.models import ScoredChunk
+from rag.retrieval.filters import InvalidFilterError
+from rag.retrieval.fusion import InvalidFusionError
+from apps.api.container import get_retrieval_service
 
 router = APIRouter(prefix="/search", tags=["Search"])
 
 class SearchRequest(BaseModel):
     query: str
     top_k: int = 5
+    filters: Optional[Dict[str, Any]] = None  # doc_id / type / source -> value or list of values
 
 class SearchResponse(BaseModel):
     results: List[ScoredChunk]
+    degraded: bool = False
 
 @router.post("/dense", response_model=SearchResponse)
-async def search_dense(request: SearchRequest):
-    service = RetrievalService()
+async def search_dense(request: SearchRequest, service: RetrievalService = Depends(get_retrieval_service)):
     try:
-        results = service.search(query=request.query, top_k=request.top_k)
+        results = await service.asearch(query=request.query, top_k=request.top_k, filters=request.filters)
         return SearchResponse(results=results)
+    except (InvalidFilterError, InvalidFusionError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -26,18 +33,60 @@ class HybridSearchRequest(BaseModel):
     query: str
     top_k: int = 5
     alpha: float = 0.5
+    fusion: Optional[str] = None  # weighted | zscore | rrf
+    filters: Optional[Dict[str, Any]] = None
 
 @router.post("/hybrid", response_model=SearchResponse)
-async def search_hybrid(request: HybridSearchRequest):
-    service = RetrievalService()
+async def search_hybrid(request: HybridSearchRequest, service: RetrievalService = Depends(get_retrieval_service)):
     try:
-        results = service.hybrid_search(
+        result = await service.ahybrid_search_with_status(
             query=request.query, 
             top_k=request.top_k, 
-            alpha=request.alpha
+            alpha=request.alpha,
+            fusion=request.fusion,
+            filters=request.filters
         )
-        return SearchResponse(results=results)
+        return SearchResponse(results=result.chunks, degraded=result.degraded)
+    except (InvalidFilterError, InvalidFusionError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 5
+    alpha: float = 0.5
+    fusion: Optional[str] = None  # weighted | zscore | rrf
+    filters: Optional[Dict[str, Any]] = None
+
+class BatchSearchResponse(BaseModel):
+    results: List[List[ScoredChunk]]  # one list per query, in request order
+
+@router.post("/batch", response_model=BatchSearchResponse)
+async def search_batch(request: BatchSearchRequest, service: RetrievalService = Depends(get_retrieval_service)):
+    try:
+        # Offline batches: keep the event loop free while the batch runs
+        results = await run_in_threadpool(
+            service.search_many,
+            queries=request.queries,
+            top_k=request.top_k,
+            alpha=request.alpha,
+            fusion=request.fusion,
+            filters=request.filters
+        )
+        return BatchSearchResponse(results=results)
+    except (InvalidFilterError, InvalidFusionError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/cache/stats")
+async def cache_stats(service: RetrievalService = Depends(get_retrieval_service)) -> Dict[str, Any]:
+    """Retrieval and embedding cache counters (hits, misses, evictions, ...) for sizing the caches."""
+    return {
+        **service.cache.stats(),
+        "index_generation": service.generation.value,
+        "embeddings": service.embedding_service.cache_stats(),
+    }
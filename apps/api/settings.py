@@ -5,6 +5,75 @@ class Settings(BaseSettings):
     QDRANT_URL: str = "http://localhost:6333"
     PHOENIX_COLLECTOR_ENDPOINT: str = "http://localhost:4317"
     LLM_BASE_URL: str = "http://localhost:8080/v1"  # MLX Server
+
+    QDRANT_PROFILE: str = "default"  # default | low-latency | low-memory | max-recall
+
+    # Dense vector backend: the Qdrant server, or an embedded memory-mapped matrix (rag/vector_store/flat.py)
+    VECTOR_BACKEND: str = "qdrant"  # qdrant | flat
+    FLAT_VECTOR_DIR: str = "data/flat_vectors"
+    FLAT_VECTOR_DTYPE: str = "float32"  # float32 | float16 (half the memory, ~1e-3 score error)
+
+    # Async Qdrant client used by the API (rag/vector_store/qdrant.py)
+    QDRANT_PREFER_GRPC: bool = False
+    QDRANT_GRPC_PORT: int = 6334
+    QDRANT_POOL_SIZE: int = 20  # max pooled REST connections
+    QDRANT_TIMEOUT: float = 5.0  # seconds, per call
+
+    # Bulk ingestion
+    INGEST_BATCH_SIZE: int = 1024  # chunks embedded per batch; upserts overlap with the next batch
+    QDRANT_UPSERT_BATCH_SIZE: int = 256  # points per upsert request
+    QDRANT_UPSERT_PARALLEL: int = 4  # upsert requests in flight
+    INGEST_ENCODER_WORKERS: int = 0  # encoder processes for chunk embedding (rag/embeddings/pool.py); 0 encodes in-process
+    INGEST_TOKEN_BUDGET: int = 16384  # padded tokens per encoder batch; bounds a batch's activation memory
+    INGEST_MAX_ENCODE_BATCH: int = 256  # chunks per encoder batch, however short
+    QDRANT_UPSERT_RETRIES: int = 3
+    QDRANT_UPSERT_BACKOFF: float = 0.5  # seconds, doubled on every retry
+
+    # Hybrid retrieval: per-leg deadlines (seconds)
+    DENSE_LEG_TIMEOUT: float = 2.0
+    SPARSE_LEG_TIMEOUT: float = 2.0
+    PAYLOAD_LEG_TIMEOUT: float = 2.0  # fetching the payloads of hits found only by BM25
+    RETRIEVAL_WORKERS: int = 8  # threads for blocking retrieval work without a deadline (batch and dense-only search)
+    RETRIEVAL_LEG_WORKERS: int = 32  # threads for legs; a timed-out leg holds one until it finishes, a leg finding none free fails (degraded)
+    FUSION_STRATEGY: str = "weighted"  # weighted | zscore | rrf
+
+    # Sparse leg: in-process BM25Index, or BM25-weighted sparse vectors in the Qdrant
+    # collection with both legs fused server-side in one query (rag/sparse/encoder.py)
+    SPARSE_BACKEND: str = "bm25"  # bm25 | qdrant (requires re-ingesting into a new collection)
+    SPARSE_AVG_DOC_LEN: float = 100.0  # terms per chunk, for BM25 length normalisation of sparse vectors
+
+    # Retrieval result cache (LRU + TTL, invalidated on every ingest)
+    RETRIEVAL_CACHE_SIZE: int = 1024  # entries; 0 disables the cache
+    RETRIEVAL_CACHE_TTL: float = 300.0  # seconds
+
+    # Model execution for embeddings and reranking (rag/inference/backends.py)
+    INFERENCE_BACKEND: str = "torch"  # torch | onnx | onnx-int8 (onnx needs sentence-transformers[onnx])
+    ONNX_EXPORT_DIR: str = "data/onnx"
+    ONNX_QUANTIZATION: str = "avx2"  # int8 kernels for: arm64 | avx2 | avx512 | avx512_vnni
+
+    # Micro-batching of concurrent query embeddings and reranks (rag/inference/batching.py); 0 ms disables
+    EMBED_BATCH_WAIT_MS: float = 2.0
+    EMBED_BATCH_MAX_SIZE: int = 64  # queries per model call
+    RERANK_BATCH_WAIT_MS: float = 3.0
+    RERANK_BATCH_MAX_SIZE: int = 128  # query-passage pairs per model call
+    RERANK_TOKEN_CACHE_SIZE: int = 10000  # chunks whose cross-encoder token ids are kept (rag/rerank/tokens.py)
+    RERANK_SCORE_CACHE_SIZE: int = 100000  # (query, chunk) cross-encoder scores kept; 0 disables
+
+    # Rerank cascade: bi-encoder cosine (stored chunk vectors) prunes candidates before the cross-encoder
+    RERANK_CASCADE: bool = False
+    RERANK_CASCADE_MAX_GAP: float = 0.2  # drop candidates this far below the best cosine
+    RERANK_CASCADE_MIN_SCORE: float = 0.0  # drop candidates below this cosine
+    RERANK_CASCADE_MAX_SURVIVORS: int = 12  # candidates cross-encoded at most (top_k always are)
+
+    # Embedding caches: query vectors in memory, chunk vectors on disk (by content hash and model)
+    QUERY_EMBEDDING_CACHE_SIZE: int = 4096  # 0 disables
+    EMBEDDING_CACHE_PATH: str = "data/embedding_cache.sqlite3"  # "" disables
+
+    # BM25 analyzer (changing these requires rebuilding the index)
+    BM25_STOPWORDS: bool = True
+    BM25_STEMMER: str = ""  # "" (off) | porter
+    BM25_SHARDS: int = 1  # >1 fans queries out across shards on a thread pool
+    BM25_PRUNING: bool = True  # MaxScore: skip documents that cannot make the top-k
     
     class Config:
         env_file = ".env"
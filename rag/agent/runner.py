@@ -1,4 +1,4 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 import re
 from rag.generation.llm import LLMService
 from rag.agent.tools import SearchTool, CryptoPriceTool
@@ -25,9 +25,9 @@ Begin!
 """
 
 class AgentRunner:
-    def __init__(self):
+    def __init__(self, search_tool: Optional[SearchTool] = None):
         self.llm = LLMService()
-        self.search_tool = SearchTool()
+        self.search_tool = search_tool or SearchTool()
         self.crypto_tool = CryptoPriceTool()
         self.max_steps = 5
 
@@ -1,4 +1,4 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import requests
 try:
     from langfuse.decorators import observe
@@ -8,9 +8,13 @@ from rag.retrieval.service import RetrievalService
 from rag.rerank.service import RerankerService
 
 class SearchTool:
-    def __init__(self):
-        self.retriever = RetrievalService()
-        self.reranker = RerankerService()
+    def __init__(
+        self,
+        retriever: Optional[RetrievalService] = None,
+        reranker: Optional[RerankerService] = None
+    ):
+        self.retriever = retriever or RetrievalService()
+        self.reranker = reranker or RerankerService()
 
     @observe(as_type="generation")
     def search(self, query: str, top_k: int = 3) -> str:
@@ -0,0 +1,2 @@
+# Cache Package
+# In-process LRU/TTL caches and the index generation counter that invalidates them
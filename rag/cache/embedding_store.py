@@ -0,0 +1,97 @@
+"""
+Embedding Store: persistent chunk embeddings keyed by content hash.
+
+Vectors live in a SQLite table keyed by (namespace, sha256 of the text). The
+namespace is the embedding model, so switching models never returns vectors
+from another embedding space. Re-ingesting unchanged text then skips the
+encoder entirely.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Union
+import numpy as np
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, path: str, namespace: str):
+        self.path = path
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " namespace TEXT NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " PRIMARY KEY (namespace, hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        """Stored vectors for the given content hashes; unknown hashes are left out."""
+        return {key: vector.tolist() for key, vector in self.get_arrays(hashes).items()}
+
+    def get_arrays(self, hashes: Iterable[str], count: bool = True) -> Dict[str, np.ndarray]:
+        """
+        get_many() as read-only float32 arrays over the stored blobs (no per-float boxing).
+        count=False leaves the hit/miss counters alone, for lookups that never encode a miss.
+        """
+        hashes = list(dict.fromkeys(hashes))
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE namespace = ? AND hash IN ({','.join('?' * len(batch))})",
+                    [self.namespace, *batch]
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            if count:
+                self.hits += len(found)
+                self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, vectors: Dict[str, Union[List[float], np.ndarray]]):
+        if not vectors:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (namespace, hash, vector) VALUES (?, ?, ?)",
+                [(self.namespace, key, np.asarray(v, dtype=np.float32).tobytes()) for key, v in vectors.items()]
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "namespace": self.namespace,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,31 @@
+"""
+Index Generation: a counter bumped whenever the indexes change.
+
+Caches put the current generation in their keys, so entries computed against
+an older index simply stop matching and age out of the LRU.
+
+The counter lives in memory and only covers one process. Changes made by
+another API worker or by a CLI script are not seen here. There, cached results
+stay valid until RETRIEVAL_CACHE_TTL expires, so keep the TTL short (or the
+cache off) when more than one process writes to the indexes.
+"""
+import threading
+
+
+class IndexGeneration:
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+    def bump(self) -> int:
+        with self._lock:
+            self._value += 1
+            return self._value
+
+
+# Shared by services built in the same process unless one is injected
+index_generation = IndexGeneration()
@@ -0,0 +1,132 @@
+"""
+Rerank Score Cache: cross-encoder scores keyed by (query, chunk).
+
+The same question is often reranked against the same candidates: repeated
+questions, agent re-searches and SearchTool calls. Scores are kept per
+(query key, chunk id), so a rerank only sends the pairs it has not scored yet
+to the model. The query key (query_key) covers the model and its backend, and
+the query's token ids rather than its text: two spellings share scores only
+when the model sees the same input, e.g. different case for a lowercasing
+tokenizer.
+
+Entries are dropped per chunk: when a chunk is re-indexed (same id) or the
+document it came from is re-ingested (the new chunks get new ids, so the
+cache also remembers each chunk's source).
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+from rag.cache.embedding_store import content_hash
+
+
+def query_key(model: str, query: Union[str, Sequence[int]]) -> str:
+    """
+    Cache key of a query scored by model (name and backend): a hash of its token
+    ids, or of its exact text when the model's tokenizer is not available.
+    """
+    if isinstance(query, str):
+        return content_hash(f"{model}\ntext:{query}")
+    return content_hash(f"{model}\nids:{' '.join(map(str, query))}")
+
+
+class RerankScoreCache:
+    def __init__(self, max_size: int = 100000):
+        self.max_size = max_size
+        self._scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._queries_by_chunk: Dict[str, Set[str]] = {}
+        self._chunks_by_source: Dict[str, Set[str]] = {}
+        self._source_by_chunk: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def get_many(self, key: str, chunk_ids: Iterable[str]) -> Dict[str, float]:
+        """Cached scores of the query (see query_key) against the given chunks; unscored chunks are left out."""
+        found: Dict[str, float] = {}
+        with self._lock:
+            for chunk_id in chunk_ids:
+                score = self._scores.get((key, chunk_id))
+                if score is None:
+                    self.misses += 1
+                    continue
+                self._scores.move_to_end((key, chunk_id))
+                found[chunk_id] = score
+                self.hits += 1
+        return found
+
+    def put_many(self, key: str, scores: Dict[str, float], sources: Optional[Dict[str, str]] = None):
+        """Store the query's scores by chunk id; sources maps chunk ids to their document source."""
+        if self.max_size <= 0:
+            return
+        sources = sources or {}
+        with self._lock:
+            for chunk_id, score in scores.items():
+                self._scores[(key, chunk_id)] = float(score)
+                self._scores.move_to_end((key, chunk_id))
+                self._queries_by_chunk.setdefault(chunk_id, set()).add(key)
+                if chunk_id in sources and chunk_id not in self._source_by_chunk:
+                    self._source_by_chunk[chunk_id] = sources[chunk_id]
+                    self._chunks_by_source.setdefault(sources[chunk_id], set()).add(chunk_id)
+            while len(self._scores) > self.max_size:
+                (evicted_query, evicted_chunk), _ = self._scores.popitem(last=False)
+                self._forget(evicted_query, evicted_chunk)
+                self.evictions += 1
+
+    def _forget(self, key: str, chunk_id: str):
+        queries = self._queries_by_chunk.get(chunk_id)
+        if queries is not None:
+            queries.discard(key)
+            if not queries:
+                del self._queries_by_chunk[chunk_id]
+                self._forget_source(chunk_id)
+
+    def _forget_source(self, chunk_id: str):
+        source = self._source_by_chunk.pop(chunk_id, None)
+        if source is not None:
+            chunks = self._chunks_by_source[source]
+            chunks.discard(chunk_id)
+            if not chunks:
+                del self._chunks_by_source[source]
+
+    def invalidate_chunks(self, chunk_ids: Iterable[str]) -> int:
+        """Drop every cached score of these chunks; returns the number of entries removed."""
+        removed = 0
+        with self._lock:
+            for chunk_id in chunk_ids:
+                for key in self._queries_by_chunk.pop(chunk_id, ()):
+                    if self._scores.pop((key, chunk_id), None) is not None:
+                        removed += 1
+                self._forget_source(chunk_id)
+            self.invalidations += removed
+        return removed
+
+    def invalidate_sources(self, sources: Iterable[str]) -> int:
+        """invalidate_chunks() for every chunk scored from these documents."""
+        with self._lock:
+            chunk_ids: List[str] = [c for source in sources for c in self._chunks_by_source.get(source, ())]
+        return self.invalidate_chunks(chunk_ids)
+
+    def clear(self):
+        with self._lock:
+            self._scores.clear()
+            self._queries_by_chunk.clear()
+            self._chunks_by_source.clear()
+            self._source_by_chunk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._scores),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
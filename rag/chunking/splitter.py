@@ -28,7 +28,7 @@ class FixedSizeSplitter(BaseSplitter):
                 doc_id=document.id,
                 content=chunk_content,
                 chunk_index=chunk_index,
-                metadata=document.metadata
+                metadata={**document.metadata, "source": document.source}
             ))
             
             chunk_index += 1
@@ -51,7 +51,7 @@ class RecursiveSplitter(BaseSplitter):
                 doc_id=document.id,
                 content=text,
                 chunk_index=i,
-                metadata=document.metadata
+                metadata={**document.metadata, "source": document.source}
             )
             for i, text in enumerate(texts)
         ]
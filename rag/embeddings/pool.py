@@ -0,0 +1,110 @@
+"""
+Encoder Pool: chunk embedding for bulk ingestion.
+
+Chunks are sorted by token length (longest first) and cut into batches whose
+padded size, batch size x longest text, stays within a token budget. Batches
+of short chunks therefore grow large, long ones stay small, and little compute
+goes to padding; the budget also bounds the activation memory of one batch.
+
+With workers > 0 the batches are spread over CPU worker processes, each with
+its own copy of the model (loaded once, on the configured inference backend)
+and an equal share of the cores. With workers = 0 they run in-process.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Callable, List, Optional, Sequence
+import numpy as np
+
+# Per worker process
+_worker_model = None
+
+
+def _init_worker(model_name: str, backend: str, threads: int):
+    global _worker_model
+    # Before torch / onnxruntime are imported, so their thread pools pick it up
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from rag.inference.backends import load_model
+    torch.set_num_threads(threads)
+    _worker_model = load_model(SentenceTransformer, model_name, backend)
+
+
+def _encode_batch(texts: List[str]) -> np.ndarray:
+    embeddings = _worker_model.encode(texts, batch_size=len(texts), normalize_embeddings=True)
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+
+def plan_batches(lengths: Sequence[int], token_budget: int, max_batch_size: int) -> List[List[int]]:
+    """
+    Indices of the texts, longest first, grouped so that len(batch) times the
+    batch's longest text fits token_budget (a longer text gets a batch alone).
+    """
+    order = np.argsort(-np.asarray(lengths, dtype=np.int64), kind="stable")
+    batches: List[List[int]] = []
+    current: List[int] = []
+    longest = 0
+    for i in order:
+        if current and ((len(current) + 1) * longest > token_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current = []
+        if not current:
+            longest = max(1, int(lengths[i]))
+        current.append(int(i))
+    if current:
+        batches.append(current)
+    return batches
+
+
+class EncoderPool:
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        model_name: str,
+        backend: str,
+        workers: int = 0,
+        token_budget: int = 16384,
+        max_batch_size: int = 256
+    ):
+        # encode_fn runs a batch in-process; workers load model_name themselves
+        self.encode_fn = encode_fn
+        self.model_name = model_name
+        self.backend = backend
+        self.workers = max(0, workers)
+        self.token_budget = token_budget
+        self.max_batch_size = max(1, max_batch_size)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            # spawn: forking a process that already holds torch threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, self.backend, threads)
+            )
+        return self._executor
+
+    def encode(self, texts: List[str], lengths: Sequence[int]) -> np.ndarray:
+        """Embeddings of texts, in input order, as one float32 (n, d) matrix."""
+        batches = plan_batches(lengths, self.token_budget, self.max_batch_size)
+        inputs = [[texts[i] for i in batch] for batch in batches]
+        if self.workers:
+            results = self._pool().map(_encode_batch, inputs)
+        else:
+            results = map(self.encode_fn, inputs)
+
+        out: Optional[np.ndarray] = None
+        for batch, vectors in zip(batches, results):
+            if out is None:
+                out = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            out[batch] = vectors
+        return out
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
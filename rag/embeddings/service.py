@@ -1,14 +1,140 @@
-from typing import List
+from typing import List, Optional, Dict, Any, Tuple
+import numpy as np
 from sentence_transformers import SentenceTransformer
+from rag.cache.lru import LRUCache
+from rag.cache.embedding_store import EmbeddingStore, content_hash
+from rag.inference.backends import load_model, resolve_backend
+from rag.inference.batching import MicroBatcher
+from rag.embeddings.pool import EncoderPool
+from apps.api.settings import settings
 
 class EmbeddingService:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+    """
+    Sentence-transformer embeddings with two cache tiers:
+        - queries: in-process LRU (QUERY_EMBEDDING_CACHE_SIZE)
+        - chunk texts: on-disk store keyed by content hash and model (EMBEDDING_CACHE_PATH)
+
+    The model runs on the INFERENCE_BACKEND (torch, onnx or onnx-int8). Query
+    cache misses from concurrent requests are encoded together by a MicroBatcher;
+    chunk texts go through an EncoderPool (length-bucketed, optionally multi-process).
+    """
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", cache_path: Optional[str] = None, backend: Optional[str] = None):
+        self.model_name = model_name
+        self.backend = resolve_backend(backend)
+        self.model = load_model(SentenceTransformer, model_name, self.backend)
+        self.query_cache = LRUCache(max_size=settings.QUERY_EMBEDDING_CACHE_SIZE)
+        cache_path = settings.EMBEDDING_CACHE_PATH if cache_path is None else cache_path
+        # ONNX float32 reproduces PyTorch; int8 vectors differ (per instruction set), so they are stored apart
+        namespace = f"{model_name}@int8-{settings.ONNX_QUANTIZATION}" if self.backend == "onnx-int8" else model_name
+        self.store = EmbeddingStore(cache_path, namespace=namespace) if cache_path else None
+        self.query_batcher = MicroBatcher(
+            lambda texts: self._encode(texts, batch_size=len(texts)).tolist(),
+            max_batch_size=settings.EMBED_BATCH_MAX_SIZE,
+            max_wait_ms=settings.EMBED_BATCH_WAIT_MS,
+            name="embed-batcher"
+        ) if settings.EMBED_BATCH_WAIT_MS > 0 else None
+        self.encoder_pool = EncoderPool(
+            lambda texts: self._encode(texts, batch_size=len(texts)),
+            model_name=model_name,
+            backend=self.backend,
+            workers=settings.INGEST_ENCODER_WORKERS,
+            token_budget=settings.INGEST_TOKEN_BUDGET,
+            max_batch_size=settings.INGEST_MAX_ENCODE_BATCH
+        )
+
+    def _encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        # normalize_embeddings=True is usually good for cosine similarity
+        embeddings = self.model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    def _encode_queries(self, queries: List[str]) -> List[List[float]]:
+        if self.query_batcher is None:
+            return self._encode(queries).tolist()
+        return self.query_batcher.submit(queries)
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        """Tokens per text as the model sees them (after truncation to max_seq_length)."""
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is None:
+            return [len(text.split()) for text in texts]
+        input_ids = tokenizer(texts, truncation=True, max_length=self.model.max_seq_length)["input_ids"]
+        return [len(ids) for ids in input_ids]
+
+    def _encode_chunks(self, texts: List[str]) -> np.ndarray:
+        return self.encoder_pool.encode(texts, self.token_lengths(texts))
     
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed chunk texts into one contiguous float32 (n, d) matrix, only
+        encoding the ones not already in the store. Ingestion passes the matrix
+        straight to the vector store, so no per-float Python objects are made.
+        """
+        if not texts:
+            return self._encode(texts)
+        if self.store is None:
+            return self._encode_chunks(texts)
+
+        hashes = [content_hash(text) for text in texts]
+        vectors = self.store.get_arrays(hashes)
+        missing = list(dict.fromkeys(h for h in hashes if h not in vectors))
+        if missing:
+            text_by_hash = dict(zip(hashes, texts))
+            encoded = dict(zip(missing, self._encode_chunks([text_by_hash[h] for h in missing])))
+            self.store.put_many(encoded)
+            vectors.update(encoded)
+        return np.stack([vectors[h] for h in hashes])
+
+    def stored_array(self, texts: List[str]) -> Tuple[np.ndarray, List[int]]:
+        """
+        Vectors already in the store, without encoding anything: a float32
+        (m, d) matrix and the positions in texts it covers. Not counted in the
+        store's hit rate, which measures how much encoding the store saves.
+        """
+        if self.store is None or not texts:
+            return np.empty((0, 0), dtype=np.float32), []
+        hashes = [content_hash(text) for text in texts]
+        vectors = self.store.get_arrays(hashes, count=False)
+        found = [i for i, h in enumerate(hashes) if h in vectors]
+        if not found:
+            return np.empty((0, 0), dtype=np.float32), []
+        return np.stack([vectors[hashes[i]] for i in found]), found
+
     def embed(self, texts: List[str]) -> List[List[float]]:
-        # normalize_embeddings=True is usually good for cosine similarity
-        embeddings = self.model.encode(texts, normalize_embeddings=True)
-        return embeddings.tolist()
+        """embed_array() as lists of floats."""
+        return self.embed_array(texts).tolist()
 
     def embed_query(self, query: str) -> List[float]:
-        return self.embed([query])[0]
+        vector = self.query_cache.get(query)
+        if vector is None:
+            vector = self._encode_queries([query])[0]
+            self.query_cache.put(query, vector)
+        return list(vector)
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """embed_query() for a batch; cache misses are encoded in a single call."""
+        vectors = [self.query_cache.get(query) for query in queries]
+        missing = list(dict.fromkeys(q for q, v in zip(queries, vectors) if v is None))
+        if missing:
+            encoded = dict(zip(missing, self._encode_queries(missing)))
+            for query, vector in encoded.items():
+                self.query_cache.put(query, vector)
+            vectors = [v if v is not None else encoded[q] for q, v in zip(queries, vectors)]
+        return [list(vector) for vector in vectors]
+
+    def batch_stats(self) -> Optional[Dict[str, Any]]:
+        return self.query_batcher.stats() if self.query_batcher is not None else None
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return {
+            "queries": self.query_cache.stats(),
+            "chunks": self.store.stats() if self.store is not None else None,
+        }
+
+    def close(self):
+        """Stop the encoder processes and the query batcher, and close the chunk store."""
+        self.encoder_pool.close()
+        if self.query_batcher is not None:
+            self.query_batcher.close()
+        if self.store is not None:
+            self.store.close()
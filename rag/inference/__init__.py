@@ -0,0 +1,2 @@
+# Inference Package
+# Execution backends (PyTorch, ONNX Runtime, int8 ONNX) for the embedding model and cross-encoder
@@ -0,0 +1,79 @@
+"""
+Inference Backends: how the embedding model and the cross-encoder are executed.
+
+    torch       PyTorch, float32 (the sentence-transformers default)
+    onnx        ONNX export, run by onnxruntime
+    onnx-int8   ONNX export with dynamic int8 quantization: int8 weights,
+                activations quantized on the fly. Fastest on CPU-only nodes.
+
+ONNX models are exported once into ONNX_EXPORT_DIR/<model>/ and reused by
+every later process; the int8 variant is derived from that export for the
+instruction set in ONNX_QUANTIZATION. Both need the optional dependencies
+(pip install "sentence-transformers[onnx]").
+
+scripts/check_inference_parity.py compares the backends' outputs with PyTorch
+and scripts/benchmark_inference.py measures their throughput.
+"""
+import os
+from typing import Optional, Type, TypeVar
+from apps.api.settings import settings
+
+INFERENCE_BACKENDS = ("torch", "onnx", "onnx-int8")
+QUANTIZATION_TARGETS = ("arm64", "avx2", "avx512", "avx512_vnni")
+
+Model = TypeVar("Model")
+
+
+def resolve_backend(backend: Optional[str] = None) -> str:
+    backend = backend or settings.INFERENCE_BACKEND
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}. Available: {', '.join(INFERENCE_BACKENDS)}")
+    return backend
+
+
+def export_dir(model_name: str) -> str:
+    return os.path.join(settings.ONNX_EXPORT_DIR, model_name.replace("/", "__"))
+
+
+def quantized_file_suffix(target: Optional[str] = None) -> str:
+    """
+    Suffix passed to export_dynamic_quantized_onnx_model. Its default depends on the
+    target's weight type (avx2 writes model_quint8_avx2.onnx), so it is set explicitly.
+    """
+    target = target or settings.ONNX_QUANTIZATION
+    if target not in QUANTIZATION_TARGETS:
+        raise ValueError(f"Unknown quantization target: {target}. Available: {', '.join(QUANTIZATION_TARGETS)}")
+    return f"qint8_{target}"
+
+
+def quantized_file_name(target: Optional[str] = None) -> str:
+    """Where the int8 model is written, relative to export_dir."""
+    return os.path.join("onnx", f"model_{quantized_file_suffix(target)}.onnx")
+
+
+def load_model(model_cls: Type[Model], model_name: str, backend: Optional[str] = None) -> Model:
+    """
+    Load a SentenceTransformer or CrossEncoder on the given backend
+    (default: INFERENCE_BACKEND), exporting and quantizing on first use.
+    """
+    backend = resolve_backend(backend)
+    if backend == "torch":
+        return model_cls(model_name)
+
+    path = export_dir(model_name)
+    if not os.path.exists(os.path.join(path, "onnx", "model.onnx")):
+        # Converts the PyTorch checkpoint (or fetches the hub's ONNX file) and keeps a local copy
+        print(f"Exporting {model_name} to ONNX in {path}...")
+        model_cls(model_name, backend="onnx").save_pretrained(path)
+    if backend == "onnx":
+        return model_cls(path, backend="onnx")
+
+    file_name = quantized_file_name()
+    if not os.path.exists(os.path.join(path, file_name)):
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        print(f"Quantizing {model_name} to int8 ({settings.ONNX_QUANTIZATION})...")
+        export_dynamic_quantized_onnx_model(
+            model_cls(path, backend="onnx"), settings.ONNX_QUANTIZATION, path,
+            file_suffix=quantized_file_suffix()
+        )
+    return model_cls(path, backend="onnx", model_kwargs={"file_name": file_name})
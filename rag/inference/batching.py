@@ -0,0 +1,156 @@
+"""
+Micro-batching: coalesce concurrent inference calls into one model call.
+
+Under concurrency every request would otherwise run its own encode([query])
+or predict(pairs), paying the per-call overhead each time. A MicroBatcher
+queues the calls and a single worker thread runs them together:
+
+    - the first queued call opens a batch,
+    - calls that arrive within max_wait_ms of it join the batch, whole,
+      until max_batch_size items are collected,
+    - the batch function runs once and every caller gets its slice back.
+
+A call larger than max_batch_size is queued as max_batch_size slices, so no
+batch ever exceeds the cap.
+
+When the worker is busy, calls queue up meanwhile and the next batch starts
+straight away with whatever is waiting, so batches grow with load and an idle
+service only pays the wait window. Callers block (they run on thread pools);
+an exception in the batch function is raised in every caller of that batch.
+"""
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Generic, List, Optional, Sequence, TypeVar
+import numpy as np
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Latency samples kept for the percentiles in stats()
+STATS_WINDOW = 1024
+
+
+@dataclass
+class _Call:
+    items: Sequence[Any]
+    enqueued: float = field(default_factory=time.perf_counter)
+    future: Future = field(default_factory=Future)
+
+
+class MicroBatcher(Generic[T, R]):
+    def __init__(
+        self,
+        fn: Callable[[List[T]], Sequence[R]],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 2.0,
+        name: str = "micro-batcher"
+    ):
+        self.fn = fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue: "queue.Queue[Optional[_Call]]" = queue.Queue()
+
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._calls = 0
+        self._items = 0
+        self._queue_wait = deque(maxlen=STATS_WINDOW)  # seconds, per call
+        self._compute = deque(maxlen=STATS_WINDOW)  # seconds, per batch
+
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, items: Sequence[T]) -> List[R]:
+        """Results of fn for items, computed in a batch with other pending calls."""
+        if not items:
+            return []
+        calls = [
+            _Call(items[start:start + self.max_batch_size])
+            for start in range(0, len(items), self.max_batch_size)
+        ]
+        for call in calls:
+            self._queue.put(call)
+        return [result for call in calls for result in call.future.result()]
+
+    def close(self):
+        """Stop the worker after the calls already queued."""
+        self._queue.put(None)
+        self._worker.join()
+
+    def _run(self):
+        carry: Optional[_Call] = None
+        while True:
+            first = carry if carry is not None else self._queue.get()
+            carry = None
+            if first is None:
+                return
+            batch, size, stop = [first], len(first.items), False
+            deadline = first.enqueued + self.max_wait
+            while size < self.max_batch_size:
+                try:
+                    remaining = deadline - time.perf_counter()
+                    call = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if call is None:
+                    stop = True
+                    break
+                if size + len(call.items) > self.max_batch_size:
+                    # Calls fit in a batch (see submit); this one opens the next
+                    carry = call
+                    break
+                batch.append(call)
+                size += len(call.items)
+            self._execute(batch)
+            if stop:
+                return
+
+    def _execute(self, batch: List[_Call]):
+        start = time.perf_counter()
+        try:
+            results = self.fn([item for call in batch for item in call.items])
+        except Exception as e:
+            for call in batch:
+                call.future.set_exception(e)
+            results = None
+        compute = time.perf_counter() - start
+
+        if results is not None:
+            offset = 0
+            for call in batch:
+                call.future.set_result(list(results[offset:offset + len(call.items)]))
+                offset += len(call.items)
+
+        with self._stats_lock:
+            self._batches += 1
+            self._calls += len(batch)
+            self._items += sum(len(call.items) for call in batch)
+            self._queue_wait.extend(start - call.enqueued for call in batch)
+            self._compute.append(compute)
+
+    @staticmethod
+    def _percentiles_ms(samples) -> Dict[str, float]:
+        if not samples:
+            return {"p50": 0.0, "p99": 0.0}
+        p50, p99 = np.percentile(np.fromiter(samples, dtype=np.float64) * 1000, [50, 99])
+        return {"p50": round(float(p50), 3), "p99": round(float(p99), 3)}
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch counts and queue-wait vs compute latency (ms, over the last STATS_WINDOW samples)."""
+        with self._stats_lock:
+            return {
+                "batches": self._batches,
+                "calls": self._calls,
+                "items": self._items,
+                "mean_batch_items": self._items / self._batches if self._batches else 0.0,
+                "mean_batch_calls": self._calls / self._batches if self._batches else 0.0,
+                "queue_wait_ms": self._percentiles_ms(self._queue_wait),
+                "compute_ms": self._percentiles_ms(self._compute),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+            }
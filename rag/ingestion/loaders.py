@@ -4,6 +4,9 @@ from pathlib import Path
 from rag.ingestion.models import Document
 import pypdf
 
+class UnsupportedFileTypeError(ValueError):
+    """No loader handles the file's extension."""
+
 class BaseLoader:
     def load(self, file_path: str) -> List[Document]:
         raise NotImplementedError
@@ -56,4 +59,4 @@ class LoaderFactory:
         elif ext == ".pdf":
             return PDFLoader()
         else:
-            raise ValueError(f"Unsupported file type: {ext}")
+            raise UnsupportedFileTypeError(f"Unsupported file type: {ext}")
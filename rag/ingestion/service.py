@@ -1,19 +1,38 @@
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 import os
+import time
 from rag.ingestion.loaders import LoaderFactory
 from rag.chunking.splitter import RecursiveSplitter
 from rag.embeddings.service import EmbeddingService
 from rag.vector_store.qdrant import QdrantService
 from rag.sparse.index import BM25Index
 from rag.ingestion.models import Chunk
+from rag.cache.generation import IndexGeneration, index_generation
+from rag.cache.rerank_scores import RerankScoreCache
 from apps.api.settings import settings
 
 class IngestionService:
-    def __init__(self):
-        self.embedding_service = EmbeddingService()
-        self.qdrant_service = QdrantService(url=settings.QDRANT_URL)
+    def __init__(
+        self,
+        embedding_service: Optional[EmbeddingService] = None,
+        qdrant_service: Optional[QdrantService] = None,
+        bm25_index: Optional[BM25Index] = None,
+        generation: Optional[IndexGeneration] = None,
+        score_cache: Optional[RerankScoreCache] = None
+    ):
+        self.embedding_service = embedding_service or EmbeddingService()
+        self.qdrant_service = qdrant_service or QdrantService(url=settings.QDRANT_URL)
         self.splitter = RecursiveSplitter()
-        self.bm25_index = BM25Index()
+        # With native sparse vectors (SPARSE_BACKEND=qdrant) upsert_chunks indexes the sparse leg
+        if bm25_index is None and getattr(self.qdrant_service, "sparse_encoder", None) is None:
+            bm25_index = BM25Index()
+        self.bm25_index = bm25_index
+        self.generation = generation if generation is not None else index_generation
+        # The reranker's score cache (see apps/api/container.py); None when there is none to invalidate
+        self.score_cache = score_cache
+        # One upload in flight while the next batch is embedded
+        self._upload_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-upload")
 
     def ingest_file(self, file_path: str) -> int:
         """
@@ -34,29 +53,37 @@ class IngestionService:
         if not all_chunks:
             return 0
             
-        # 3. Embed
-        texts = [chunk.content for chunk in all_chunks]
-        vectors = self.embedding_service.embed(texts)
-        
-        for i, chunk in enumerate(all_chunks):
-            chunk.vector = vectors[i]
-            
-        # 4. Index Dense
-        self.qdrant_service.upsert_chunks(all_chunks)
+        # 3+4. Embed and index dense, pipelined: batch n is upserted while batch n+1 is embedded
+        upload = None
+        for start in range(0, len(all_chunks), settings.INGEST_BATCH_SIZE):
+            batch = all_chunks[start:start + settings.INGEST_BATCH_SIZE]
+            # One float32 (n, d) matrix per batch; Chunk.vector is left unset
+            vectors = self.embedding_service.embed_array([chunk.content for chunk in batch])
+            if upload is not None:
+                upload.result()
+            upload = self._upload_executor.submit(self.qdrant_service.upsert_chunks, batch, vectors)
+        upload.result()
+
+        # 5. Index Sparse (new segment; existing segments are untouched)
+        if self.bm25_index is not None:
+            self.bm25_index.add(all_chunks)
 
-        # 5. Index Sparse (Append and Rebuild)
-        # In a real app, this might be async or batch
-        current_chunks = self.bm25_index.chunks
-        current_chunks.extend(all_chunks)
-        self.bm25_index.build(current_chunks)
+        # 6. Invalidate cached retrieval results, and rerank scores of the re-indexed chunks
+        #    and of earlier chunks from the same documents
+        self.generation.bump()
+        if self.score_cache is not None:
+            self.score_cache.invalidate_chunks(chunk.id for chunk in all_chunks)
+            self.score_cache.invalidate_sources({chunk.metadata.get("source") for chunk in all_chunks} - {None})
         
         return len(all_chunks)
 
     def ingest_directory(self, directory_path: str) -> int:
         """
-        Ingests all supported files in a directory.
+        Ingests all supported files in a directory and reports the throughput.
         """
         total_chunks = 0
+        files_ingested = 0
+        start = time.perf_counter()
         for root, _, files in os.walk(directory_path):
             for file in files:
                 if file.lower().endswith(('.txt', '.md', '.pdf')):
@@ -65,6 +92,10 @@ class IngestionService:
                         print(f"Ingesting {file_path}...")
                         count = self.ingest_file(file_path)
                         total_chunks += count
+                        files_ingested += 1
                     except Exception as e:
                         print(f"Failed to ingest {file_path}: {e}")
+        elapsed = time.perf_counter() - start
+        rate = total_chunks / elapsed if elapsed > 0 else 0.0
+        print(f"Ingested {total_chunks} chunks from {files_ingested} files in {elapsed:.1f}s ({rate:.1f} chunks/s)")
         return total_chunks
@@ -1,17 +1,158 @@
-from typing import List, Optional
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import torch
 from langfuse import Langfuse
 from sentence_transformers import CrossEncoder
 from rag.retrieval.models import ScoredChunk
+from rag.inference.backends import load_model, resolve_backend
+from rag.inference.batching import MicroBatcher
+from rag.rerank.tokens import PairTokenizer, TokenIds
+from rag.cache.rerank_scores import RerankScoreCache, query_key
+from rag.embeddings.service import EmbeddingService
+from apps.api.settings import settings
 
 # Initialize Langfuse for manual tracing
 langfuse = Langfuse()
 
+
+@dataclass
+class RerankTrace:
+    """Counters filled in by RerankerService.rerank(), for benchmarks and debugging."""
+    candidates: int = 0
+    cross_encoded: int = 0  # candidates left for the cross-encoder after the cascade
+    unjudged: int = 0  # candidates the cascade kept because they had no stored vector
+
 class RerankerService:
-    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"):
-        # This initializes the model. It might download on first run.
-        self.model = CrossEncoder(model_name)
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        backend: Optional[str] = None,
+        score_cache: Optional[RerankScoreCache] = None,
+        embedding_service: Optional[EmbeddingService] = None
+    ):
+        # This initializes the model. It might download (and export to ONNX) on first run.
+        # backend: torch | onnx | onnx-int8, default settings.INFERENCE_BACKEND
+        backend = resolve_backend(backend)
+        self.model = load_model(CrossEncoder, model_name, backend)
+        # (query, chunk) scores, per model and backend (int8 scores differ per instruction set).
+        # Ingestion only drops the entries of re-indexed chunks from an injected, shared cache.
+        self.score_cache = score_cache if score_cache is not None else RerankScoreCache(
+            max_size=settings.RERANK_SCORE_CACHE_SIZE
+        )
+        self.cache_model = f"{model_name}@{backend}"
+        if backend == "onnx-int8":
+            self.cache_model += f"-{settings.ONNX_QUANTIZATION}"
+        # Cascade first stage (RERANK_CASCADE): bi-encoder cosine from stored chunk vectors
+        self.embedding_service = embedding_service
+        self.cascade = settings.RERANK_CASCADE and embedding_service is not None
+        self.cascade_max_gap = settings.RERANK_CASCADE_MAX_GAP
+        self.cascade_min_score = settings.RERANK_CASCADE_MIN_SCORE
+        self.cascade_max_survivors = settings.RERANK_CASCADE_MAX_SURVIVORS
+        self.model.eval()
+        # Chunk token ids are cached, so a rerank only tokenizes the query
+        tokenizer = getattr(self.model, "tokenizer", None)
+        self.pair_tokenizer = PairTokenizer(
+            tokenizer, self.model.max_seq_length, cache_size=settings.RERANK_TOKEN_CACHE_SIZE
+        ) if tokenizer is not None else None
+        # Pairs from concurrent rerank() calls are scored in one model call
+        self.batcher = MicroBatcher(
+            self._score,
+            max_batch_size=settings.RERANK_BATCH_MAX_SIZE,
+            max_wait_ms=settings.RERANK_BATCH_WAIT_MS,
+            name="rerank-batcher"
+        ) if settings.RERANK_BATCH_WAIT_MS > 0 else None
+
+    def _score(self, pairs: Sequence[Tuple[TokenIds, TokenIds]]) -> np.ndarray:
+        """
+        Cross-encoder scores for (query ids, chunk ids) pairs, as predict() computes them.
+        Calls the model's module pipeline directly (sentence-transformers 6.x CrossEncoder).
+        """
+        features = {
+            key: value.to(self.model.device) for key, value in self.pair_tokenizer.features(pairs).items()
+        }
+        with torch.inference_mode():
+            scores = self.model(features)["scores"].float()
+            if self.model.activation_fn is not None:
+                scores = self.model.activation_fn(scores)
+        if self.model.num_labels == 1 and scores.ndim > 1:
+            scores = scores.squeeze(-1)
+        return scores.cpu().numpy()
+
+    def _cascade(self, query: str, chunks: List[ScoredChunk], top_k: int) -> Tuple[List[ScoredChunk], int]:
+        """
+        Candidates worth a cross-encoder pass, in their original order, and how
+        many of them could not be judged. By cosine to the query, the top_k
+        always survive; the others only while within cascade_max_gap of the best,
+        at least cascade_min_score, and among the top cascade_max_survivors.
+        Chunks without a stored vector cannot be judged and always survive.
+        """
+        vectors, found = self.embedding_service.stored_array([c.content for c in chunks])
+        if not found:
+            return chunks, len(chunks)
+        query_vector = np.asarray(self.embedding_service.embed_query(query), dtype=np.float32)
+        # Both sides are normalised: the dot product is the cosine
+        cosine = vectors @ query_vector
+        best = float(cosine.max())
+        survivors = set(range(len(chunks))) - set(found)
+        for rank, j in enumerate(np.argsort(-cosine, kind="stable")):
+            score = float(cosine[j])
+            if rank < top_k or (
+                rank < self.cascade_max_survivors
+                and score >= best - self.cascade_max_gap
+                and score >= self.cascade_min_score
+            ):
+                survivors.add(found[j])
+        return [chunks[i] for i in sorted(survivors)], len(chunks) - len(found)
 
-    def rerank(self, query: str, chunks: List[ScoredChunk], top_k: int = 5, observation=None) -> List[ScoredChunk]:
+    def _scores(self, query: str, chunks: List[ScoredChunk]) -> List[float]:
+        """Scores per chunk: cached ones from the score cache, the rest from the model."""
+        # The model's view of the query: texts that tokenize alike share cached scores
+        query_ids = self.pair_tokenizer.query_ids(query) if self.pair_tokenizer is not None else None
+        key = query_key(self.cache_model, query_ids if query_ids is not None else query)
+        cached = self.score_cache.get_many(key, [c.chunk_id for c in chunks if c.chunk_id is not None])
+        uncached = [c for c in chunks if c.chunk_id not in cached]
+        fresh: List[float] = []
+        if uncached:
+            fresh = [float(score) for score in self._predict(query, uncached, query_ids)]
+            identified = [(c, score) for c, score in zip(uncached, fresh) if c.chunk_id is not None]
+            self.score_cache.put_many(
+                key,
+                {c.chunk_id: score for c, score in identified},
+                sources={c.chunk_id: c.metadata["source"] for c, _ in identified if c.metadata.get("source")}
+            )
+        fresh_scores = iter(fresh)
+        return [cached[c.chunk_id] if c.chunk_id in cached else next(fresh_scores) for c in chunks]
+
+    def _predict(self, query: str, chunks: List[ScoredChunk], query_ids: Optional[TokenIds] = None) -> List[float]:
+        if self.pair_tokenizer is None:
+            # Models without a tokenizer go through predict() on the raw texts
+            return self.model.predict([[query, chunk.content] for chunk in chunks])
+        if query_ids is None:
+            query_ids = self.pair_tokenizer.query_ids(query)
+        pairs = [(query_ids, ids) for ids in self.pair_tokenizer.chunk_ids([c.content for c in chunks])]
+        if self.batcher is None:
+            return self._score(pairs)
+        return self.batcher.submit(pairs)
+
+    def batch_stats(self) -> Optional[Dict[str, Any]]:
+        return self.batcher.stats() if self.batcher is not None else None
+
+    def token_cache_stats(self) -> Optional[Dict[str, Any]]:
+        return self.pair_tokenizer.stats() if self.pair_tokenizer is not None else None
+
+    def score_cache_stats(self) -> Dict[str, Any]:
+        return self.score_cache.stats()
+
+    def rerank(
+        self,
+        query: str,
+        chunks: List[ScoredChunk],
+        top_k: int = 5,
+        observation=None,
+        cascade: Optional[bool] = None,
+        trace: Optional[RerankTrace] = None
+    ) -> List[ScoredChunk]:
         """
         Rerank retrieved chunks using a cross-encoder model.
         
@@ -21,6 +162,10 @@ class RerankerService:
             top_k: Number of top chunks to return.
             observation: Optional Langfuse observation (trace/span) to nest under.
                         If provided, creates a child span. Otherwise, creates standalone trace.
+            cascade: Prune candidates by bi-encoder cosine first; default self.cascade
+                     (RERANK_CASCADE, needs an embedding_service).
+            trace: Optional counters of candidates received, cross-encoded and
+                   left unjudged by the cascade.
         """
         if not chunks:
             return []
@@ -39,11 +184,18 @@ class RerankerService:
             )
         
         try:
-            # Prepare pairs for cross-encoding
-            pairs = [[query, chunk.content] for chunk in chunks]
-            
-            # CrossEncoder returns scores
-            scores = self.model.predict(pairs)
+            # Cheap first stage: only the survivors go to the cross-encoder
+            cascade = self.cascade if cascade is None else cascade and self.embedding_service is not None
+            candidates, unjudged = len(chunks), 0
+            if cascade:
+                chunks, unjudged = self._cascade(query, chunks, top_k)
+            if trace is not None:
+                trace.candidates += candidates
+                trace.cross_encoded += len(chunks)
+                trace.unjudged += unjudged
+
+            # CrossEncoder scores for each (query, chunk) pair not scored before
+            scores = self._scores(query, chunks)
             
             # Update scores and sort
             for i, chunk in enumerate(chunks):
@@ -52,10 +204,15 @@ class RerankerService:
             sorted_chunks = sorted(chunks, key=lambda x: x.score, reverse=True)
             result = sorted_chunks[:top_k]
             
+            output = {
+                "num_results": len(result),
+                "top_score": result[0].score if result else 0,
+                "cross_encoded": len(chunks),
+            }
             if is_span:
-                span.end(output={"num_results": len(result), "top_score": result[0].score if result else 0})
+                span.end(output=output)
             else:
-                span.update(output={"num_results": len(result), "top_score": result[0].score if result else 0})
+                span.update(output=output)
             return result
         except Exception as e:
             if is_span:
@@ -0,0 +1,105 @@
+"""
+Pair Tokens: cross-encoder inputs built from cached chunk token ids.
+
+A cross-encoder scores "[CLS] query [SEP] chunk [SEP]", and CrossEncoder.predict
+tokenizes both texts on every call, although the same popular chunks come back
+request after request. A PairTokenizer keeps each chunk's token ids (keyed by
+content hash, truncated to what can ever fit) in an LRU, so a rerank only
+tokenizes the query and the chunks it has not seen yet.
+
+The pair layout (special tokens and segment ids) is read once from the
+tokenizer by encoding a probe pair, so it matches the model's own template.
+Truncation follows the tokenizer's "longest_first" strategy.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+import torch
+from rag.cache.lru import LRUCache
+from rag.cache.embedding_store import content_hash
+
+TokenIds = Tuple[int, ...]
+
+
+class PairTokenizer:
+    def __init__(self, tokenizer, max_length: int, cache_size: int = 10000):
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.cache = LRUCache(max_size=cache_size)
+        self._learn_template()
+        # Neither side can use more than what is left beside the special tokens and one token of the other
+        self.side_max = max(1, max_length - self.num_special - 1)
+
+    def _learn_template(self):
+        first = self.tokenizer("a", add_special_tokens=False)["input_ids"]
+        second = self.tokenizer("b", add_special_tokens=False)["input_ids"]
+        pair = self.tokenizer("a", "b")
+        ids = pair["input_ids"]
+        start = next(i for i in range(len(ids)) if ids[i:i + len(first)] == first)
+        end = start + len(first)
+        second_start = next(i for i in range(end, len(ids)) if ids[i:i + len(second)] == second)
+        second_end = second_start + len(second)
+
+        self.prefix = ids[:start]
+        self.middle = ids[end:second_start]
+        self.suffix = ids[second_end:]
+        self.num_special = len(self.prefix) + len(self.middle) + len(self.suffix)
+        types = pair.get("token_type_ids")
+        # Segment ids of the "prefix + query + middle" part and the "chunk + suffix" part
+        self.type_ids = (types[0], types[-1]) if types else None
+        self.pad_id = self.tokenizer.pad_token_id or 0
+
+    def query_ids(self, query: str) -> TokenIds:
+        return tuple(self.tokenizer(
+            query, add_special_tokens=False, truncation=True, max_length=self.side_max
+        )["input_ids"])
+
+    def chunk_ids(self, texts: Sequence[str]) -> List[TokenIds]:
+        """Token ids per chunk text; only texts not in the cache are tokenized, in one call."""
+        keys = [content_hash(text) for text in texts]
+        ids: List[Optional[TokenIds]] = [self.cache.get(key) for key in keys]
+        missing: Dict[str, str] = {}
+        for key, text, cached in zip(keys, texts, ids):
+            if cached is None:
+                missing.setdefault(key, text)
+        if missing:
+            encoded = self.tokenizer(
+                list(missing.values()), add_special_tokens=False, truncation=True, max_length=self.side_max
+            )["input_ids"]
+            fresh = {key: tuple(token_ids) for key, token_ids in zip(missing, encoded)}
+            for key, token_ids in fresh.items():
+                self.cache.put(key, token_ids)
+            ids = [cached if cached is not None else fresh[key] for key, cached in zip(keys, ids)]
+        return ids
+
+    def _truncate(self, query: TokenIds, chunk: TokenIds) -> Tuple[TokenIds, TokenIds]:
+        budget = self.max_length - self.num_special
+        query_len, chunk_len = len(query), len(chunk)
+        # longest_first: drop one token at a time from the longer sequence
+        for _ in range(query_len + chunk_len - budget):
+            if query_len > chunk_len:
+                query_len -= 1
+            else:
+                chunk_len -= 1
+        return query[:query_len], chunk[:chunk_len]
+
+    def features(self, pairs: Sequence[Tuple[TokenIds, TokenIds]]) -> Dict[str, torch.Tensor]:
+        """Padded model inputs for (query ids, chunk ids) pairs."""
+        rows, segments = [], []
+        for query, chunk in pairs:
+            query, chunk = self._truncate(query, chunk)
+            first = [*self.prefix, *query, *self.middle]
+            second = [*chunk, *self.suffix]
+            rows.append(first + second)
+            if self.type_ids is not None:
+                segments.append([self.type_ids[0]] * len(first) + [self.type_ids[1]] * len(second))
+
+        width = max(len(row) for row in rows)
+        features = {
+            "input_ids": torch.tensor([row + [self.pad_id] * (width - len(row)) for row in rows]),
+            "attention_mask": torch.tensor([[1] * len(row) + [0] * (width - len(row)) for row in rows]),
+        }
+        if self.type_ids is not None:
+            features["token_type_ids"] = torch.tensor([seg + [0] * (width - len(seg)) for seg in segments])
+        return features
+
+    def stats(self) -> Dict[str, object]:
+        return self.cache.stats()
@@ -0,0 +1,52 @@
+"""
+Metadata filters shared by both retrieval legs.
+
+Filters map a field to a value or a list of accepted values, e.g.
+    {"source": "docs/lisp.pdf", "type": ["pdf", "markdown"]}
+Fields are ANDed, values within a field are ORed. Only FILTER_FIELDS can be
+used: Qdrant has payload indexes on them and BM25 segments keep a bitmap per
+value (rag/sparse/inverted.py), so both legs apply the same filter.
+"""
+from typing import Any, Dict, List, Optional
+from qdrant_client.http import models
+from rag.ingestion.models import Chunk
+
+FILTER_FIELDS = ("doc_id", "type", "source")
+
+
+class InvalidFilterError(ValueError):
+    """A request filters on a field that cannot be filtered on."""
+
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, List[str]]]:
+    """Validate filters and turn every value into a sorted list of strings. Empty -> None."""
+    if not filters:
+        return None
+    normalized = {}
+    for field, value in filters.items():
+        if field not in FILTER_FIELDS:
+            raise InvalidFilterError(f"Cannot filter on '{field}'; supported fields: {', '.join(FILTER_FIELDS)}")
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        normalized[field] = sorted({str(v) for v in values})
+    return dict(sorted(normalized.items()))
+
+
+def to_qdrant_filter(filters: Optional[Dict[str, List[str]]]) -> Optional[models.Filter]:
+    if not filters:
+        return None
+    return models.Filter(must=[
+        models.FieldCondition(
+            key=field,
+            match=models.MatchValue(value=values[0]) if len(values) == 1 else models.MatchAny(any=values)
+        )
+        for field, values in filters.items()
+    ])
+
+
+def chunk_field_values(chunk: Chunk) -> Dict[str, str]:
+    """Filterable values of a chunk, as stored in its Qdrant payload."""
+    return {
+        "doc_id": chunk.doc_id,
+        "type": str(chunk.metadata.get("type", "")),
+        "source": str(chunk.metadata.get("source", "")),
+    }
@@ -0,0 +1,109 @@
+"""
+Fusion strategies for hybrid search.
+
+Each retrieval leg contributes a ranked list of (chunk id, score). Chunk ids are
+shared between the BM25 index (Chunk.id) and Qdrant (point id), so results are
+merged on ids rather than on chunk content. Scores are combined with NumPy and
+only the requested top-k is fully sorted.
+"""
+from abc import ABC, abstractmethod
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+
+# A leg's results: chunk ids in rank order and their raw scores
+LegResults = Tuple[Sequence[str], Sequence[float]]
+
+
+class FusionStrategy(ABC):
+    """
+    Base class: map each leg's raw scores onto a common scale, then add them up
+    with per-leg weights. Documents missing from a leg get no contribution from it.
+    """
+    name: str = "base"
+
+    @abstractmethod
+    def normalize(self, scores: np.ndarray) -> np.ndarray:
+        """Map one leg's raw scores onto the common scale."""
+
+    def fuse(self, legs: List[LegResults], weights: Sequence[float], top_k: int) -> List[Tuple[str, float]]:
+        """
+        Fuse ranked legs into a single top-k list of (chunk id, fused score).
+        """
+        position: Dict[str, int] = {}
+        leg_positions = []
+        for ids, _ in legs:
+            leg_positions.append(
+                np.fromiter((position.setdefault(i, len(position)) for i in ids), dtype=np.int64, count=len(ids))
+            )
+
+        if not position:
+            return []
+
+        fused = np.zeros(len(position), dtype=np.float64)
+        for (_, scores), positions, weight in zip(legs, leg_positions, weights):
+            if len(positions) == 0 or weight == 0.0:
+                continue
+            # Ids are unique within a leg, so plain fancy-index assignment is safe
+            fused[positions] += weight * self.normalize(np.asarray(scores, dtype=np.float64))
+
+        order = _top_k_indices(fused, top_k)
+        ids = list(position)
+        return [(ids[i], float(fused[i])) for i in order]
+
+
+class WeightedSumFusion(FusionStrategy):
+    """Per-query min-max normalisation followed by a weighted sum."""
+    name = "weighted"
+
+    def normalize(self, scores: np.ndarray) -> np.ndarray:
+        low, high = scores.min(), scores.max()
+        return (scores - low) / (high - low + 1e-6)
+
+
+class ZScoreFusion(FusionStrategy):
+    """Standardise each leg (zero mean, unit variance) before the weighted sum."""
+    name = "zscore"
+
+    def normalize(self, scores: np.ndarray) -> np.ndarray:
+        return (scores - scores.mean()) / (scores.std() + 1e-6)
+
+
+class ReciprocalRankFusion(FusionStrategy):
+    """Reciprocal Rank Fusion: score = sum(weight / (k + rank)). Ignores raw scores."""
+    name = "rrf"
+
+    def __init__(self, k: int = 60):
+        self.k = k
+
+    def normalize(self, scores: np.ndarray) -> np.ndarray:
+        ranks = np.empty(len(scores), dtype=np.float64)
+        ranks[np.argsort(-scores, kind="stable")] = np.arange(1, len(scores) + 1)
+        return 1.0 / (self.k + ranks)
+
+
+def _top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k scores, best first (ties ordered by first appearance)."""
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k < len(scores):
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+
+FUSION_STRATEGIES: Dict[str, FusionStrategy] = {
+    strategy.name: strategy
+    for strategy in (WeightedSumFusion(), ZScoreFusion(), ReciprocalRankFusion())
+}
+
+
+class InvalidFusionError(ValueError):
+    """A request names an unknown fusion strategy."""
+
+
+def get_fusion_strategy(name: str) -> FusionStrategy:
+    try:
+        return FUSION_STRATEGIES[name]
+    except KeyError:
+        raise InvalidFusionError(f"Unknown fusion strategy: {name}. Available: {sorted(FUSION_STRATEGIES)}")
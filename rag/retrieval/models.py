@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Dict, Any
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Optional
 
 class ScoredChunk(BaseModel):
     content: str
@@ -7,3 +7,10 @@ class ScoredChunk(BaseModel):
     doc_id: str
     chunk_index: int
     metadata: Dict[str, Any]
+    chunk_id: Optional[str] = None  # Qdrant point id / BM25 Chunk.id
+
+class HybridSearchResult(BaseModel):
+    """Fused hybrid results plus the health of the individual retrieval legs."""
+    chunks: List[ScoredChunk]
+    degraded: bool = False  # True if a leg timed out or failed
+    failed_legs: Dict[str, str] = Field(default_factory=dict)  # leg name -> reason
@@ -1,25 +1,74 @@
-from typing import List, Optional
+import asyncio
+import contextvars
+import functools
+import threading
+import json
+import time
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import List, Optional, Dict, Tuple, Callable, Any, Union
 from langfuse import Langfuse
-from rag.retrieval.models import ScoredChunk
+from qdrant_client.http import models
+from rag.retrieval.models import ScoredChunk, HybridSearchResult
+from rag.retrieval.fusion import InvalidFusionError, get_fusion_strategy
+from rag.retrieval.filters import normalize_filters, to_qdrant_filter
 from rag.embeddings.service import EmbeddingService
-from rag.vector_store.qdrant import QdrantService
+from rag.vector_store.qdrant import QdrantService, AsyncQdrantService
 from rag.sparse.index import BM25Index
+from rag.cache.lru import LRUCache
+from rag.cache.generation import IndexGeneration, index_generation
 from apps.api.settings import settings
 
 # Initialize Langfuse for manual tracing
 langfuse = Langfuse()
 
+# Server-side fusion when the sparse leg runs in Qdrant (see _native_fusion)
+NATIVE_FUSION = {"weighted": models.Fusion.DBSF, "rrf": models.Fusion.RRF, "zscore": models.Fusion.DBSF}
+
+# Set inside the task of each async leg: blocking work it offloads runs on the leg executor
+_IN_LEG = contextvars.ContextVar("retrieval_leg", default=False)
+
 class RetrievalService:
-    def __init__(self):
-        self.embedding_service = EmbeddingService()
-        self.qdrant_service = QdrantService(url=settings.QDRANT_URL)
-        self.bm25_index = BM25Index()
+    def __init__(
+        self,
+        embedding_service: Optional[EmbeddingService] = None,
+        qdrant_service: Optional[QdrantService] = None,
+        bm25_index: Optional[BM25Index] = None,
+        generation: Optional[IndexGeneration] = None,
+        async_qdrant_service: Optional[AsyncQdrantService] = None
+    ):
+        # Components can be injected so that one process shares a single copy
+        # of the models and indexes (see apps/api/container.py).
+        self.embedding_service = embedding_service or EmbeddingService()
+        self.qdrant_service = qdrant_service or QdrantService(url=settings.QDRANT_URL)
+        # Used by the async methods; without it they run the sync client on the executor
+        self.async_qdrant_service = async_qdrant_service
+        # SPARSE_BACKEND=qdrant: the sparse leg runs in Qdrant and no BM25 index is loaded
+        self.sparse_encoder = getattr(self.qdrant_service, "sparse_encoder", None)
+        if bm25_index is None and self.sparse_encoder is None:
+            bm25_index = BM25Index()
+        self.bm25_index = bm25_index
+        self.fusion = settings.FUSION_STRATEGY
+        # Results are cached per index generation; IngestionService bumps it after every ingest
+        self.generation = generation if generation is not None else index_generation
+        self.cache = LRUCache(max_size=settings.RETRIEVAL_CACHE_SIZE, ttl=settings.RETRIEVAL_CACHE_TTL)
+        # Blocking work without a deadline (batch search, dense-only search)
+        self._executor = ThreadPoolExecutor(max_workers=settings.RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+        # Legs get their own workers: a leg abandoned at its deadline keeps running and holds
+        # its slot until it finishes, and a leg that finds no free slot fails fast instead of
+        # queueing behind it
+        self._leg_executor = ThreadPoolExecutor(
+            max_workers=settings.RETRIEVAL_LEG_WORKERS, thread_name_prefix="retrieval-leg"
+        )
+        self._leg_slots = threading.BoundedSemaphore(settings.RETRIEVAL_LEG_WORKERS)
 
-    def search(self, query: str, top_k: int = 5, observation=None) -> List[ScoredChunk]:
+    def search(self, query: str, top_k: int = 5, observation=None, filters: Optional[Dict[str, Any]] = None) -> List[ScoredChunk]:
         """
         Dense vector search.
         
         Args:
+            filters: Optional metadata filters, e.g. {"source": "a.pdf", "type": ["pdf", "markdown"]}
+                    (see rag/retrieval/filters.py).
             observation: Optional Langfuse observation (trace/span) to nest under.
                         If provided, creates a child span. Otherwise, creates standalone trace.
         """
@@ -31,23 +80,29 @@ class RetrievalService:
             span = langfuse.trace(name="dense_search", input={"query": query, "top_k": top_k})
         
         try:
+            filters = normalize_filters(filters)
+            cache_key = self._cache_key("dense", query, top_k, filters)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                scored_chunks = [chunk.model_copy(deep=True) for chunk in cached]
+                if is_span:
+                    span.end(output={"num_results": len(scored_chunks), "cache_hit": True})
+                else:
+                    span.update(output={"num_results": len(scored_chunks), "cache_hit": True})
+                return scored_chunks
+
             # 1. Embed query
             query_vector = self.embedding_service.embed_query(query)
             
             # 2. Search Qdrant
-            results = self.qdrant_service.search(query_vector=query_vector, limit=top_k)
+            results = self.qdrant_service.search(
+                query_vector=query_vector, limit=top_k, query_filter=to_qdrant_filter(filters)
+            )
             
             # 3. Format results
-            scored_chunks = []
-            for point in results:
-                payload = point.payload or {}
-                scored_chunks.append(ScoredChunk(
-                    content=payload.get("content", ""),
-                    score=point.score,
-                    doc_id=payload.get("doc_id", ""),
-                    chunk_index=payload.get("chunk_index") or -1,
-                    metadata=payload
-                ))
+            scored_chunks = [self._point_to_scored_chunk(point, point.score) for point in results]
+            # Callers such as the reranker mutate scores, so the cache keeps its own copy
+            self.cache.put(cache_key, [chunk.model_copy(deep=True) for chunk in scored_chunks])
             
             if is_span:
                 span.end(output={"num_results": len(scored_chunks)})
@@ -61,13 +116,256 @@ class RetrievalService:
                 span.update(output={"error": str(e)})
             raise
 
-    def hybrid_search(self, query: str, top_k: int = 5, alpha: float = 0.5, observation=None) -> List[ScoredChunk]:
+    def _cache_key(self, kind: str, query: str, top_k: int, filters: Optional[Dict[str, Any]] = None, **params) -> tuple:
+        """
+        Cache key: normalised query (NFKC, case-folded, whitespace collapsed),
+        search parameters, filters and the current index generation.
+        """
+        normalised = " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+        return (
+            kind,
+            normalised,
+            top_k,
+            tuple(sorted(params.items())),
+            json.dumps(filters, sort_keys=True, default=str) if filters else None,
+            self.generation.value,
+        )
+
+    @staticmethod
+    def _point_to_scored_chunk(point: Union[models.ScoredPoint, models.Record], score: float) -> ScoredChunk:
+        payload = point.payload or {}
+        return ScoredChunk(
+            content=payload.get("content", ""),
+            score=score,
+            doc_id=payload.get("doc_id", ""),
+            chunk_index=payload.get("chunk_index") if payload.get("chunk_index") is not None else -1,
+            metadata=payload,
+            chunk_id=str(point.id)
+        )
+
+    def hybrid_search(self, query: str, top_k: int = 5, alpha: float = 0.5, observation=None, fusion: Optional[str] = None, filters: Optional[Dict[str, Any]] = None) -> List[ScoredChunk]:
         """
         Hybrid search combining dense (vector) and sparse (BM25) retrieval.
         
         Args:
             alpha: Weight for dense search (0.0 to 1.0). Score = alpha * dense + (1 - alpha) * sparse
             observation: Optional Langfuse observation to nest under.
+            fusion: Fusion strategy name ("weighted", "zscore", "rrf"). Defaults to settings.FUSION_STRATEGY.
+            filters: Optional metadata filters, applied by both legs.
+        """
+        return self.hybrid_search_with_status(
+            query, top_k=top_k, alpha=alpha, observation=observation, fusion=fusion, filters=filters
+        ).chunks
+
+    @staticmethod
+    def _fuse(dense_results, sparse_results, alpha: float, top_k: int, fusion_strategy) -> List[Tuple[str, float]]:
+        return fusion_strategy.fuse(
+            [
+                ([str(p.id) for p in dense_results], [p.score for p in dense_results]),
+                ([chunk_id for chunk_id, _ in sparse_results], [s for _, s in sparse_results]),
+            ],
+            weights=[alpha, 1 - alpha],
+            top_k=top_k
+        )
+
+    def _to_scored_chunks(self, batch: List[Tuple[List[Tuple[str, float]], List[models.ScoredPoint]]]) -> List[List[ScoredChunk]]:
+        """
+        Turn fused (chunk id, score) lists into ScoredChunks. Payloads come from the
+        dense hits; ids only found by BM25 are fetched in a single retrieve() for
+        the whole batch, and ids deleted from the vector store are skipped.
+        """
+        return self._assemble(batch, self.qdrant_service.retrieve(self._missing_ids(batch)))
+
+    @staticmethod
+    def _missing_ids(batch: List[Tuple[List[Tuple[str, float]], List[models.ScoredPoint]]]) -> List[str]:
+        """Fused ids without a dense hit to take the payload from."""
+        dense_ids = {str(p.id) for _, dense_results in batch for p in dense_results}
+        return list(dict.fromkeys(
+            chunk_id for fused, _ in batch for chunk_id, _ in fused if chunk_id not in dense_ids
+        ))
+
+    def _payload_records(self, missing: List[str], results: Dict[str, Any]) -> List[models.Record]:
+        """
+        Records fetched by the "payload" leg. When it failed, sparse-only hits are
+        kept with an empty payload (the BM25 index stores no content).
+        """
+        if "payload" in results:
+            return results["payload"]
+        return [models.Record(id=chunk_id, payload={}) for chunk_id in missing]
+
+    def _resolve_payloads(
+        self, batch: List[Tuple[List[Tuple[str, float]], List[models.ScoredPoint]]]
+    ) -> Tuple[List[List[ScoredChunk]], Dict[str, str]]:
+        """
+        _to_scored_chunks() with the retrieve() run as a leg under PAYLOAD_LEG_TIMEOUT,
+        so a slow or failing vector store degrades the result instead of blocking it.
+        """
+        missing = self._missing_ids(batch)
+        if not missing:
+            return self._assemble(batch, []), {}
+        results, failures = self._run_legs({
+            "payload": (lambda: self.qdrant_service.retrieve(missing), settings.PAYLOAD_LEG_TIMEOUT)
+        })
+        return self._assemble(batch, self._payload_records(missing, results)), failures
+
+    def _assemble(
+        self,
+        batch: List[Tuple[List[Tuple[str, float]], List[models.ScoredPoint]]],
+        records: List[models.Record]
+    ) -> List[List[ScoredChunk]]:
+        points_by_id = {str(p.id): p for _, dense_results in batch for p in dense_results}
+        for record in records:
+            points_by_id[str(record.id)] = record
+        return [
+            [
+                self._point_to_scored_chunk(points_by_id[chunk_id], score)
+                for chunk_id, score in fused
+                if chunk_id in points_by_id
+            ]
+            for fused, _ in batch
+        ]
+
+    def _dense_leg(self, query: str, limit: int, filters: Optional[Dict[str, List[str]]] = None) -> List[models.ScoredPoint]:
+        return self.qdrant_service.search(
+            query_vector=self.embedding_service.embed_query(query),
+            limit=limit,
+            query_filter=to_qdrant_filter(filters)
+        )
+
+    def _sparse_leg(self, query: str, limit: int, filters: Optional[Dict[str, List[str]]] = None) -> List[Tuple[str, float]]:
+        return self.bm25_index.search(query, top_k=limit, filters=filters)
+
+    @staticmethod
+    def _hybrid_legs(alpha: float, dense: Callable[[], Any], sparse: Callable[[], Any]) -> Dict[str, Tuple[Callable[[], Any], float]]:
+        """
+        The legs to run, with their deadlines, for _run_legs() or _arun_legs().
+        A leg whose weight is zero (alpha 0.0 or 1.0) is left out.
+        """
+        legs = {}
+        if alpha > 0.0:
+            legs["dense"] = (dense, settings.DENSE_LEG_TIMEOUT)
+        if alpha < 1.0:
+            legs["sparse"] = (sparse, settings.SPARSE_LEG_TIMEOUT)
+        return legs
+
+    def _fuse_legs(
+        self,
+        legs: Dict[str, Any],
+        leg_results: Dict[str, Any],
+        failed_legs: Dict[str, str],
+        alpha: float,
+        top_k: int,
+        fusion: str
+    ) -> Tuple[List[Tuple[str, float]], List[models.ScoredPoint]]:
+        """
+        Fuse the legs that completed on chunk id (shared by Qdrant point ids and
+        BM25 chunks). Returns (fused ids and scores, dense hits) for payload resolution.
+        """
+        if legs and not leg_results:
+            raise RuntimeError(f"All retrieval legs failed: {failed_legs}")
+        dense_results = leg_results.get("dense", [])
+        fused = self._fuse(dense_results, leg_results.get("sparse", []), alpha, top_k, get_fusion_strategy(fusion))
+        return fused, dense_results
+
+    def _hybrid_result(self, cache_key: tuple, chunks: List[ScoredChunk], failed_legs: Dict[str, str]) -> HybridSearchResult:
+        result = HybridSearchResult(chunks=chunks, degraded=bool(failed_legs), failed_legs=failed_legs)
+        if not failed_legs:
+            # Degraded results are partial; only complete ones are worth reusing
+            self.cache.put(cache_key, result.model_copy(deep=True))
+        return result
+
+    @staticmethod
+    def _native_fusion(fusion: str, alpha: float) -> models.Fusion:
+        """
+        How Qdrant fuses the legs. Its fusions are unweighted, so any alpha other
+        than an even split or a single leg is rejected. "weighted" maps to DBSF,
+        which normalises each leg's scores before summing them, as the in-process
+        min-max fusion does; raw cosine and BM25 scores are not comparable.
+        """
+        if fusion not in NATIVE_FUSION:
+            raise InvalidFusionError(f"Unknown fusion strategy: {fusion}. Available: {sorted(NATIVE_FUSION)}")
+        if alpha not in (0.0, 0.5, 1.0):
+            raise InvalidFusionError(
+                f"fusion={fusion} cannot weight the legs with SPARSE_BACKEND=qdrant; "
+                f"use alpha 0.5 (or 0.0 / 1.0 for a single leg), or SPARSE_BACKEND=bm25"
+            )
+        return NATIVE_FUSION[fusion]
+
+    def _native_hybrid(self, queries: List[str], top_k: int, alpha: float, fusion: str, filters: Optional[Dict[str, List[str]]] = None) -> List[List[ScoredChunk]]:
+        """Both legs in one Qdrant batch query with server-side fusion (see _native_fusion)."""
+        native_fusion = self._native_fusion(fusion, alpha)
+        results = self.qdrant_service.hybrid_search_batch(
+            self.embedding_service.embed_queries(queries) if alpha > 0.0 else None,
+            [self.sparse_encoder.encode_query(q) for q in queries] if alpha < 1.0 else None,
+            limit=top_k,
+            prefetch_limit=top_k * 2,
+            query_filter=to_qdrant_filter(filters),
+            fusion=native_fusion
+        )
+        return [[self._point_to_scored_chunk(p, p.score) for p in points] for points in results]
+
+    @staticmethod
+    def _native_leg(query: Callable[[], Any]) -> Dict[str, Tuple[Callable[[], Any], float]]:
+        """
+        The server-side query as a single "hybrid" leg for _run_legs() or _arun_legs(),
+        so a slow or failing Qdrant degrades the result instead of raising.
+        """
+        return {"hybrid": (query, max(settings.DENSE_LEG_TIMEOUT, settings.SPARSE_LEG_TIMEOUT))}
+
+    def _submit_leg(self, fn: Callable[[], Any]) -> Future:
+        """Run leg work on the leg executor; raises when every leg worker is busy."""
+        if not self._leg_slots.acquire(blocking=False):
+            raise RuntimeError("no free retrieval leg worker")
+        try:
+            future = self._leg_executor.submit(fn)
+        except BaseException:
+            self._leg_slots.release()
+            raise
+        # Released when the work finishes, or is cancelled before it started
+        future.add_done_callback(lambda _: self._leg_slots.release())
+        return future
+
+    def _run_legs(self, legs: Dict[str, Tuple[Callable[[], Any], float]]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """
+        Run independent retrieval legs concurrently, each against its own deadline.
+        Returns (results by leg name, failure reason by leg name).
+        """
+        start = time.monotonic()
+        results: Dict[str, Any] = {}
+        failures: Dict[str, str] = {}
+        futures = {}
+        for name, (fn, timeout) in legs.items():
+            try:
+                futures[name] = (self._submit_leg(fn), timeout)
+            except RuntimeError as e:
+                failures[name] = str(e)
+
+        for name, (future, timeout) in futures.items():
+            remaining = max(0.0, timeout - (time.monotonic() - start))
+            try:
+                results[name] = future.result(timeout=remaining)
+            except FuturesTimeoutError:
+                # The worker keeps running in the background; we just stop waiting for it
+                future.cancel()
+                failures[name] = f"timed out after {timeout}s"
+            except Exception as e:
+                failures[name] = str(e)
+        return results, failures
+
+    def hybrid_search_with_status(self, query: str, top_k: int = 5, alpha: float = 0.5, observation=None, fusion: Optional[str] = None, filters: Optional[Dict[str, Any]] = None) -> HybridSearchResult:
+        """
+        Same as hybrid_search, but also reports whether a leg timed out or failed.
+        
+        The dense and sparse legs run concurrently. If one of them is late or raises,
+        the other leg's results are returned and the result is flagged as degraded.
+        The payload lookup for BM25-only hits has a deadline too; when it fails those
+        hits are returned without content, as the "payload" leg.
+        A leg whose weight is zero (alpha 0.0 or 1.0) is not run at all.
+        Filters are pushed down into both legs rather than applied after fusion.
+        
+        With SPARSE_BACKEND=qdrant both legs run in a single Qdrant query with
+        server-side fusion instead. If that query is late or fails, the result is
+        empty and degraded, with the "hybrid" leg in failed_legs.
         """
         # Create span (nested or standalone)
         is_span = observation is not None
@@ -77,83 +375,298 @@ class RetrievalService:
             span = langfuse.trace(name="hybrid_search", input={"query": query, "top_k": top_k, "alpha": alpha})
         
         try:
-            # 1. Get Dense Results
-            dense_results = self.qdrant_service.search(
-                query_vector=self.embedding_service.embed_query(query),
-                limit=top_k * 2
-            )
-            
-            # 2. Get Sparse Results
-            sparse_results = self.bm25_index.search(query, top_k=top_k * 2)
+            fusion = fusion or self.fusion
+            filters = normalize_filters(filters)
+            cache_key = self._cache_key("hybrid", query, top_k, filters, alpha=alpha, fusion=fusion)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                result = cached.model_copy(deep=True)
+                output = {"num_results": len(result.chunks), "degraded": False, "cache_hit": True}
+                if is_span:
+                    span.end(output=output)
+                else:
+                    span.update(output=output)
+                return result
+
+            if self.sparse_encoder is not None:
+                # Native sparse vectors: one Qdrant query runs and fuses both legs
+                self._native_fusion(fusion, alpha)  # invalid requests raise, they do not degrade
+                results, failed_legs = self._run_legs(self._native_leg(
+                    functools.partial(self._native_hybrid, [query], top_k, alpha, fusion, filters)
+                ))
+                final_results = results["hybrid"][0] if "hybrid" in results else []
+            else:
+                # 1. Run Dense and Sparse legs concurrently
+                legs = self._hybrid_legs(
+                    alpha,
+                    dense=functools.partial(self._dense_leg, query, top_k * 2, filters),
+                    sparse=functools.partial(self._sparse_leg, query, top_k * 2, filters)
+                )
+                leg_results, failed_legs = self._run_legs(legs)
+                
+                # 2. Fuse whatever completed
+                fused = self._fuse_legs(legs, leg_results, failed_legs, alpha, top_k, fusion)
+                
+                # 3. Format. The BM25 index only stores ids, so sparse-only hits are
+                # fetched from the vector store in one round trip, under its own deadline.
+                assembled, payload_failures = self._resolve_payloads([fused])
+                final_results = assembled[0]
+                failed_legs = {**failed_legs, **payload_failures}
             
-            # 3. Normalize Scores
-            dense_scores = [p.score for p in dense_results]
-            sparse_scores = [s for _, s in sparse_results]
+            result = self._hybrid_result(cache_key, final_results, failed_legs)
             
-            max_d = max(dense_scores) if dense_scores else 1.0
-            min_d = min(dense_scores) if dense_scores else 0.0
+            output = {"num_results": len(final_results), "degraded": bool(failed_legs), "failed_legs": failed_legs}
+            if is_span:
+                span.end(output=output)
+            else:
+                span.update(output=output)
+            return result
+        except Exception as e:
+            if is_span:
+                span.end(output={"error": str(e)})
+            else:
+                span.update(output={"error": str(e)})
+            raise
+
+    def search_many(self, queries: List[str], top_k: int = 5, alpha: float = 0.5, fusion: Optional[str] = None, observation=None, filters: Optional[Dict[str, Any]] = None) -> List[List[ScoredChunk]]:
+        """
+        Hybrid search for a batch of queries, returning one result list per query, in order.
+        
+        Unlike calling hybrid_search() in a loop, the batch costs one encode() call,
+        one Qdrant batch query, one BM25 pass over the segments and one retrieve()
+        for sparse-only hits. Cached queries are answered from the cache. Meant for
+        offline jobs: a failing leg raises instead of degrading. filters apply to
+        every query in the batch.
+        """
+        # Create span (nested or standalone)
+        is_span = observation is not None
+        if is_span:
+            span = observation.span(name="search_many", input={"num_queries": len(queries), "top_k": top_k, "alpha": alpha})
+        else:
+            span = langfuse.trace(name="search_many", input={"num_queries": len(queries), "top_k": top_k, "alpha": alpha})
+        
+        try:
+            fusion = fusion or self.fusion
+            fusion_strategy = get_fusion_strategy(fusion)
+            filters = normalize_filters(filters)
+            keys = [self._cache_key("hybrid", q, top_k, filters, alpha=alpha, fusion=fusion) for q in queries]
+            cached = [self.cache.get(key) for key in keys]
+            todo = [i for i, hit in enumerate(cached) if hit is None]
+            pending = [queries[i] for i in todo]
             
-            max_s = max(sparse_scores) if sparse_scores else 1.0
-            min_s = min(sparse_scores) if sparse_scores else 0.0
+            if self.sparse_encoder is not None:
+                # Native sparse vectors: one Qdrant batch query runs and fuses both legs
+                fresh = self._native_hybrid(pending, top_k, alpha, fusion, filters) if pending else []
+            else:
+                # 1. Both legs for all uncached queries, concurrently
+                dense_future = sparse_future = None
+                if pending and alpha > 0.0:
+                    dense_future = self._executor.submit(
+                        lambda: self.qdrant_service.search_batch(
+                            self.embedding_service.embed_queries(pending),
+                            limit=top_k * 2,
+                            query_filter=to_qdrant_filter(filters)
+                        )
+                    )
+                if pending and alpha < 1.0:
+                    sparse_future = self._executor.submit(self.bm25_index.search_many, pending, top_k * 2, filters=filters)
+                dense_batch = dense_future.result() if dense_future else [[] for _ in pending]
+                sparse_batch = sparse_future.result() if sparse_future else [[] for _ in pending]
+                
+                # 2. Fuse per query, then resolve payloads for the whole batch
+                fused_batch = [
+                    (self._fuse(dense, sparse, alpha, top_k, fusion_strategy), dense)
+                    for dense, sparse in zip(dense_batch, sparse_batch)
+                ]
+                fresh = self._to_scored_chunks(fused_batch)
             
-            def norm_d(s): return (s - min_d) / (max_d - min_d + 1e-6)
-            def norm_s(s): return (s - min_s) / (max_s - min_s + 1e-6)
+            results: List[List[ScoredChunk]] = [
+                [c.model_copy(deep=True) for c in hit.chunks] if hit is not None else [] for hit in cached
+            ]
+            for i, chunks in zip(todo, fresh):
+                self.cache.put(keys[i], HybridSearchResult(chunks=[c.model_copy(deep=True) for c in chunks]))
+                results[i] = chunks
             
-            # 4. Merge
-            combined = {}
+            output = {"num_queries": len(queries), "cache_hits": len(queries) - len(todo)}
+            if is_span:
+                span.end(output=output)
+            else:
+                span.update(output=output)
+            return results
+        except Exception as e:
+            if is_span:
+                span.end(output={"error": str(e)})
+            else:
+                span.update(output={"error": str(e)})
+            raise
+
+    # --- Async API: the event loop is never blocked ---
+
+    async def _offload(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run CPU-bound or blocking work (embedding, BM25, sync Qdrant) on an executor:
+        the leg executor when called from a leg (see _arun_legs), else the shared one.
+        """
+        if _IN_LEG.get():
+            return await asyncio.wrap_future(self._submit_leg(functools.partial(fn, *args, **kwargs)))
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def _qdrant(self, method: str, *args, **kwargs) -> Any:
+        if self.async_qdrant_service is not None:
+            return await getattr(self.async_qdrant_service, method)(*args, **kwargs)
+        return await self._offload(getattr(self.qdrant_service, method), *args, **kwargs)
+
+    async def _adense_leg(self, query: str, limit: int, filters: Optional[Dict[str, List[str]]] = None) -> List[models.ScoredPoint]:
+        query_vector = await self._offload(self.embedding_service.embed_query, query)
+        return await self._qdrant("search", query_vector=query_vector, limit=limit, query_filter=to_qdrant_filter(filters))
+
+    async def _anative_hybrid(self, query: str, top_k: int, alpha: float, fusion: str, filters: Optional[Dict[str, List[str]]] = None) -> List[ScoredChunk]:
+        """Async _native_hybrid for one query."""
+        native_fusion = self._native_fusion(fusion, alpha)
+        query_vector = await self._offload(self.embedding_service.embed_query, query) if alpha > 0.0 else None
+        points = await self._qdrant(
+            "hybrid_search",
+            query_vector=query_vector,
+            sparse_vector=self.sparse_encoder.encode_query(query) if alpha < 1.0 else None,
+            limit=top_k,
+            prefetch_limit=top_k * 2,
+            query_filter=to_qdrant_filter(filters),
+            fusion=native_fusion
+        )
+        return [self._point_to_scored_chunk(p, p.score) for p in points]
+
+    async def _arun_legs(self, legs: Dict[str, Tuple[Callable[[], Any], float]]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """Async _run_legs: legs are coroutine functions, each awaited against its own deadline."""
+        start = time.monotonic()
+        tasks = {name: (asyncio.ensure_future(self._as_leg(fn)), timeout) for name, (fn, timeout) in legs.items()}
+        
+        results: Dict[str, Any] = {}
+        failures: Dict[str, str] = {}
+        for name, (task, timeout) in tasks.items():
+            remaining = max(0.0, timeout - (time.monotonic() - start))
+            try:
+                results[name] = await asyncio.wait_for(task, timeout=remaining)
+            except asyncio.TimeoutError:
+                failures[name] = f"timed out after {timeout}s"
+            except Exception as e:
+                failures[name] = str(e)
+        return results, failures
+
+    @staticmethod
+    async def _as_leg(fn: Callable[[], Any]) -> Any:
+        # Tasks run in a copy of the context, so this only marks the leg's own task
+        _IN_LEG.set(True)
+        return await fn()
+
+    async def _aresolve_payloads(
+        self, batch: List[Tuple[List[Tuple[str, float]], List[models.ScoredPoint]]]
+    ) -> Tuple[List[List[ScoredChunk]], Dict[str, str]]:
+        """Async _resolve_payloads()."""
+        missing = self._missing_ids(batch)
+        if not missing:
+            return self._assemble(batch, []), {}
+        results, failures = await self._arun_legs({
+            "payload": (functools.partial(self._qdrant, "retrieve", missing), settings.PAYLOAD_LEG_TIMEOUT)
+        })
+        return self._assemble(batch, self._payload_records(missing, results)), failures
+
+    async def asearch(self, query: str, top_k: int = 5, observation=None, filters: Optional[Dict[str, Any]] = None) -> List[ScoredChunk]:
+        """Async search(): awaits Qdrant instead of blocking the calling event loop."""
+        # Create span (nested or standalone)
+        is_span = observation is not None
+        if is_span:
+            span = observation.span(name="dense_search", input={"query": query, "top_k": top_k})
+        else:
+            span = langfuse.trace(name="dense_search", input={"query": query, "top_k": top_k})
+        
+        try:
+            filters = normalize_filters(filters)
+            cache_key = self._cache_key("dense", query, top_k, filters)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                scored_chunks = [chunk.model_copy(deep=True) for chunk in cached]
+                output = {"num_results": len(scored_chunks), "cache_hit": True}
+            else:
+                results = await self._adense_leg(query, top_k, filters)
+                scored_chunks = [self._point_to_scored_chunk(point, point.score) for point in results]
+                self.cache.put(cache_key, [chunk.model_copy(deep=True) for chunk in scored_chunks])
+                output = {"num_results": len(scored_chunks)}
             
-            for point in dense_results:
-                content = point.payload.get("content")
-                score = norm_d(point.score)
-                combined[content] = {
-                    "score": score * alpha,
-                    "chunk": point,
-                    "type": "dense",
-                    "original_chunk_obj": None
-                }
-                
-            for chunk, score in sparse_results:
-                n_score = norm_s(score)
-                weighted = n_score * (1 - alpha)
-                if chunk.content in combined:
-                    combined[chunk.content]["score"] += weighted
+            if is_span:
+                span.end(output=output)
+            else:
+                span.update(output=output)
+            return scored_chunks
+        except Exception as e:
+            if is_span:
+                span.end(output={"error": str(e)})
+            else:
+                span.update(output={"error": str(e)})
+            raise
+
+    async def ahybrid_search(self, query: str, top_k: int = 5, alpha: float = 0.5, observation=None, fusion: Optional[str] = None, filters: Optional[Dict[str, Any]] = None) -> List[ScoredChunk]:
+        result = await self.ahybrid_search_with_status(
+            query, top_k=top_k, alpha=alpha, observation=observation, fusion=fusion, filters=filters
+        )
+        return result.chunks
+
+    async def ahybrid_search_with_status(self, query: str, top_k: int = 5, alpha: float = 0.5, observation=None, fusion: Optional[str] = None, filters: Optional[Dict[str, Any]] = None) -> HybridSearchResult:
+        """
+        Async hybrid_search_with_status(), with the same leg deadlines and degraded flag.
+        Qdrant is awaited; embedding and BM25 scoring run on the executor.
+        """
+        # Create span (nested or standalone)
+        is_span = observation is not None
+        if is_span:
+            span = observation.span(name="hybrid_search", input={"query": query, "top_k": top_k, "alpha": alpha})
+        else:
+            span = langfuse.trace(name="hybrid_search", input={"query": query, "top_k": top_k, "alpha": alpha})
+        
+        try:
+            fusion = fusion or self.fusion
+            filters = normalize_filters(filters)
+            cache_key = self._cache_key("hybrid", query, top_k, filters, alpha=alpha, fusion=fusion)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                result = cached.model_copy(deep=True)
+                output = {"num_results": len(result.chunks), "degraded": False, "cache_hit": True}
+                if is_span:
+                    span.end(output=output)
                 else:
-                    combined[chunk.content] = {
-                        "score": weighted,
-                        "chunk": None,
-                        "type": "sparse",
-                        "original_chunk_obj": chunk
-                    }
-                    
-            # 5. Sort & Format
-            sorted_items = sorted(combined.values(), key=lambda x: x["score"], reverse=True)
-            final_results = []
+                    span.update(output=output)
+                return result
+
+            if self.sparse_encoder is not None:
+                # Native sparse vectors: one Qdrant query runs and fuses both legs
+                self._native_fusion(fusion, alpha)  # invalid requests raise, they do not degrade
+                results, failed_legs = await self._arun_legs(self._native_leg(
+                    functools.partial(self._anative_hybrid, query, top_k, alpha, fusion, filters)
+                ))
+                final_results = results.get("hybrid", [])
+            else:
+                # 1. Run Dense and Sparse legs concurrently
+                legs = self._hybrid_legs(
+                    alpha,
+                    dense=functools.partial(self._adense_leg, query, top_k * 2, filters),
+                    sparse=functools.partial(self._offload, self._sparse_leg, query, top_k * 2, filters)
+                )
+                leg_results, failed_legs = await self._arun_legs(legs)
+                
+                # 2. Fuse and format (sparse-only hits fetched in one round trip)
+                fused = self._fuse_legs(legs, leg_results, failed_legs, alpha, top_k, fusion)
+                assembled, payload_failures = await self._aresolve_payloads([fused])
+                final_results = assembled[0]
+                failed_legs = {**failed_legs, **payload_failures}
             
-            for item in sorted_items[:top_k]:
-                if item["type"] == "dense":
-                    payload = item["chunk"].payload
-                    final_results.append(ScoredChunk(
-                        content=payload.get("content"),
-                        score=item["score"],
-                        doc_id=payload.get("doc_id", ""),
-                        chunk_index=payload.get("chunk_index") if payload.get("chunk_index") is not None else -1,
-                        metadata=payload
-                    ))
-                else:
-                    chunk = item["original_chunk_obj"]
-                    final_results.append(ScoredChunk(
-                        content=chunk.content,
-                        score=item["score"],
-                        doc_id=chunk.doc_id,
-                        chunk_index=chunk.chunk_index,
-                        metadata=chunk.metadata
-                    ))
+            result = self._hybrid_result(cache_key, final_results, failed_legs)
             
+            output = {"num_results": len(final_results), "degraded": bool(failed_legs), "failed_legs": failed_legs}
             if is_span:
-                span.end(output={"num_results": len(final_results)})
+                span.end(output=output)
             else:
-                span.update(output={"num_results": len(final_results)})
-            return final_results
+                span.update(output=output)
+            return result
         except Exception as e:
             if is_span:
                 span.end(output={"error": str(e)})
@@ -0,0 +1,138 @@
+"""
+Analyzer: text -> normalised terms -> integer term ids.
+
+The analyzer chain is:
+    1. Unicode normalisation (NFKC) and case folding
+    2. Tokenisation on word characters (drops punctuation)
+    3. Stopword removal (optional)
+    4. Stemming (optional, needs nltk)
+
+Terms are interned in a Vocabulary shared by every segment, so postings and
+query lookups only deal with ints.
+"""
+import os
+import re
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, Optional, FrozenSet
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+ENGLISH_STOPWORDS: FrozenSet[str] = frozenset("""
+a about above after again against all am an and any are as at be because been before
+being below between both but by can could did do does doing down during each few for
+from further had has have having he her here hers herself him himself his how i if in
+into is it its itself just me more most my myself no nor not of off on once only or
+other our ours ourselves out over own same she should so some such than that the their
+theirs them themselves then there these they this those through to too under until up
+very was we were what when where which while who whom why will with would you your
+yours yourself yourselves
+""".split())
+
+
+class Analyzer:
+    """
+    Configurable text analysis for BM25 indexing and querying.
+    Indexing and querying must use the same configuration.
+    """
+
+    def __init__(
+        self,
+        normalize_unicode: bool = True,
+        lowercase: bool = True,
+        stopwords: Optional[Iterable[str]] = ENGLISH_STOPWORDS,
+        stemmer: Optional[str] = None
+    ):
+        self.normalize_unicode = normalize_unicode
+        self.lowercase = lowercase
+        self.stopwords = frozenset(stopwords) if stopwords else frozenset()
+        self.stemmer_name = stemmer
+        self._stem = self._load_stemmer(stemmer)
+
+    @staticmethod
+    def _load_stemmer(name: Optional[str]):
+        if not name:
+            return None
+        if name != "porter":
+            raise ValueError(f"Unknown stemmer: {name}")
+        try:
+            from nltk.stem import PorterStemmer
+        except ImportError:
+            raise ImportError("Stemming requires nltk: pip install nltk")
+        stemmer = PorterStemmer()
+        return stemmer.stem
+
+    @property
+    def config(self) -> Dict[str, object]:
+        """Serializable description, stored with the index to detect mismatches."""
+        return {
+            "normalize_unicode": self.normalize_unicode,
+            "lowercase": self.lowercase,
+            "stopwords": len(self.stopwords),
+            "stemmer": self.stemmer_name,
+        }
+
+    def analyze(self, text: str) -> List[str]:
+        if self.normalize_unicode:
+            text = unicodedata.normalize("NFKC", text)
+        if self.lowercase:
+            text = text.casefold()
+        tokens = TOKEN_PATTERN.findall(text)
+        if self.stopwords:
+            tokens = [t for t in tokens if t not in self.stopwords]
+        if self._stem is not None:
+            tokens = [self._stem(t) for t in tokens]
+        return tokens
+
+
+class Vocabulary:
+    """
+    Append-only term -> id mapping, persisted as one term per line.
+    A term's id is its line number, so saving only appends new terms.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.terms: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self._saved = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    self.ids[line.rstrip("\n")] = len(self.terms)
+                    self.terms.append(line.rstrip("\n"))
+            self._saved = len(self.terms)
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def get(self, term: str) -> Optional[int]:
+        return self.ids.get(term)
+
+    def intern(self, tokens: List[str]) -> List[int]:
+        """Term ids for tokens, assigning new ids to unseen terms."""
+        with self._lock:
+            ids = []
+            for token in tokens:
+                term_id = self.ids.get(token)
+                if term_id is None:
+                    term_id = self.ids[token] = len(self.terms)
+                    self.terms.append(token)
+                ids.append(term_id)
+            return ids
+
+    def lookup(self, tokens: List[str]) -> List[int]:
+        """Term ids for known tokens; unknown tokens are dropped."""
+        return [self.ids[t] for t in tokens if t in self.ids]
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            new_terms = self.terms[self._saved:]
+            if not new_terms:
+                return
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(term + "\n" for term in new_terms)
+            self._saved = len(self.terms)
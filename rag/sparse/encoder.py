@@ -0,0 +1,69 @@
+"""
+Sparse Encoder: BM25 term weights as Qdrant sparse vectors.
+
+With SPARSE_BACKEND=qdrant the sparse leg runs inside Qdrant instead of the
+in-process BM25Index. Each chunk is stored with a sparse vector holding the
+BM25 term-frequency part of its score,
+
+    tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avg_len))
+
+and the collection's sparse vector has Modifier.IDF, so Qdrant multiplies in
+the IDF from its own corpus statistics at query time. Queries are term counts.
+The dot product is then the usual BM25 score, up to the average length being
+a configured estimate (SPARSE_AVG_DOC_LEN) rather than the live corpus mean.
+
+Terms go through the same Analyzer as BM25Index. Term ids are CRC32 hashes
+rather than Vocabulary ids, so every API worker encodes queries identically
+without loading a vocabulary; the rare hash collision merges two terms.
+"""
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional
+from qdrant_client.http import models
+from rag.sparse.analyzer import Analyzer
+from rag.sparse.index import default_analyzer
+from apps.api.settings import settings
+
+SPARSE_VECTOR_NAME = "bm25"
+
+
+class SparseEncoder:
+    def __init__(
+        self,
+        analyzer: Optional[Analyzer] = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+        avg_len: Optional[float] = None
+    ):
+        self.analyzer = analyzer or default_analyzer()
+        self.k1 = k1
+        self.b = b
+        self.avg_len = avg_len if avg_len is not None else settings.SPARSE_AVG_DOC_LEN
+
+    @staticmethod
+    def term_id(term: str) -> int:
+        return zlib.crc32(term.encode("utf-8"))
+
+    def _term_counts(self, text: str) -> Dict[int, int]:
+        counts: Dict[int, int] = Counter()
+        for term, tf in Counter(self.analyzer.analyze(text)).items():
+            counts[self.term_id(term)] += tf
+        return counts
+
+    @staticmethod
+    def _to_vector(weights: Dict[int, float]) -> models.SparseVector:
+        indices = sorted(weights)
+        return models.SparseVector(indices=indices, values=[float(weights[i]) for i in indices])
+
+    def encode_document(self, text: str) -> models.SparseVector:
+        counts = self._term_counts(text)
+        norm = self.k1 * (1 - self.b + self.b * sum(counts.values()) / self.avg_len)
+        return self._to_vector({
+            term: tf * (self.k1 + 1) / (tf + norm) for term, tf in counts.items()
+        })
+
+    def encode_documents(self, texts: List[str]) -> List[models.SparseVector]:
+        return [self.encode_document(text) for text in texts]
+
+    def encode_query(self, text: str) -> models.SparseVector:
+        return self._to_vector(self._term_counts(text))
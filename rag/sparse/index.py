@@ -1,60 +1,399 @@
+import heapq
+import json
 import pickle
 import os
-from typing import List, Dict, Any, Optional
-from rank_bm25 import BM25Okapi
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from typing import List, Dict, Optional, Tuple
+import numpy as np
 from rag.ingestion.models import Chunk
+from rag.sparse.analyzer import Analyzer, Vocabulary, ENGLISH_STOPWORDS
+from rag.sparse.inverted import CorpusStats, Segment, SearchTrace
+from rag.retrieval.filters import FILTER_FIELDS, chunk_field_values
+from rag.cache.generation import IndexGeneration, index_generation
+from rag.sparse.storage import FORMAT_VERSION, write_segment, read_segment, remove_segment
+from apps.api.settings import settings
+
+
+def default_analyzer() -> Analyzer:
+    return Analyzer(
+        stopwords=ENGLISH_STOPWORDS if settings.BM25_STOPWORDS else None,
+        stemmer=settings.BM25_STEMMER or None
+    )
+
+
+class _Discarded:
+    """Stand-in for classes of the retired rank-bm25 package; their state is dropped."""
+
+    def __setstate__(self, state):
+        pass
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    """
+    Reads the pre-segment bm25.pkl ({"bm25": BM25Okapi, "chunks": [...]}) without
+    rank-bm25 installed. Only the chunks are migrated; the scorer is rebuilt from them.
+    """
+
+    def find_class(self, module, name):
+        if module == "rank_bm25" or module.startswith("rank_bm25."):
+            return _Discarded
+        return super().find_class(module, name)
+
 
 class BM25Index:
-    def __init__(self, persistence_path: str = "data/bm25.pkl"):
-        self.persistence_path = persistence_path
-        self.bm25: Optional[BM25Okapi] = None
-        self.chunks: List[Chunk] = []
+    """
+    Segment-based BM25 index.
+
+    Every add() writes a new append-only segment, so ingesting a file costs time
+    proportional to that file. Deletes set tombstones. When there are more than
+    max_segments segments, the merge_factor smallest ones are merged in a
+    background thread, which also drops tombstoned documents.
+
+    With num_shards > 1 (BM25_SHARDS), every add() is split into one segment per
+    shard, merges stay within a shard, and queries fan out to the shards on a
+    thread pool before a global top-k merge. All shards score against the same
+    corpus statistics, so results match the unsharded index exactly.
+
+    Queries with several terms use MaxScore pruning (BM25_PRUNING): documents
+    that cannot reach the current k-th best score are skipped, and that score is
+    carried from segment to segment within a shard. Results are identical to
+    exhaustive scoring.
+
+    Metadata filters (rag/retrieval/filters.py) are applied inside each segment
+    through per-value bitmaps; very selective filters only score the documents
+    that pass them.
+
+    Text goes through the Analyzer and terms are interned as integer ids in a
+    shared Vocabulary. The index only knows chunk ids: search() returns
+    (chunk id, score) pairs and callers fetch content from the vector store.
+
+    On disk (persistence_dir):
+        manifest.json      format version, analyzer config, segments and tombstones
+        vocab.txt          one term per line; line number = term id
+        <segment>/         memory-mapped columnar arrays (see rag/sparse/storage.py)
+    """
+
+    def __init__(
+        self,
+        persistence_dir: str = "data/bm25",
+        k1: float = 1.5,
+        b: float = 0.75,
+        max_segments: int = 8,
+        merge_factor: int = 4,
+        analyzer: Optional[Analyzer] = None,
+        num_shards: Optional[int] = None,
+        prune: Optional[bool] = None,
+        generation: Optional[IndexGeneration] = None
+    ):
+        self.persistence_dir = persistence_dir
+        # Bumped on delete() so cached retrieval results stop returning the deleted chunks
+        self.generation = generation if generation is not None else index_generation
+        self.analyzer = analyzer or default_analyzer()
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+        self.merge_factor = merge_factor
+        self.prune = prune if prune is not None else settings.BM25_PRUNING
+        self.num_shards = max(1, num_shards if num_shards is not None else settings.BM25_SHARDS)
+        self._executor = (
+            ThreadPoolExecutor(max_workers=self.num_shards, thread_name_prefix="bm25-shard")
+            if self.num_shards > 1 else None
+        )
+
+        self.segments: List[Segment] = []
+        self.stats = CorpusStats()
+        self._next_segment = 0
+        self._lock = threading.RLock()
+        self._merge_thread: Optional[threading.Thread] = None
+
         self._ensure_data_dir()
+        self.vocabulary = Vocabulary(os.path.join(persistence_dir, "vocab.txt"))
         self.load()
 
     def _ensure_data_dir(self):
-        os.makedirs(os.path.dirname(self.persistence_path), exist_ok=True)
+        os.makedirs(self.persistence_dir, exist_ok=True)
 
     def _tokenize(self, text: str) -> List[str]:
-        # Simple tokenization: lowercase and split by whitespace
-        # Ideally, use a proper tokenizer (e.g., from nltk or spaCy) matching the language
-        return text.lower().split()
+        return self.analyzer.analyze(text)
+
+    @property
+    def num_docs(self) -> int:
+        """Number of live (non-deleted) chunks."""
+        return sum(segment.num_live for segment in self.segments)
 
     def build(self, chunks: List[Chunk]):
         """
-        Builds the BM25 index from a list of chunks.
-        Note: This is an in-memory operation and replaces the existing index.
-        For production, you'd want incremental updates or a proper search engine (Elastic/OpenSearch).
+        Builds the BM25 index from a list of chunks, replacing the existing index.
         """
-        self.chunks = chunks
-        tokenized_corpus = [self._tokenize(chunk.content) for chunk in chunks]
-        self.bm25 = BM25Okapi(tokenized_corpus)
-        self.save()
+        self.wait_for_merges()
+        with self._lock:
+            for segment in self.segments:
+                remove_segment(self.persistence_dir, segment.name)
+            self.segments = []
+            self.stats = CorpusStats()
+        self.add(chunks)
 
-    def save(self):
-        with open(self.persistence_path, "wb") as f:
-            pickle.dump({"bm25": self.bm25, "chunks": self.chunks}, f)
+    def add(self, chunks: List[Chunk]) -> List[Segment]:
+        """
+        Index new chunks as new segments, one contiguous slice per shard.
+        Only the new chunks are tokenized and written.
+        """
+        if not chunks:
+            return []
+
+        term_ids = [self.vocabulary.intern(self._tokenize(chunk.content)) for chunk in chunks]
+        chunk_ids = [c.id for c in chunks]
+        values = [chunk_field_values(c) for c in chunks]
+        bounds = np.linspace(0, len(chunks), min(self.num_shards, len(chunks)) + 1).astype(int)
+        segments = []
+        with self._lock:
+            for shard, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+                segment = Segment.from_tokens(
+                    self._new_segment_name(), chunk_ids[start:end], term_ids[start:end], shard=shard,
+                    fields={field: [v[field] for v in values[start:end]] for field in FILTER_FIELDS}
+                )
+                write_segment(segment, self.persistence_dir)
+                segments.append(segment)
+            self.vocabulary.save()
+            for segment in segments:
+                self._register(segment)
+            self._save_manifest()
+        self._maybe_merge()
+        return segments
+
+    def delete(self, chunk_ids: List[str]) -> int:
+        """
+        Tombstone chunks by id. Returns how many live chunks were deleted.
+        """
+        deleted = 0
+        with self._lock:
+            for segment in self.segments:
+                docs = segment.find(chunk_ids)
+                docs = docs[~segment.deleted[docs]]
+                segment.deleted[docs] = True
+                deleted += len(docs)
+            if deleted:
+                self._save_manifest()
+        if deleted:
+            self.generation.bump()
+        return deleted
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        trace: Optional[SearchTrace] = None,
+        filters: Optional[Dict[str, List[str]]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Returns up to top_k (chunk id, BM25 score) pairs, best first.
+        filters are normalised metadata filters (see rag/retrieval/filters.py).
+        If trace is given, it is filled with the number of postings seen and scored.
+        """
+        return self.search_many([query], top_k=top_k, trace=trace, filters=filters)[0]
+
+    def search_many(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        trace: Optional[SearchTrace] = None,
+        filters: Optional[Dict[str, List[str]]] = None
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        search() for a batch of queries, in order, against one snapshot of the
+        segments. Each shard scores the whole batch in a single task.
+        """
+        batch = [Counter(self.vocabulary.lookup(self._tokenize(query))) for query in queries]
+
+        # Segments are replaced, never mutated in place, so a snapshot is consistent
+        shards: Dict[int, List[Segment]] = {}
+        for segment in self.segments:
+            shards.setdefault(segment.shard, []).append(segment)
+
+        if self._executor is not None and len(shards) > 1:
+            # Shards share the corpus statistics, so their scores are directly comparable.
+            # The heavy lifting is in NumPy kernels, which release the GIL.
+            traces = [SearchTrace() for _ in shards]
+            futures = [
+                self._executor.submit(self._search_shard, shard_segments, batch, top_k, shard_trace, filters)
+                for shard_segments, shard_trace in zip(shards.values(), traces)
+            ]
+            per_shard = [future.result() for future in futures]
+            if trace is not None:
+                trace.postings_total += sum(t.postings_total for t in traces)
+                trace.postings_scored += sum(t.postings_scored for t in traces)
+        else:
+            per_shard = [self._search_shard(s, batch, top_k, trace, filters) for s in shards.values()]
+
+        return [
+            heapq.nlargest(top_k, (hit for hits in per_shard for hit in hits[i]), key=lambda x: x[1])
+            for i in range(len(batch))
+        ]
+
+    def _search_shard(
+        self,
+        segments: List[Segment],
+        batch: List[Dict[int, int]],
+        top_k: int,
+        trace: Optional[SearchTrace] = None,
+        filters: Optional[Dict[str, List[str]]] = None
+    ) -> List[List[Tuple[str, float]]]:
+        # Filter masks are computed once per segment for the whole batch
+        masks = [segment.filter_mask(filters) for segment in segments] if filters else None
+        return [
+            self._search_segments(segments, query_terms, top_k, trace, masks) if query_terms else []
+            for query_terms in batch
+        ]
+
+    def _search_segments(
+        self,
+        segments: List[Segment],
+        query_terms: Dict[int, int],
+        top_k: int,
+        trace: Optional[SearchTrace] = None,
+        masks: Optional[List[np.ndarray]] = None
+    ) -> List[Tuple[str, float]]:
+        best: List[Tuple[str, float]] = []
+        for i, segment in enumerate(segments):
+            # Later segments only need to beat the k-th best score found so far
+            threshold = best[-1][1] if len(best) == top_k else None
+            hits = segment.search(
+                query_terms, self.stats, top_k=top_k, k1=self.k1, b=self.b,
+                threshold=threshold, prune=self.prune, trace=trace,
+                allowed=masks[i] if masks is not None else None
+            )
+            candidates = best + [(str(segment.chunk_ids[doc]), score) for doc, score in hits]
+            best = heapq.nlargest(top_k, candidates, key=lambda x: x[1])
+        return best
+
+    # --- Segment bookkeeping ---
+
+    def _new_segment_name(self) -> str:
+        name = f"seg_{self._next_segment:06d}"
+        self._next_segment += 1
+        return name
+
+    def _register(self, segment: Segment):
+        self.segments = self.segments + [segment]
+        self.stats.add(segment)
+
+    # --- Merging ---
+
+    def _maybe_merge(self):
+        """Merges happen within a shard, so every shard stays a slice of the corpus."""
+        with self._lock:
+            if self._merge_thread is not None and self._merge_thread.is_alive():
+                return
+            shards: Dict[int, List[Segment]] = {}
+            for segment in self.segments:
+                shards.setdefault(segment.shard, []).append(segment)
+            crowded = [s for s in shards.values() if len(s) > self.max_segments]
+            if not crowded:
+                return
+            to_merge = sorted(max(crowded, key=len), key=lambda s: s.num_live)[:self.merge_factor]
+            self._merge_thread = threading.Thread(
+                target=self._merge, args=(to_merge,), name="bm25-merge", daemon=True
+            )
+            self._merge_thread.start()
+
+    def _merge(self, to_merge: List[Segment]):
+        try:
+            # Snapshot tombstones; deletes that land while merging are replayed below
+            frozen = [segment.snapshot() for segment in to_merge]
+            snapshot = [segment.deleted for segment in frozen]
+            with self._lock:
+                name = self._new_segment_name()
+            merged = Segment.merge(name, frozen, shard=to_merge[0].shard)
+            write_segment(merged, self.persistence_dir)
+            merged = read_segment(self.persistence_dir, name, shard=merged.shard)
+
+            with self._lock:
+                late_deletes = [
+                    segment.chunk_ids[segment.deleted & ~before]
+                    for segment, before in zip(to_merge, snapshot)
+                ]
+                merged.deleted[merged.find(np.concatenate(late_deletes))] = True
+
+                self.segments = [s for s in self.segments if s not in to_merge]
+                for segment in to_merge:
+                    self.stats.remove(segment)
+                self._register(merged)
+                self._save_manifest()
+                for segment in to_merge:
+                    remove_segment(self.persistence_dir, segment.name)
+        except Exception as e:
+            print(f"BM25 segment merge failed: {e}")
+
+    def wait_for_merges(self):
+        """Block until any background merge has finished."""
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+
+    # --- Persistence ---
+
+    def _save_manifest(self):
+        manifest = {
+            "version": FORMAT_VERSION,
+            "analyzer": self.analyzer.config,
+            "next_segment": self._next_segment,
+            "segments": [
+                {"name": s.name, "shard": s.shard, "deleted": s.deleted.nonzero()[0].tolist()}
+                for s in self.segments
+            ],
+        }
+        path = os.path.join(self.persistence_dir, "manifest.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
 
     def load(self):
-        if os.path.exists(self.persistence_path):
-            try:
-                with open(self.persistence_path, "rb") as f:
-                    data = pickle.load(f)
-                    self.bm25 = data.get("bm25")
-                    self.chunks = data.get("chunks", [])
-            except Exception as e:
-                print(f"Failed to load BM25 index: {e}")
-
-    def search(self, query: str, top_k: int = 5) -> List[tuple[Chunk, float]]:
-        if not self.bm25:
-            return []
-        
-        tokenized_query = self._tokenize(query)
-        scores = self.bm25.get_scores(tokenized_query)
-        
-        # Pair chunks with scores
-        chunk_scores = zip(self.chunks, scores)
-        
-        # Sort by score descending and take top_k
-        sorted_results = sorted(chunk_scores, key=lambda x: x[1], reverse=True)
-        return sorted_results[:top_k]
+        """
+        Open the index in persistence_dir. An index in another format, or one that
+        fails to load, raises instead of starting empty: the next add() would
+        otherwise write new segments and a manifest over the old ones.
+        """
+        manifest_path = os.path.join(self.persistence_dir, "manifest.json")
+        if not os.path.exists(manifest_path):
+            self._load_legacy()
+            return
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        version = manifest.get("version")
+        if version != FORMAT_VERSION:
+            raise RuntimeError(
+                f"BM25 index in {self.persistence_dir} has format {version}, expected {FORMAT_VERSION}. "
+                "Move the directory aside and rebuild the index by re-ingesting or with scripts/build_bm25.py."
+            )
+        if manifest.get("analyzer") != self.analyzer.config:
+            print("Warning: BM25 analyzer settings differ from the ones used to build the index")
+
+        try:
+            segments = []
+            for entry in manifest.get("segments", []):
+                segment = read_segment(self.persistence_dir, entry["name"], shard=entry.get("shard", 0))
+                segment.deleted[entry.get("deleted", [])] = True
+                segments.append(segment)
+        except Exception as e:
+            raise RuntimeError(f"Failed to load BM25 index from {self.persistence_dir}: {e}") from e
+        self._next_segment = manifest.get("next_segment", 0)
+        for segment in segments:
+            self._register(segment)
+
+    def _load_legacy(self):
+        """Import a pre-segment index (single pickle next to persistence_dir), if any."""
+        legacy_path = self.persistence_dir.rstrip("/") + ".pkl"
+        if not os.path.exists(legacy_path):
+            return
+        try:
+            with open(legacy_path, "rb") as f:
+                data = _LegacyUnpickler(f).load()
+            chunks = data.get("chunks", [])
+        except Exception as e:
+            raise RuntimeError(f"Failed to load legacy BM25 index from {legacy_path}: {e}") from e
+        if chunks:
+            print(f"Migrating legacy BM25 index from {legacy_path}")
+            self.add(chunks)
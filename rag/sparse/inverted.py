@@ -0,0 +1,523 @@
+"""
+Inverted Index: BM25 scoring that only touches documents containing query terms.
+
+The index is split into append-only segments. Each segment stores its postings
+in CSR form over integer term ids: terms[r] is the term id of row r (ascending),
+and the doc ids / term frequencies of that row live in
+doc_ids[indptr[r]:indptr[r + 1]] and tfs[indptr[r]:indptr[r + 1]], with doc ids
+ascending. Corpus-wide statistics (document count, average length, document
+frequencies) are kept in CorpusStats and updated as segments come and go.
+
+Every postings row is also cut into blocks of BLOCK_SIZE postings, and each
+block records its last doc id, highest tf and shortest document. That bounds
+the score any document in the block can get from the term, which lets search()
+skip documents that cannot make the top-k (MaxScore with block-max bounds).
+
+Filterable metadata (see rag/retrieval/filters.py) is kept per field as the
+sorted distinct values plus one packed bitmap over the documents per value,
+so a filter costs a few byte-wise ORs and ANDs.
+"""
+import copy
+import heapq
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+BLOCK_SIZE = 128
+
+# Relative slack on upper bounds, so float rounding in the sums can never prune
+# a document that the exhaustive scorer would have kept.
+_BOUND_SLACK = 1e-9
+
+
+@dataclass
+class SearchTrace:
+    """Counters filled in by Segment.search(), for benchmarks and debugging."""
+    postings_total: int = 0
+    postings_scored: int = 0
+
+
+class CorpusStats:
+    """
+    Global BM25 statistics across segments, maintained incrementally.
+
+    Like Lucene, tombstoned documents keep counting towards the statistics until
+    their segment is merged away.
+    """
+
+    def __init__(self):
+        self.num_docs = 0
+        self.total_len = 0
+        self.df = np.zeros(0, dtype=np.int64)  # indexed by term id
+
+    def _grow(self, num_terms: int):
+        if num_terms > len(self.df):
+            df = np.zeros(max(num_terms, 2 * len(self.df)), dtype=np.int64)
+            df[:len(self.df)] = self.df
+            self.df = df
+
+    def add(self, segment: "Segment"):
+        if len(segment.terms):
+            self._grow(int(segment.terms[-1]) + 1)
+        self.df[segment.terms] += np.diff(segment.indptr)
+        self.num_docs += segment.num_docs
+        self.total_len += int(segment.doc_len.sum())
+
+    def remove(self, segment: "Segment"):
+        self.df[segment.terms] -= np.diff(segment.indptr)
+        self.num_docs -= segment.num_docs
+        self.total_len -= int(segment.doc_len.sum())
+
+    @property
+    def avgdl(self) -> float:
+        return self.total_len / self.num_docs if self.num_docs else 0.0
+
+    def idf(self, term_id: int) -> float:
+        """Non-negative Lucene IDF: log(1 + (N - df + 0.5) / (df + 0.5))."""
+        df = int(self.df[term_id]) if term_id < len(self.df) else 0
+        return float(np.log1p((self.num_docs - df + 0.5) / (df + 0.5)))
+
+
+class Segment:
+    """
+    An immutable slice of the corpus with its own postings.
+
+    Deletes only flip a tombstone bit; the postings are rewritten when segments
+    are merged.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        chunk_ids: np.ndarray,
+        terms: np.ndarray,
+        indptr: np.ndarray,
+        doc_ids: np.ndarray,
+        tfs: np.ndarray,
+        doc_len: np.ndarray,
+        deleted: Optional[np.ndarray] = None,
+        shard: int = 0,
+        block_ptr: Optional[np.ndarray] = None,
+        block_last_doc: Optional[np.ndarray] = None,
+        block_max_tf: Optional[np.ndarray] = None,
+        block_min_len: Optional[np.ndarray] = None,
+        fields: Optional[Dict[str, Tuple[np.ndarray, np.ndarray]]] = None
+    ):
+        self.name = name
+        self.shard = shard
+        self.chunk_ids = chunk_ids
+        self.terms = terms
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.deleted = deleted if deleted is not None else np.zeros(len(doc_len), dtype=bool)
+        if block_ptr is None:
+            block_ptr, block_last_doc, block_max_tf, block_min_len = _block_max(indptr, doc_ids, tfs, doc_len)
+        self.block_ptr = block_ptr
+        self.block_last_doc = block_last_doc
+        self.block_max_tf = block_max_tf
+        self.block_min_len = block_min_len
+        # field -> (sorted distinct values, packed bitmap [num_values, ceil(num_docs / 8)])
+        self.fields = fields or {}
+        self._norm_cache: Tuple[Optional[tuple], Optional[np.ndarray]] = (None, None)
+
+    @classmethod
+    def from_tokens(
+        cls,
+        name: str,
+        chunk_ids: List[str],
+        corpus: List[List[int]],
+        shard: int = 0,
+        fields: Optional[Dict[str, List[str]]] = None
+    ) -> "Segment":
+        """
+        Build a segment where local document i has term ids corpus[i], id chunk_ids[i]
+        and filterable values fields[field][i].
+        """
+        posting_terms, posting_docs, posting_tfs = [], [], []
+        for doc_id, term_ids in enumerate(corpus):
+            for term_id, tf in Counter(term_ids).items():
+                posting_terms.append(term_id)
+                posting_docs.append(doc_id)
+                posting_tfs.append(tf)
+
+        doc_len = np.fromiter((len(t) for t in corpus), dtype=np.int32, count=len(corpus))
+        return cls._from_postings(
+            name,
+            np.array(chunk_ids, dtype=str),
+            np.asarray(posting_terms, dtype=np.int32),
+            np.asarray(posting_docs, dtype=np.int32),
+            np.asarray(posting_tfs, dtype=np.int32),
+            doc_len,
+            shard,
+            {field: np.array(values, dtype=str) for field, values in (fields or {}).items()}
+        )
+
+    @classmethod
+    def merge(cls, name: str, segments: List["Segment"], shard: int = 0) -> "Segment":
+        """Merge segments into one, dropping tombstoned documents."""
+        chunk_ids, doc_lens = [], []
+        posting_terms, posting_docs, posting_tfs = [], [], []
+        offset = 0
+        # A field any segment has is kept; documents from segments without it get ""
+        field_names = set().union(*(s.fields for s in segments))
+        field_values: Dict[str, List[np.ndarray]] = {field: [] for field in sorted(field_names)}
+
+        for segment in segments:
+            live = ~segment.deleted
+            remap = np.full(segment.num_docs, -1, dtype=np.int64)
+            remap[live] = np.arange(int(live.sum())) + offset
+            chunk_ids.append(segment.chunk_ids[live])
+            doc_lens.append(segment.doc_len[live])
+            for field, values in field_values.items():
+                if field in segment.fields:
+                    values.append(segment.field_values(field)[live])
+                else:
+                    values.append(np.full(int(live.sum()), "", dtype=str))
+
+            docs = remap[segment.doc_ids]
+            keep = docs >= 0
+            posting_terms.append(np.repeat(segment.terms, np.diff(segment.indptr))[keep])
+            posting_docs.append(docs[keep])
+            posting_tfs.append(segment.tfs[keep])
+            offset += int(live.sum())
+
+        return cls._from_postings(
+            name,
+            np.concatenate(chunk_ids) if chunk_ids else np.array([], dtype=str),
+            _concat(posting_terms, np.int32),
+            _concat(posting_docs, np.int32),
+            _concat(posting_tfs, np.int32),
+            _concat(doc_lens, np.int32),
+            shard,
+            {field: np.concatenate(values) for field, values in field_values.items()}
+        )
+
+    @classmethod
+    def _from_postings(
+        cls,
+        name: str,
+        chunk_ids: np.ndarray,
+        posting_terms: np.ndarray,
+        posting_docs: np.ndarray,
+        posting_tfs: np.ndarray,
+        doc_len: np.ndarray,
+        shard: int = 0,
+        field_values: Optional[Dict[str, np.ndarray]] = None
+    ) -> "Segment":
+        """Build the CSR layout from flat (term, doc, tf) postings, and the field bitmaps."""
+        order = np.lexsort((posting_docs, posting_terms))
+        posting_terms = posting_terms[order]
+        terms, counts = np.unique(posting_terms, return_counts=True)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(
+            name, chunk_ids, terms.astype(np.int32), indptr,
+            posting_docs[order].astype(np.int32), posting_tfs[order].astype(np.int32), doc_len,
+            shard=shard,
+            fields={field: _field_bitmaps(values) for field, values in (field_values or {}).items()}
+        )
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_len)
+
+    @property
+    def num_live(self) -> int:
+        return self.num_docs - int(self.deleted.sum())
+
+    def snapshot(self) -> "Segment":
+        """Shallow copy with its own tombstones, for merging while deletes continue."""
+        segment = copy.copy(self)
+        segment.deleted = self.deleted.copy()
+        return segment
+
+    def field_values(self, field: str) -> np.ndarray:
+        """Per-document values of a field, decoded from the bitmaps."""
+        values, bitmap = self.fields[field]
+        codes = np.zeros(self.num_docs, dtype=np.int64)
+        for code in range(len(values)):
+            codes[np.unpackbits(bitmap[code], count=self.num_docs).astype(bool)] = code
+        return values[codes] if len(values) else np.full(self.num_docs, "", dtype=str)
+
+    def filter_mask(self, filters: Dict[str, List[str]]) -> np.ndarray:
+        """Boolean mask of documents matching all filters (values within a field are ORed)."""
+        packed = np.full((self.num_docs + 7) // 8, 0xFF, dtype=np.uint8)
+        for field, wanted in filters.items():
+            if field not in self.fields:
+                return np.zeros(self.num_docs, dtype=bool)
+            values, bitmap = self.fields[field]
+            rows = np.searchsorted(values, wanted)
+            rows = rows[rows < len(values)]
+            rows = rows[np.isin(values[rows], wanted)]
+            if len(rows) == 0:
+                return np.zeros(self.num_docs, dtype=bool)
+            packed &= np.bitwise_or.reduce(bitmap[rows], axis=0)
+        return np.unpackbits(packed, count=self.num_docs).astype(bool)
+
+    def find(self, chunk_ids: List[str]) -> np.ndarray:
+        """Local doc ids of the given chunk ids that live in this segment."""
+        return np.isin(self.chunk_ids, chunk_ids).nonzero()[0]
+
+    def _row(self, term_id: int) -> int:
+        """Postings row of a term id, or -1 if no document in the segment has it."""
+        row = int(np.searchsorted(self.terms, term_id))
+        if row == len(self.terms) or self.terms[row] != term_id:
+            return -1
+        return row
+
+    def _row_postings(self, row: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return self.doc_ids[start:end], self.tfs[start:end]
+
+    def postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(doc ids, term frequencies) for a term id; empty arrays if absent."""
+        row = self._row(term_id)
+        if row < 0:
+            return self.doc_ids[:0], self.tfs[:0]
+        return self._row_postings(row)
+
+    def _doc_norm(self, avgdl: float, k1: float, b: float) -> np.ndarray:
+        """k1 * (1 - b + b * dl / avgdl), recomputed only when the corpus average changes."""
+        key, norm = self._norm_cache
+        if key != (avgdl, k1, b):
+            norm = _length_norm(self.doc_len, avgdl, k1, b)
+            self._norm_cache = ((avgdl, k1, b), norm)
+        return norm
+
+    def _block_bounds(self, row: int, weight: float, avgdl: float, k1: float, b: float) -> np.ndarray:
+        """Highest score each block of a postings row can contribute."""
+        start, end = self.block_ptr[row], self.block_ptr[row + 1]
+        max_tf = self.block_max_tf[start:end].astype(np.float64)
+        return _bm25(weight, max_tf, _length_norm(self.block_min_len[start:end], avgdl, k1, b), k1)
+
+    def search(
+        self,
+        query_terms: Dict[int, int],
+        stats: CorpusStats,
+        top_k: int = 5,
+        k1: float = 1.5,
+        b: float = 0.75,
+        threshold: Optional[float] = None,
+        prune: bool = True,
+        trace: Optional[SearchTrace] = None,
+        allowed: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Score live documents sharing at least one term with the query.
+
+        Args:
+            query_terms: term id -> frequency in the query.
+            stats: Corpus-wide statistics used for IDF and length normalisation.
+            threshold: Score a document has to reach to matter to the caller,
+                e.g. the k-th best score of segments searched before this one.
+            prune: Skip documents that cannot make the top_k (MaxScore).
+            trace: Optional counters of postings seen and scored.
+            allowed: Optional mask of documents that pass the metadata filters.
+
+        Returns up to top_k (local doc id, score) pairs, best first. Pruning
+        never changes the results, only how many postings are scored.
+        """
+        doc_norm = self._doc_norm(stats.avgdl, k1, b)
+
+        # The term order depends only on the query and corpus statistics, so every
+        # document's score is summed in the same order whatever the segment layout.
+        weighted = sorted(
+            ((qtf * stats.idf(term_id), term_id) for term_id, qtf in query_terms.items()),
+            key=lambda t: (-t[0], t[1])
+        )
+        rows = [(weight, row) for weight, row in ((w, self._row(t)) for w, t in weighted) if row >= 0]
+        if not rows:
+            return []
+
+        excluded = self.deleted
+        num_postings = sum(int(self.indptr[row + 1] - self.indptr[row]) for _, row in rows)
+        if allowed is not None:
+            allowed = allowed & ~self.deleted
+            num_allowed = int(np.count_nonzero(allowed))
+            if num_allowed == 0:
+                return []
+            excluded = ~allowed
+
+        if allowed is not None and num_allowed * np.log2(num_postings + 2) < num_postings:
+            # Selective filter: look the allowed documents up in each postings row
+            # instead of walking the rows
+            docs, scores, scored = self._score_docs(rows, doc_norm, k1, np.flatnonzero(allowed))
+        elif prune and len(rows) > 1:
+            docs, scores, scored = self._score_maxscore(rows, doc_norm, stats.avgdl, top_k, k1, b, threshold, excluded)
+        else:
+            docs, scores, scored = self._score_exhaustive(rows, doc_norm, k1, excluded)
+
+        if trace is not None:
+            trace.postings_total += num_postings
+            trace.postings_scored += scored
+
+        best = heapq.nlargest(top_k, range(len(docs)), key=scores.__getitem__)
+        return [(int(docs[i]), float(scores[i])) for i in best]
+
+    def _score_exhaustive(
+        self,
+        rows: List[Tuple[float, int]],
+        doc_norm: np.ndarray,
+        k1: float,
+        excluded: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, int]:
+        """Score every posting of every query term."""
+        matched_ids = []
+        contributions = []
+        for weight, row in rows:
+            ids, tfs = self._row_postings(row)
+            matched_ids.append(ids)
+            contributions.append(_bm25(weight, tfs.astype(np.float64), doc_norm[ids], k1))
+
+        # Accumulate per matched document only
+        docs, slots = np.unique(np.concatenate(matched_ids), return_inverse=True)
+        scores = np.bincount(slots, weights=np.concatenate(contributions), minlength=len(docs))
+
+        live = ~excluded[docs]
+        if not live.all():
+            docs, scores = docs[live], scores[live]
+        return docs, scores, sum(len(ids) for ids in matched_ids)
+
+    def _score_docs(
+        self,
+        rows: List[Tuple[float, int]],
+        doc_norm: np.ndarray,
+        k1: float,
+        docs: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, int]:
+        """Score only the given (sorted) documents, by binary search in each postings row."""
+        scores = np.zeros(len(docs))
+        matched = np.zeros(len(docs), dtype=bool)
+        scored = 0
+        for weight, row in rows:
+            ids, tfs = self._row_postings(row)
+            pos = np.minimum(np.searchsorted(ids, docs), len(ids) - 1)
+            hit = ids[pos] == docs
+            scores[hit] += _bm25(weight, tfs[pos[hit]].astype(np.float64), doc_norm[docs[hit]], k1)
+            matched |= hit
+            scored += int(np.count_nonzero(hit))
+        return docs[matched], scores[matched], scored
+
+    def _score_maxscore(
+        self,
+        rows: List[Tuple[float, int]],
+        doc_norm: np.ndarray,
+        avgdl: float,
+        top_k: int,
+        k1: float,
+        b: float,
+        threshold: Optional[float],
+        excluded: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        MaxScore: score terms one at a time, keeping theta, the k-th best score
+        so far. Once the terms left can add less than theta, unseen documents
+        are out of reach and only the current candidates are scored further.
+        Candidates are dropped as soon as their score plus the block-max bounds
+        of the remaining terms falls below theta.
+        """
+        bounds = [self._block_bounds(row, weight, avgdl, k1, b) for weight, row in rows]
+        upper = np.array([bound.max() for bound in bounds])
+        # remaining[i]: the most that terms after i can add to any document
+        remaining = np.append(np.cumsum(upper[::-1])[::-1][1:], 0.0) * (1 + _BOUND_SLACK)
+
+        acc = np.zeros(self.num_docs)
+        seen = np.zeros(self.num_docs, dtype=bool)
+        touched: List[np.ndarray] = []
+        theta = -np.inf if threshold is None else threshold
+        candidates: Optional[np.ndarray] = None
+        scored = 0
+
+        for i, (weight, row) in enumerate(rows):
+            ids, tfs = self._row_postings(row)
+            if candidates is None:
+                acc[ids] += _bm25(weight, tfs.astype(np.float64), doc_norm[ids], k1)
+                scored += len(ids)
+                new = ids[~seen[ids]]
+                seen[new] = True
+                touched.append(new)
+                docs = np.concatenate(touched)
+                docs = docs[~excluded[docs]]
+                theta = max(theta, _kth_largest(acc[docs], top_k))
+                if remaining[i] < theta:
+                    docs.sort()
+                    candidates = docs[acc[docs] + remaining[i] >= theta]
+                continue
+
+            # Block-max bound of this term for each candidate (0 past the last block)
+            start, end = self.block_ptr[row], self.block_ptr[row + 1]
+            blocks = np.searchsorted(self.block_last_doc[start:end], candidates)
+            term_bound = np.append(bounds[i], 0.0)[blocks] * (1 + _BOUND_SLACK)
+            candidates = candidates[acc[candidates] + term_bound + remaining[i] >= theta]
+
+            pos = np.minimum(np.searchsorted(ids, candidates), len(ids) - 1)
+            hit = ids[pos] == candidates
+            docs = candidates[hit]
+            acc[docs] += _bm25(weight, tfs[pos[hit]].astype(np.float64), doc_norm[docs], k1)
+            scored += len(docs)
+
+            theta = max(theta, _kth_largest(acc[candidates], top_k))
+            candidates = candidates[acc[candidates] + remaining[i] >= theta]
+
+        if candidates is None:
+            candidates = np.sort(docs)
+        return candidates, acc[candidates], scored
+
+
+def _length_norm(doc_len: np.ndarray, avgdl: float, k1: float, b: float) -> np.ndarray:
+    return k1 * (1 - b + b * doc_len / avgdl) if avgdl else np.full(len(doc_len), k1)
+
+
+def _bm25(weight: float, tf: np.ndarray, norm: np.ndarray, k1: float) -> np.ndarray:
+    return weight * tf * (k1 + 1) / (tf + norm)
+
+
+def _kth_largest(values: np.ndarray, k: int) -> float:
+    if len(values) < k:
+        return -np.inf
+    return float(np.partition(values, len(values) - k)[len(values) - k])
+
+
+def _field_bitmaps(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted distinct values and a packed bitmap row per value (bit i = document i)."""
+    distinct, codes = np.unique(values, return_inverse=True)
+    docs = np.arange(len(values))
+    bitmap = np.zeros((len(distinct), (len(values) + 7) // 8), dtype=np.uint8)
+    # np.packbits order: the first document is the most significant bit of byte 0
+    np.bitwise_or.at(bitmap, (codes, docs >> 3), (1 << (7 - (docs & 7))).astype(np.uint8))
+    return distinct, bitmap
+
+
+def _block_max(
+    indptr: np.ndarray,
+    doc_ids: np.ndarray,
+    tfs: np.ndarray,
+    doc_len: np.ndarray,
+    block_size: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Cut each postings row into blocks: (block_ptr, last doc id, max tf, min doc length)."""
+    block_size = block_size or BLOCK_SIZE
+    counts = np.diff(indptr)
+    block_ptr = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum((counts + block_size - 1) // block_size, out=block_ptr[1:])
+    if block_ptr[-1] == 0:
+        empty = np.zeros(0, dtype=np.int32)
+        return block_ptr, empty, empty, empty
+
+    # Blocks tile the postings array, so each block runs up to the next one's start
+    row_of_block = np.repeat(np.arange(len(counts)), np.diff(block_ptr))
+    starts = indptr[:-1][row_of_block] + (np.arange(block_ptr[-1]) - block_ptr[row_of_block]) * block_size
+    ends = np.append(starts[1:], len(doc_ids))
+    return (
+        block_ptr,
+        np.asarray(doc_ids[ends - 1], dtype=np.int32),
+        np.maximum.reduceat(tfs, starts).astype(np.int32),
+        np.minimum.reduceat(doc_len[doc_ids], starts).astype(np.int32),
+    )
+
+
+def _concat(arrays: List[np.ndarray], dtype) -> np.ndarray:
+    return np.concatenate(arrays).astype(dtype) if arrays else np.zeros(0, dtype=dtype)
@@ -0,0 +1,91 @@
+"""
+Columnar on-disk format for BM25 segments.
+
+Each segment is a directory of flat arrays that are opened with numpy.memmap,
+so loading is near-instant and worker processes share pages through the OS
+page cache:
+
+    <segment>/
+        meta.json        format version and sizes
+        terms.npy        int32 [num_terms]       term id of each postings row (ascending)
+        indptr.npy       int64 [num_terms + 1]   CSR row offsets
+        doc_ids.npy      int32 [num_postings]    local doc id per posting
+        tfs.npy          int32 [num_postings]    term frequency per posting
+        doc_len.npy      int32 [num_docs]        document lengths
+        chunk_ids.npy    unicode [num_docs]      chunk id per local doc
+        block_ptr.npy    int64 [num_terms + 1]   row offsets into the block arrays
+        block_last_doc.npy  int32 [num_blocks]   last doc id of each postings block
+        block_max_tf.npy    int32 [num_blocks]   highest tf in the block
+        block_min_len.npy   int32 [num_blocks]   shortest document in the block
+        field_<f>_values.npy  unicode [num_values]            distinct values of filter field f
+        field_<f>_bitmap.npy  uint8 [num_values, num_docs/8]  packed bitmap of the docs per value
+
+Term ids refer to the index-wide vocabulary (rag/sparse/analyzer.py). Neither
+chunk content nor dense vectors are stored; callers resolve chunk ids against
+the vector store.
+"""
+import json
+import os
+import shutil
+import numpy as np
+from rag.sparse.inverted import Segment
+
+FORMAT_VERSION = 5
+
+ARRAYS = ("terms", "indptr", "doc_ids", "tfs", "doc_len", "chunk_ids")
+BLOCK_ARRAYS = ("block_ptr", "block_last_doc", "block_max_tf", "block_min_len")
+
+
+def write_segment(segment: Segment, directory: str):
+    """Write a segment atomically (to a temp dir, then rename)."""
+    path = os.path.join(directory, segment.name)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    for array in ARRAYS + BLOCK_ARRAYS:
+        np.save(os.path.join(tmp_path, f"{array}.npy"), np.ascontiguousarray(getattr(segment, array)))
+    for field, (values, bitmap) in segment.fields.items():
+        np.save(os.path.join(tmp_path, f"field_{field}_values.npy"), values)
+        np.save(os.path.join(tmp_path, f"field_{field}_bitmap.npy"), np.ascontiguousarray(bitmap))
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({
+            "version": FORMAT_VERSION,
+            "num_docs": segment.num_docs,
+            "num_terms": int(len(segment.terms)),
+            "num_postings": int(len(segment.doc_ids)),
+            "fields": sorted(segment.fields),
+        }, f)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+
+def read_segment(directory: str, name: str, shard: int = 0) -> Segment:
+    """Open a segment with its arrays memory-mapped read-only."""
+    path = os.path.join(directory, name)
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported BM25 segment format {meta.get('version')} in {path}")
+
+    arrays = {
+        array: np.load(os.path.join(path, f"{array}.npy"), mmap_mode="r")
+        for array in ARRAYS + BLOCK_ARRAYS
+    }
+    fields = {
+        field: (
+            np.load(os.path.join(path, f"field_{field}_values.npy")),
+            np.load(os.path.join(path, f"field_{field}_bitmap.npy"), mmap_mode="r"),
+        )
+        for field in meta.get("fields", [])
+    }
+    return Segment(name, shard=shard, fields=fields, **arrays)
+
+
+def remove_segment(directory: str, name: str):
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        shutil.rmtree(path)
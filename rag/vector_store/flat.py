@@ -0,0 +1,311 @@
+"""
+Flat Vector Store: an embedded, memory-mapped alternative to the Qdrant server.
+
+For single-node deployments and tests the network hop to Qdrant dominates
+dense-search latency on small and medium corpora. FlatVectorStore keeps every
+vector in one memory-mapped matrix and answers queries by brute force: a
+matrix product against the (normalised) query batch and an argpartition
+top-k. Search is exact, so there is no index to build or tune.
+
+    <persistence_dir>/
+        meta.json       format version, dimension, dtype and number of rows
+        vectors.npy     float16|float32 [capacity, dim]  L2-normalised rows (cosine = dot)
+        records.jsonl   {"row", "id", "payload"} per write; the last line for a row wins
+
+It exposes the QdrantService interface used by retrieval and ingestion
+(upsert_chunks, search, search_batch, retrieve) and returns qdrant_client
+models, so RetrievalService does not know which backend it talks to. Filters
+(models.Filter from rag/retrieval/filters.py) are evaluated as NumPy masks
+over per-field value codes kept in memory.
+
+Searches take a snapshot of the row count, the matrix and the id and payload
+lists under the lock, then score without it. Upserts replace those lists
+rather than mutating them (copy-on-write), so a running search never sees ids
+or payloads from a later write. An overwritten row's vector is rewritten in
+place, so a search that overlaps the overwrite may score that row against
+either the old or the new vector.
+"""
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from qdrant_client.http import models
+from rag.ingestion.models import Chunk
+from rag.retrieval.filters import FILTER_FIELDS
+from rag.vector_store.qdrant import chunk_payload, chunk_vectors
+
+FORMAT_VERSION = 1
+
+# Rows scored per matrix product; bounds the float32 copy of a float16 block
+SCAN_BLOCK = 65536
+MIN_CAPACITY = 1024
+
+
+class FlatVectorStore:
+    def __init__(
+        self,
+        persistence_dir: str = "data/flat_vectors",
+        vector_size: int = 384,
+        dtype: str = "float32"
+    ):
+        if dtype not in ("float16", "float32"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}. Use float16 or float32.")
+        self.persistence_dir = persistence_dir
+        self.vector_size = vector_size
+        self.dtype = np.dtype(dtype)
+
+        self.count = 0
+        self._vectors: Optional[np.ndarray] = None  # memmap [capacity, dim]
+        self._ids: List[str] = []
+        self._payloads: List[dict] = []
+        self._rows: Dict[str, int] = {}
+        # Filter columns: field -> (value -> code, int32 code per row)
+        self._values: Dict[str, Dict[str, int]] = {field: {} for field in FILTER_FIELDS}
+        self._codes: Dict[str, np.ndarray] = {field: np.zeros(0, dtype=np.int32) for field in FILTER_FIELDS}
+        self._record_lines = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(persistence_dir, exist_ok=True)
+        self.load()
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.persistence_dir, "vectors.npy")
+
+    @property
+    def _records_path(self) -> str:
+        return os.path.join(self.persistence_dir, "records.jsonl")
+
+    def load(self):
+        meta_path = os.path.join(self.persistence_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported flat vector store format {meta.get('version')} in {self.persistence_dir}")
+        if meta["dim"] != self.vector_size:
+            raise ValueError(
+                f"Flat vector store in {self.persistence_dir} holds {meta['dim']}-d vectors, "
+                f"expected {self.vector_size}"
+            )
+        self.dtype = np.dtype(meta["dtype"])
+        self._vectors = np.lib.format.open_memmap(self._vectors_path, mode="r+")
+
+        # Rows past meta["count"] belong to an upsert that did not finish
+        count = meta["count"]
+        ids: List[Optional[str]] = [None] * count
+        payloads: List[Optional[dict]] = [None] * count
+        lines = 0
+        if os.path.exists(self._records_path):
+            with open(self._records_path) as f:
+                for line in f:
+                    lines += 1
+                    record = json.loads(line)
+                    if record["row"] < count:
+                        ids[record["row"]] = record["id"]
+                        payloads[record["row"]] = record["payload"]
+        if any(i is None for i in ids):
+            raise ValueError(f"Flat vector store in {self.persistence_dir} is missing records")
+
+        self._record_lines = lines
+        self._reserve_columns(len(self._vectors))
+        for row, (point_id, payload) in enumerate(zip(ids, payloads)):
+            self._set_row(row, point_id, payload)
+        self.count = count
+        print(f"Loaded flat vector store: {count} vectors ({self.dtype.name}) from {self.persistence_dir}")
+
+    def _save_meta(self):
+        path = os.path.join(self.persistence_dir, "meta.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "version": FORMAT_VERSION,
+                "dim": self.vector_size,
+                "dtype": self.dtype.name,
+                "count": self.count,
+            }, f)
+        os.replace(tmp_path, path)
+
+    def _reserve(self, rows: int):
+        """Grow the vector file (doubling) so it holds at least `rows` rows."""
+        capacity = 0 if self._vectors is None else len(self._vectors)
+        if rows <= capacity:
+            return
+        capacity = max(rows, 2 * capacity, MIN_CAPACITY)
+        tmp_path = self._vectors_path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=self.dtype, shape=(capacity, self.vector_size))
+        if self.count:
+            grown[:self.count] = self._vectors[:self.count]
+        grown.flush()
+        del grown
+        # Searches still holding the old mapping keep reading the unlinked file
+        os.replace(tmp_path, self._vectors_path)
+        self._vectors = np.lib.format.open_memmap(self._vectors_path, mode="r+")
+        self._reserve_columns(capacity)
+
+    def _reserve_columns(self, capacity: int):
+        for field, codes in self._codes.items():
+            if len(codes) < capacity:
+                grown = np.full(capacity, -1, dtype=np.int32)
+                grown[:len(codes)] = codes
+                self._codes[field] = grown
+
+    def _set_row(self, row: int, point_id: str, payload: dict):
+        if row == len(self._ids):
+            self._ids.append(point_id)
+            self._payloads.append(payload)
+        else:
+            self._rows.pop(self._ids[row], None)
+            self._ids[row] = point_id
+            self._payloads[row] = payload
+        self._rows[point_id] = row
+        for field in FILTER_FIELDS:
+            values = self._values[field]
+            value = str(payload.get(field, ""))
+            self._codes[field][row] = values.setdefault(value, len(values))
+
+    def _compact_records(self):
+        """Rewrite records.jsonl with one line per row once overwrites have doubled it."""
+        tmp_path = self._records_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for row in range(self.count):
+                f.write(json.dumps({"row": row, "id": self._ids[row], "payload": self._payloads[row]}, default=str) + "\n")
+        os.replace(tmp_path, self._records_path)
+        self._record_lines = self.count
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def upsert_chunks(self, chunks: List[Chunk], vectors: Optional[np.ndarray] = None):
+        """
+        Insert or overwrite chunks by id, with vectors given as a float32 (n, d)
+        matrix or taken from Chunk.vector (see QdrantService.upsert_chunks).
+
+        Vectors are written to the mapped file first, then their records, then
+        meta.json. New rows only become visible (and survive a restart) once
+        all three are on disk. Overwritten rows are rewritten in place: a crash
+        after the vector flush but before the record line leaves the row with
+        its new vector and its previous payload, until the chunk is upserted again.
+        """
+        chunks, vectors = chunk_vectors(chunks, vectors)
+        if not chunks:
+            return
+        vectors = self._normalize(vectors)
+        if vectors.shape[1] != self.vector_size:
+            raise ValueError(f"Expected {self.vector_size}-d vectors, got {vectors.shape[1]}-d")
+
+        with self._lock:
+            rows, assigned, next_row = [], {}, self.count
+            for chunk in chunks:
+                row = self._rows.get(chunk.id, assigned.get(chunk.id))
+                if row is None:
+                    row = assigned[chunk.id] = next_row
+                    next_row += 1
+                rows.append(row)
+            self._reserve(next_row)
+
+            self._vectors[rows] = vectors.astype(self.dtype)
+            self._vectors.flush()
+            payloads = [chunk_payload(chunk) for chunk in chunks]
+            with open(self._records_path, "a") as f:
+                for chunk, row, payload in zip(chunks, rows, payloads):
+                    f.write(json.dumps({"row": row, "id": chunk.id, "payload": payload}, default=str) + "\n")
+            self._record_lines += len(chunks)
+
+            # Copy-on-write: searches keep reading the lists they took a snapshot of
+            self._ids, self._payloads = list(self._ids), list(self._payloads)
+            for chunk, row, payload in zip(chunks, rows, payloads):
+                self._set_row(row, chunk.id, payload)
+            self.count = next_row
+            self._save_meta()
+            if self._record_lines > 2 * max(self.count, MIN_CAPACITY):
+                self._compact_records()
+
+    def _filter_mask(self, query_filter: Optional[models.Filter], count: int) -> Optional[np.ndarray]:
+        """Rows matching every `must` condition, or None when unfiltered."""
+        if query_filter is None:
+            return None
+        if query_filter.should or query_filter.must_not or query_filter.min_should:
+            raise ValueError("FlatVectorStore only supports 'must' filter conditions")
+        mask = np.ones(count, dtype=bool)
+        for condition in query_filter.must or []:
+            if not isinstance(condition, models.FieldCondition) or condition.key not in self._codes:
+                raise ValueError(f"FlatVectorStore cannot filter on {condition}")
+            match = condition.match
+            if isinstance(match, models.MatchValue):
+                accepted = [match.value]
+            elif isinstance(match, models.MatchAny):
+                accepted = match.any
+            else:
+                raise ValueError(f"FlatVectorStore only supports MatchValue and MatchAny, got {type(match).__name__}")
+            values = self._values[condition.key]
+            codes = [values[str(v)] for v in accepted if str(v) in values]
+            mask &= np.isin(self._codes[condition.key][:count], codes)
+        return mask
+
+    def search(
+        self,
+        query_vector: List[float],
+        limit: int = 5,
+        query_filter: Optional[models.Filter] = None
+    ) -> List[models.ScoredPoint]:
+        return self.search_batch([query_vector], limit=limit, query_filter=query_filter)[0]
+
+    def search_batch(
+        self,
+        query_vectors: List[List[float]],
+        limit: int = 5,
+        query_filter: Optional[models.Filter] = None
+    ) -> List[List[models.ScoredPoint]]:
+        """
+        Exact cosine search for a batch of queries; results are in query order.
+
+        The matrix is scanned in blocks of SCAN_BLOCK rows (only the rows
+        allowed by the filter). Each block keeps its own top-k per query via
+        argpartition, and the block winners are sorted once at the end.
+        """
+        if not query_vectors:
+            return []
+        queries = self._normalize(np.asarray(query_vectors, dtype=np.float32))
+        with self._lock:
+            count, matrix, ids, payloads = self.count, self._vectors, self._ids, self._payloads
+            mask = self._filter_mask(query_filter, count)
+        candidates = np.flatnonzero(mask) if mask is not None else None
+        total = count if candidates is None else len(candidates)
+        k = min(limit, total)
+        if k <= 0:
+            return [[] for _ in query_vectors]
+
+        block_scores, block_rows = [], []
+        for start in range(0, total, SCAN_BLOCK):
+            stop = min(start + SCAN_BLOCK, total)
+            rows = np.arange(start, stop) if candidates is None else candidates[start:stop]
+            block = matrix[start:stop] if candidates is None else matrix[rows]
+            scores = block.astype(np.float32, copy=False) @ queries.T  # [rows, queries]
+            kk = min(k, stop - start)
+            top = np.argpartition(-scores, kk - 1, axis=0)[:kk]
+            block_scores.append(np.take_along_axis(scores, top, axis=0))
+            block_rows.append(rows[top])
+        scores = np.concatenate(block_scores)
+        rows = np.concatenate(block_rows)
+        order = np.argsort(-scores, axis=0, kind="stable")[:k]
+
+        results = []
+        for q in range(len(query_vectors)):
+            results.append([
+                models.ScoredPoint(
+                    id=ids[row], version=0, score=float(scores[i, q]), payload=payloads[row]
+                )
+                for i, row in ((i, int(rows[i, q])) for i in order[:, q])
+            ])
+        return results
+
+    def retrieve(self, ids: List[str]) -> List[models.Record]:
+        """Fetch points (payload only) by id; unknown ids are skipped."""
+        with self._lock:
+            rows = [self._rows[point_id] for point_id in ids if point_id in self._rows]
+            return [models.Record(id=self._ids[row], payload=self._payloads[row]) for row in rows]
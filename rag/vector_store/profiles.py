@@ -0,0 +1,85 @@
+"""
+Collection Profiles: named Qdrant tuning presets.
+
+A profile sets how the collection is built (HNSW graph, quantization, what
+lives on disk) and how it is searched (hnsw_ef, exact, quantization rescoring):
+
+    default       Qdrant defaults, float32 vectors in RAM
+    low-latency   int8 scalar quantization in RAM, rescored with the originals
+    low-memory    binary quantization in RAM, originals and payloads on disk
+    max-recall    denser graph and wide search beam, no quantization
+
+Build settings only apply when the collection is created (or through
+QdrantService.apply_profile); search settings apply to every query.
+"""
+from dataclasses import dataclass
+from typing import Dict, Optional
+from qdrant_client.http import models
+
+
+@dataclass(frozen=True)
+class CollectionProfile:
+    name: str
+    # Build
+    m: Optional[int] = None
+    ef_construct: Optional[int] = None
+    quantization: Optional[str] = None  # None | "scalar" | "binary"
+    on_disk_vectors: bool = False
+    on_disk_payload: bool = False
+    # Search
+    hnsw_ef: Optional[int] = None
+    exact: bool = False
+    rescore: bool = True
+    oversampling: Optional[float] = None
+
+    def hnsw_config(self) -> Optional[models.HnswConfigDiff]:
+        if self.m is None and self.ef_construct is None:
+            return None
+        return models.HnswConfigDiff(m=self.m, ef_construct=self.ef_construct)
+
+    def quantization_config(self) -> Optional[models.QuantizationConfig]:
+        if self.quantization == "scalar":
+            return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+            ))
+        if self.quantization == "binary":
+            return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+        return None
+
+    def vectors_config(self, size: int) -> models.VectorParams:
+        return models.VectorParams(
+            size=size,
+            distance=models.Distance.COSINE,
+            on_disk=self.on_disk_vectors or None,
+            hnsw_config=self.hnsw_config(),
+            quantization_config=self.quantization_config()
+        )
+
+    def search_params(self) -> Optional[models.SearchParams]:
+        quantization = None
+        if self.quantization is not None:
+            quantization = models.QuantizationSearchParams(rescore=self.rescore, oversampling=self.oversampling)
+        if self.hnsw_ef is None and not self.exact and quantization is None:
+            return None
+        return models.SearchParams(hnsw_ef=self.hnsw_ef, exact=self.exact, quantization=quantization)
+
+
+PROFILES: Dict[str, CollectionProfile] = {
+    "default": CollectionProfile(name="default"),
+    "low-latency": CollectionProfile(
+        name="low-latency", m=16, ef_construct=100, quantization="scalar",
+        hnsw_ef=64, rescore=True, oversampling=1.5
+    ),
+    "low-memory": CollectionProfile(
+        name="low-memory", m=16, ef_construct=100, quantization="binary",
+        on_disk_vectors=True, on_disk_payload=True,
+        hnsw_ef=128, rescore=True, oversampling=3.0
+    ),
+    "max-recall": CollectionProfile(name="max-recall", m=32, ef_construct=400, hnsw_ef=256),
+}
+
+
+def get_profile(name: str) -> CollectionProfile:
+    if name not in PROFILES:
+        raise ValueError(f"Unknown collection profile: {name}. Available: {', '.join(PROFILES)}")
+    return PROFILES[name]
@@ -1,14 +1,98 @@
-from typing import List, Optional
-from qdrant_client import QdrantClient
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+import httpx
+import numpy as np
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.http import models
 from rag.ingestion.models import Chunk
+from rag.retrieval.filters import FILTER_FIELDS
+from rag.vector_store.profiles import CollectionProfile, get_profile
+from rag.sparse.encoder import SPARSE_VECTOR_NAME, SparseEncoder
+from apps.api.settings import settings
 import os
 
+
+def chunk_payload(chunk: Chunk) -> dict:
+    """Payload stored with a chunk's vector; RetrievalService rebuilds ScoredChunks from it."""
+    return {
+        "content": chunk.content,
+        "doc_id": chunk.doc_id,
+        "chunk_index": chunk.chunk_index,
+        **chunk.metadata
+    }
+
+
+def chunk_vectors(chunks: List[Chunk], vectors: Optional[np.ndarray] = None) -> Tuple[List[Chunk], np.ndarray]:
+    """
+    Chunks with their vectors as one contiguous float32 (n, d) matrix. Without
+    a matrix, vectors are taken from Chunk.vector and chunks lacking one are dropped.
+    """
+    if vectors is None:
+        chunks = [chunk for chunk in chunks if chunk.vector is not None]
+        vectors = np.asarray([chunk.vector for chunk in chunks], dtype=np.float32)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)  # no copy when it already is
+    if len(vectors) != len(chunks):
+        raise ValueError(f"Got {len(vectors)} vectors for {len(chunks)} chunks")
+    return chunks, vectors
+
+
+def hybrid_request(
+    profile: CollectionProfile,
+    query_vector: Optional[List[float]],
+    sparse_vector: Optional[models.SparseVector],
+    limit: int,
+    prefetch_limit: int,
+    query_filter: Optional[models.Filter],
+    fusion: models.Fusion
+) -> models.QueryRequest:
+    """
+    One query running the dense and sparse legs as prefetches, fused by Qdrant.
+    A leg is left out when its vector is None; a single leg is queried directly.
+    """
+    legs = []
+    if query_vector is not None:
+        legs.append(models.Prefetch(
+            query=query_vector, filter=query_filter, params=profile.search_params(), limit=prefetch_limit
+        ))
+    if sparse_vector is not None:
+        legs.append(models.Prefetch(
+            query=sparse_vector, using=SPARSE_VECTOR_NAME, filter=query_filter, limit=prefetch_limit
+        ))
+    if len(legs) == 1:
+        leg = legs[0]
+        return models.QueryRequest(
+            query=leg.query, using=leg.using, filter=query_filter, params=leg.params, limit=limit, with_payload=True
+        )
+    return models.QueryRequest(prefetch=legs, query=models.FusionQuery(fusion=fusion), limit=limit, with_payload=True)
+
+
 class QdrantService:
-    def __init__(self, url: str, collection_name: str = "rag_foundry_dense", vector_size: int = 384):
-        self.client = QdrantClient(url=url)
+    def __init__(
+        self,
+        url: str,
+        collection_name: str = "rag_foundry_dense",
+        vector_size: int = 384,
+        client: Optional[QdrantClient] = None,
+        profile: Optional[str] = None,
+        sparse: Optional[bool] = None
+    ):
+        self.client = client or QdrantClient(url=url)
         self.collection_name = collection_name
         self.vector_size = vector_size
+        # Tuning preset (rag/vector_store/profiles.py): collection layout and search params
+        self.profile: CollectionProfile = get_profile(profile or settings.QDRANT_PROFILE)
+        # Native sparse leg (SPARSE_BACKEND=qdrant): chunks also get a BM25 sparse vector
+        sparse = sparse if sparse is not None else settings.SPARSE_BACKEND == "qdrant"
+        self.sparse_encoder: Optional[SparseEncoder] = SparseEncoder() if sparse else None
+        # Bulk upserts: batch size, batches in flight, retries per batch
+        self.upsert_batch_size = settings.QDRANT_UPSERT_BATCH_SIZE
+        self.upsert_retries = settings.QDRANT_UPSERT_RETRIES
+        self.upsert_backoff = settings.QDRANT_UPSERT_BACKOFF
+        self._upsert_executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.QDRANT_UPSERT_PARALLEL), thread_name_prefix="qdrant-upsert"
+        )
         self._ensure_collection()
 
     def _ensure_collection(self):
@@ -18,40 +102,306 @@ class QdrantService:
         if not exists:
             self.client.create_collection(
                 collection_name=self.collection_name,
-                vectors_config=models.VectorParams(
-                    size=self.vector_size,
-                    distance=models.Distance.COSINE
-                )
+                vectors_config=self.profile.vectors_config(self.vector_size),
+                sparse_vectors_config=self._sparse_vectors_config(),
+                on_disk_payload=self.profile.on_disk_payload or None
             )
+        elif self.sparse_encoder is not None:
+            sparse_vectors = self.client.get_collection(self.collection_name).config.params.sparse_vectors or {}
+            if SPARSE_VECTOR_NAME not in sparse_vectors:
+                raise ValueError(
+                    f"Collection {self.collection_name} has no '{SPARSE_VECTOR_NAME}' sparse vector; "
+                    "SPARSE_BACKEND=qdrant needs a new collection and a re-ingest"
+                )
 
-    def upsert_chunks(self, chunks: List[Chunk]):
+        # Keyword indexes so filtered searches do not scan payloads
+        schema = self.client.get_collection(self.collection_name).payload_schema or {}
+        for field in FILTER_FIELDS:
+            if field not in schema:
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field,
+                    field_schema=models.PayloadSchemaType.KEYWORD
+                )
+
+    def _sparse_vectors_config(self) -> Optional[dict]:
+        if self.sparse_encoder is None:
+            return None
+        # Qdrant computes IDF over the collection; vectors only carry the tf part
+        return {SPARSE_VECTOR_NAME: models.SparseVectorParams(modifier=models.Modifier.IDF)}
+
+    def apply_profile(self):
+        """
+        Re-tune an existing collection to the current profile. Qdrant rebuilds
+        the HNSW graph and quantized vectors in the background.
+        """
+        self.client.update_collection(
+            collection_name=self.collection_name,
+            vectors_config={"": models.VectorParamsDiff(
+                on_disk=self.profile.on_disk_vectors,
+                hnsw_config=self.profile.hnsw_config()
+            )},
+            quantization_config=self.profile.quantization_config() or models.Disabled.DISABLED,
+            collection_params=models.CollectionParamsDiff(on_disk_payload=self.profile.on_disk_payload)
+        )
+
+    def upsert_chunks(self, chunks: List[Chunk], vectors: Optional[np.ndarray] = None):
+        """
+        Upsert chunks with their vectors: a float32 (n, d) matrix aligned with
+        chunks, or, when omitted, each Chunk.vector.
+
+        Chunks go out in batches of upsert_batch_size, several batches in flight.
+        All batches but the last are sent with wait=False and only need to be
+        acknowledged. The last one is sent with wait=True once the others are
+        acknowledged: Qdrant applies updates in order, so when it returns the
+        whole upsert is searchable. Each batch is retried with exponential backoff.
+        With a sparse encoder every point also carries its BM25 sparse vector.
+        """
+        chunks, vectors = chunk_vectors(chunks, vectors)
         if not chunks:
             return
-            
-        points = [
-            models.PointStruct(
-                id=chunk.id,
-                vector=chunk.vector,
-                payload={
-                    "content": chunk.content,
-                    "doc_id": chunk.doc_id,
-                    "chunk_index": chunk.chunk_index,
-                    **chunk.metadata
-                }
-            )
-            for chunk in chunks
-            if chunk.vector is not None
+
+        batches = [
+            self._point_batch(chunks[i:i + self.upsert_batch_size], vectors[i:i + self.upsert_batch_size])
+            for i in range(0, len(chunks), self.upsert_batch_size)
         ]
-        
-        self.client.upsert(
-            collection_name=self.collection_name,
-            points=points
+        futures = [self._upsert_executor.submit(self._upsert_batch, batch, False) for batch in batches[:-1]]
+        for future in futures:
+            future.result()  # re-raises a batch that failed all its retries
+        # Consistency barrier
+        self._upsert_batch(batches[-1], True)
+
+    def _point_batch(self, chunks: List[Chunk], vectors: np.ndarray) -> models.Batch:
+        """
+        Columnar upsert request. The matrix becomes lists only here, at the wire
+        boundary, and the request is built without pydantic validating every float.
+        """
+        dense = vectors.tolist()
+        return models.Batch.model_construct(
+            ids=[chunk.id for chunk in chunks],
+            vectors=dense if self.sparse_encoder is None else {
+                "": dense,
+                SPARSE_VECTOR_NAME: self.sparse_encoder.encode_documents([chunk.content for chunk in chunks]),
+            },
+            payloads=[chunk_payload(chunk) for chunk in chunks]
         )
 
-    def search(self, query_vector: List[float], limit: int = 5) -> List[models.ScoredPoint]:
+    def _upsert_batch(self, batch: models.Batch, wait: bool):
+        for attempt in range(self.upsert_retries + 1):
+            try:
+                self.client.upsert(collection_name=self.collection_name, points=batch, wait=wait)
+                return
+            except Exception as e:
+                if attempt == self.upsert_retries:
+                    raise
+                delay = self.upsert_backoff * 2 ** attempt
+                print(f"Qdrant upsert of {len(batch.ids)} points failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def search(
+        self,
+        query_vector: List[float],
+        limit: int = 5,
+        query_filter: Optional[models.Filter] = None
+    ) -> List[models.ScoredPoint]:
         response = self.client.query_points(
             collection_name=self.collection_name,
             query=query_vector,
+            query_filter=query_filter,
+            search_params=self.profile.search_params(),
             limit=limit
         )
         return response.points
+
+    def search_batch(
+        self,
+        query_vectors: List[List[float]],
+        limit: int = 5,
+        query_filter: Optional[models.Filter] = None
+    ) -> List[List[models.ScoredPoint]]:
+        """Run several searches in one round trip; results are in query order."""
+        if not query_vectors:
+            return []
+        responses = self.client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=[
+                models.QueryRequest(
+                    query=vector, filter=query_filter, params=self.profile.search_params(),
+                    limit=limit, with_payload=True
+                )
+                for vector in query_vectors
+            ]
+        )
+        return [response.points for response in responses]
+
+    def hybrid_search(
+        self,
+        query_vector: Optional[List[float]],
+        sparse_vector: Optional[models.SparseVector],
+        limit: int = 5,
+        prefetch_limit: int = 10,
+        query_filter: Optional[models.Filter] = None,
+        fusion: models.Fusion = models.Fusion.RRF
+    ) -> List[models.ScoredPoint]:
+        return self.hybrid_search_batch(
+            [query_vector] if query_vector is not None else None,
+            [sparse_vector] if sparse_vector is not None else None,
+            limit=limit, prefetch_limit=prefetch_limit, query_filter=query_filter, fusion=fusion
+        )[0]
+
+    def hybrid_search_batch(
+        self,
+        query_vectors: Optional[List[List[float]]],
+        sparse_vectors: Optional[List[models.SparseVector]],
+        limit: int = 5,
+        prefetch_limit: int = 10,
+        query_filter: Optional[models.Filter] = None,
+        fusion: models.Fusion = models.Fusion.RRF
+    ) -> List[List[models.ScoredPoint]]:
+        """
+        Dense and sparse legs with server-side fusion, one round trip for the batch.
+        Pass None for a leg to leave it out. Results are in query order.
+        """
+        num_queries = len(query_vectors if query_vectors is not None else sparse_vectors or [])
+        if not num_queries:
+            return []
+        responses = self.client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=[
+                hybrid_request(
+                    self.profile,
+                    query_vectors[i] if query_vectors is not None else None,
+                    sparse_vectors[i] if sparse_vectors is not None else None,
+                    limit, prefetch_limit, query_filter, fusion
+                )
+                for i in range(num_queries)
+            ]
+        )
+        return [response.points for response in responses]
+
+    def retrieve(self, ids: List[str]) -> List[models.Record]:
+        """Fetch points (payload only) by id."""
+        if not ids:
+            return []
+        return self.client.retrieve(
+            collection_name=self.collection_name,
+            ids=ids,
+            with_payload=True,
+            with_vectors=False
+        )
+
+
+class AsyncQdrantService:
+    """
+    Read path of QdrantService on AsyncQdrantClient, for use from async handlers.
+
+    REST connections are pooled (pool_size); with prefer_grpc the client talks
+    gRPC on grpc_port instead. Every call has a deadline: the timeout argument,
+    or the service default.
+
+    The collection is created by the synchronous QdrantService used for ingestion.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        collection_name: str = "rag_foundry_dense",
+        prefer_grpc: bool = False,
+        grpc_port: int = 6334,
+        pool_size: int = 20,
+        timeout: float = 5.0,
+        profile: Optional[str] = None
+    ):
+        self.collection_name = collection_name
+        self.timeout = timeout
+        self.profile: CollectionProfile = get_profile(profile or settings.QDRANT_PROFILE)
+        self.client = AsyncQdrantClient(
+            url=url,
+            prefer_grpc=prefer_grpc,
+            grpc_port=grpc_port,
+            timeout=max(1, int(timeout)),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    async def _call(self, coro, timeout: Optional[float]):
+        return await asyncio.wait_for(coro, timeout=timeout if timeout is not None else self.timeout)
+
+    async def search(
+        self,
+        query_vector: List[float],
+        limit: int = 5,
+        query_filter: Optional[models.Filter] = None,
+        timeout: Optional[float] = None
+    ) -> List[models.ScoredPoint]:
+        response = await self._call(
+            self.client.query_points(
+                collection_name=self.collection_name, query=query_vector, query_filter=query_filter,
+                search_params=self.profile.search_params(), limit=limit
+            ),
+            timeout
+        )
+        return response.points
+
+    async def search_batch(
+        self,
+        query_vectors: List[List[float]],
+        limit: int = 5,
+        query_filter: Optional[models.Filter] = None,
+        timeout: Optional[float] = None
+    ) -> List[List[models.ScoredPoint]]:
+        """Run several searches in one round trip; results are in query order."""
+        if not query_vectors:
+            return []
+        responses = await self._call(
+            self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=[
+                    models.QueryRequest(
+                        query=vector, filter=query_filter, params=self.profile.search_params(),
+                        limit=limit, with_payload=True
+                    )
+                    for vector in query_vectors
+                ]
+            ),
+            timeout
+        )
+        return [response.points for response in responses]
+
+    async def hybrid_search(
+        self,
+        query_vector: Optional[List[float]],
+        sparse_vector: Optional[models.SparseVector],
+        limit: int = 5,
+        prefetch_limit: int = 10,
+        query_filter: Optional[models.Filter] = None,
+        fusion: models.Fusion = models.Fusion.RRF,
+        timeout: Optional[float] = None
+    ) -> List[models.ScoredPoint]:
+        """Dense and sparse legs with server-side fusion in one query (see QdrantService)."""
+        request = hybrid_request(self.profile, query_vector, sparse_vector, limit, prefetch_limit, query_filter, fusion)
+        response = await self._call(
+            self.client.query_points(
+                collection_name=self.collection_name, query=request.query, using=request.using,
+                prefetch=request.prefetch, query_filter=request.filter, search_params=request.params,
+                limit=limit, with_payload=True
+            ),
+            timeout
+        )
+        return response.points
+
+    async def retrieve(self, ids: List[str], timeout: Optional[float] = None) -> List[models.Record]:
+        """Fetch points (payload only) by id."""
+        if not ids:
+            return []
+        return await self._call(
+            self.client.retrieve(
+                collection_name=self.collection_name,
+                ids=ids,
+                with_payload=True,
+                with_vectors=False
+            ),
+            timeout
+        )
+
+    async def close(self):
+        await self.client.close()
@@ -0,0 +1,71 @@
+"""
+Compare exhaustive and MaxScore-pruned BM25 search on a synthetic Zipfian corpus.
+
+Both indexes must return identical results; the pruned one should score far
+fewer postings on long queries.
+
+    python scripts/benchmark_bm25_pruning.py --docs 50000 --query-terms 12
+"""
+import argparse
+import tempfile
+import time
+import numpy as np
+from rag.ingestion.models import Chunk
+from rag.sparse.index import BM25Index
+from rag.sparse.inverted import SearchTrace
+
+
+def make_corpus(num_docs: int, vocab_size: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    ranks = np.arange(1, vocab_size + 1)
+    probs = (1 / ranks) / (1 / ranks).sum()
+    return [
+        Chunk(doc_id="bench", content=" ".join(f"t{i}" for i in rng.choice(vocab_size, size=rng.integers(20, 200), p=probs)), chunk_index=n)
+        for n in range(num_docs)
+    ]
+
+
+def run(index: BM25Index, queries, top_k: int):
+    trace = SearchTrace()
+    start = time.perf_counter()
+    results = [index.search(query, top_k=top_k, trace=trace) for query in queries]
+    return results, trace, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--vocab", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--query-terms", type=int, nargs="+", default=[2, 4, 8, 16])
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"Indexing {args.docs} synthetic documents...")
+    chunks = make_corpus(args.docs, args.vocab)
+    rng = np.random.default_rng(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        exhaustive = BM25Index(persistence_dir=f"{tmp}/exhaustive", prune=False)
+        pruned = BM25Index(persistence_dir=f"{tmp}/pruned", prune=True)
+        exhaustive.build(chunks)
+        pruned.build(chunks)
+
+        print(f"{'terms':>5} {'postings':>12} {'scored (exh)':>13} {'scored (pruned)':>16} {'ms/q (exh)':>11} {'ms/q (pruned)':>14}")
+        for num_terms in args.query_terms:
+            # Mix frequent and rare terms, as in natural-language questions
+            queries = [
+                " ".join(f"t{i}" for i in rng.integers(0, args.vocab // (1 + k % 3 * 20), size=num_terms))
+                for k in range(args.queries)
+            ]
+            expected, full, full_time = run(exhaustive, queries, args.top_k)
+            results, trace, pruned_time = run(pruned, queries, args.top_k)
+            assert results == expected, "pruned results differ from exhaustive scoring"
+            print(
+                f"{num_terms:>5} {full.postings_total:>12} {full.postings_scored:>13} {trace.postings_scored:>16} "
+                f"{1000 * full_time / len(queries):>11.2f} {1000 * pruned_time / len(queries):>14.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Throughput of the inference backends for the embedding model and cross-encoder.
+
+For every backend and batch size the script encodes (or scores) the same
+synthetic chunk-sized texts and reports items per second. Run it on the CPU
+nodes that serve the API; thread count follows torch / onnxruntime defaults.
+
+    python scripts/benchmark_inference.py --backends torch onnx onnx-int8 --batch-sizes 1 8 64 256
+"""
+import argparse
+import time
+import numpy as np
+from sentence_transformers import SentenceTransformer, CrossEncoder
+from rag.inference.backends import INFERENCE_BACKENDS, load_model
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+def make_texts(n: int, words: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    vocab = [f"word{i}" for i in range(2000)]
+    return [" ".join(rng.choice(vocab, size=words)) for _ in range(n)]
+
+
+def throughput(fn, items, batch_size: int, min_seconds: float) -> float:
+    """Items per second, after one warm-up batch, over at least min_seconds."""
+    fn(items[:batch_size])
+    done, start = 0, time.perf_counter()
+    while True:
+        for i in range(0, len(items), batch_size):
+            fn(items[i:i + batch_size])
+            done += len(items[i:i + batch_size])
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return done / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(INFERENCE_BACKENDS), choices=INFERENCE_BACKENDS)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64, 128, 256])
+    parser.add_argument("--items", type=int, default=512, help="texts (or query-passage pairs) per pass")
+    parser.add_argument("--words", type=int, default=120, help="words per chunk text")
+    parser.add_argument("--min-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    chunks = make_texts(args.items, args.words)
+    pairs = [[query, chunk] for query, chunk in zip(make_texts(args.items, 8, seed=1), chunks)]
+
+    print(f"{'model':<14} {'backend':<10} " + " ".join(f"{'bs=' + str(b):>9}" for b in args.batch_sizes))
+    for backend in args.backends:
+        embedder = load_model(SentenceTransformer, EMBEDDING_MODEL, backend)
+        rates = [
+            throughput(lambda batch: embedder.encode(batch, batch_size=len(batch)), chunks, b, args.min_seconds)
+            for b in args.batch_sizes
+        ]
+        print(f"{'embedding':<14} {backend:<10} " + " ".join(f"{r:>9.1f}" for r in rates))
+
+        reranker = load_model(CrossEncoder, RERANK_MODEL, backend)
+        rates = [
+            throughput(lambda batch: reranker.predict(batch, batch_size=len(batch)), pairs, b, args.min_seconds)
+            for b in args.batch_sizes
+        ]
+        print(f"{'cross-encoder':<14} {backend:<10} " + " ".join(f"{r:>9.1f}" for r in rates))
+    print("(items per second)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark the Qdrant collection profiles on the ingested corpus.
+
+The vectors of the main collection are copied into one scratch collection per
+profile. A sample of stored chunks, re-embedded from their text, serves as the
+queries. For each profile the script reports recall@k against exact search and
+p50/p99 query latency.
+
+    python scripts/benchmark_qdrant_profiles.py --queries 200 --top-k 10
+"""
+import argparse
+import time
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from rag.embeddings.service import EmbeddingService
+from rag.vector_store.profiles import PROFILES, get_profile
+from rag.vector_store.qdrant import QdrantService
+from apps.api.settings import settings
+
+
+def load_corpus(client: QdrantClient, collection: str):
+    """All points of the collection, with vectors and payloads."""
+    points, offset = [], None
+    while True:
+        batch, offset = client.scroll(
+            collection_name=collection, limit=1000, offset=offset, with_payload=True, with_vectors=True
+        )
+        points.extend(batch)
+        if offset is None:
+            return points
+
+
+def dense_size(client: QdrantClient, collection: str) -> int:
+    """Dimension of the collection's dense vector (the unnamed one when vectors are named)."""
+    vectors = client.get_collection(collection).config.params.vectors
+    if isinstance(vectors, dict):
+        vectors = vectors[""] if "" in vectors else next(iter(vectors.values()))
+    return vectors.size
+
+
+def wait_until_indexed(client: QdrantClient, collection: str, timeout: float = 600.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if client.get_collection(collection).status == models.CollectionStatus.GREEN:
+            return
+        time.sleep(1.0)
+    print(f"Warning: {collection} still optimizing; numbers may be off")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", default="rag_foundry_dense")
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch collections")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=settings.QDRANT_URL)
+    points = load_corpus(client, args.collection)
+    if not points:
+        print(f"Collection {args.collection} is empty; ingest some documents first.")
+        return
+    print(f"Loaded {len(points)} points from {args.collection}")
+    vector_size = dense_size(client, args.collection)
+
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(points), size=min(args.queries, len(points)), replace=False)
+    embedder = EmbeddingService(cache_path="")
+    queries = embedder.embed_queries([points[i].payload.get("content", "") for i in sample])
+
+    print(f"{'profile':<12} {'recall@' + str(args.top_k):>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for name in args.profiles:
+        profile = get_profile(name)
+        collection = f"{args.collection}__bench_{name.replace('-', '_')}"
+        if client.collection_exists(collection):
+            client.delete_collection(collection)
+        service = QdrantService(
+            url=settings.QDRANT_URL, collection_name=collection,
+            vector_size=vector_size, client=client, profile=name
+        )
+        client.upload_points(
+            collection_name=collection,
+            points=[models.PointStruct(id=p.id, vector=p.vector, payload=p.payload) for p in points],
+            batch_size=256,
+            wait=True
+        )
+        wait_until_indexed(client, collection)
+
+        # Ground truth: brute force over the original vectors, not the profile's quantized copy
+        exact = models.SearchParams(exact=True, quantization=models.QuantizationSearchParams(ignore=True))
+        recalls, latencies = [], []
+        for vector in queries:
+            truth = client.query_points(collection_name=collection, query=vector, limit=args.top_k, search_params=exact)
+            start = time.perf_counter()
+            found = service.search(vector, limit=args.top_k)
+            latencies.append(1000 * (time.perf_counter() - start))
+            expected = {p.id for p in truth.points}
+            recalls.append(len(expected & {p.id for p in found}) / max(1, len(expected)))
+
+        print(
+            f"{profile.name:<12} {np.mean(recalls):>10.3f} "
+            f"{np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 99):>8.2f}"
+        )
+        if not args.keep:
+            client.delete_collection(collection)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,7 +21,7 @@ def build_bm25_only():
     
     index = BM25Index()
     index.build(chunks)
-    print("BM25 index built and saved to data/bm25.pkl")
+    print("BM25 index built and saved to data/bm25/")
 
 if __name__ == "__main__":
     build_bm25_only()
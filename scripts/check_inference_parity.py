@@ -0,0 +1,78 @@
+"""
+Check that the ONNX backends reproduce the PyTorch models.
+
+Embeddings are compared by cosine similarity with the PyTorch vectors, the
+cross-encoder by absolute score difference and by whether it ranks the
+passages of each query the same way. Exits non-zero when a backend misses the
+tolerances (defaults: exact for onnx, looser for onnx-int8).
+
+    python scripts/check_inference_parity.py --backends onnx onnx-int8
+"""
+import argparse
+import sys
+import numpy as np
+from sentence_transformers import SentenceTransformer, CrossEncoder
+from rag.inference.backends import load_model
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+QUERIES = [
+    "What did Paul Graham say about Lisp macros?",
+    "how does hybrid search combine bm25 and dense vectors",
+    "Why are startups hard?",
+    "int8 quantization accuracy on CPU",
+]
+PASSAGES = [
+    "Lisp macros let programs write programs, which Graham saw as the language's secret weapon.",
+    "Hybrid retrieval fuses a sparse keyword ranking with a dense embedding ranking.",
+    "Most startups fail because they make something nobody wants.",
+    "Dynamic quantization stores weights as int8 and quantizes activations at run time.",
+    "The weather in Boston was cold and wet for most of the winter.",
+    "Reciprocal rank fusion only looks at ranks, not raw scores.",
+    "A cross-encoder reads the query and the passage together and outputs one relevance score.",
+    "Paul Graham co-founded Y Combinator in 2005.",
+]
+
+# Per backend: minimum embedding cosine, maximum cross-encoder score difference
+TOLERANCES = {"onnx": (0.9999, 1e-3), "onnx-int8": (0.98, 0.5)}
+
+
+def embedding_parity(backend: str, texts):
+    reference = SentenceTransformer(EMBEDDING_MODEL).encode(texts, normalize_embeddings=True)
+    candidate = load_model(SentenceTransformer, EMBEDDING_MODEL, backend).encode(texts, normalize_embeddings=True)
+    return np.sum(reference * candidate, axis=1)
+
+
+def rerank_parity(backend: str):
+    pairs = [[q, p] for q in QUERIES for p in PASSAGES]
+    reference = np.asarray(CrossEncoder(RERANK_MODEL).predict(pairs)).reshape(len(QUERIES), -1)
+    candidate = np.asarray(load_model(CrossEncoder, RERANK_MODEL, backend).predict(pairs)).reshape(len(QUERIES), -1)
+    same_order = np.mean([
+        np.array_equal(np.argsort(-ref), np.argsort(-cand)) for ref, cand in zip(reference, candidate)
+    ])
+    top1 = np.mean(reference.argmax(axis=1) == candidate.argmax(axis=1))
+    return np.abs(reference - candidate), same_order, top1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"], choices=sorted(TOLERANCES))
+    args = parser.parse_args()
+
+    failed = False
+    for backend in args.backends:
+        min_cosine, max_diff = TOLERANCES[backend]
+        cosines = embedding_parity(backend, QUERIES + PASSAGES)
+        diffs, same_order, top1 = rerank_parity(backend)
+        ok = cosines.min() >= min_cosine and diffs.max() <= max_diff
+        failed |= not ok
+        print(f"[{backend}] {'OK' if ok else 'FAIL'}")
+        print(f"  embeddings:    cosine to torch min {cosines.min():.6f}, mean {cosines.mean():.6f} (>= {min_cosine})")
+        print(f"  cross-encoder: |score diff| max {diffs.max():.4f}, mean {diffs.mean():.4f} (<= {max_diff})")
+        print(f"                 same ranking {same_order:.0%} of queries, same top-1 {top1:.0%}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
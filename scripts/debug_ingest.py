@@ -29,10 +29,10 @@ def debug():
         print(f"DEBUG: Successfully ingested {count} chunks.")
         
         import os
-        if os.path.exists("data/bm25.pkl"):
-             print("DEBUG: BM25 pickle created successfully.")
+        if os.path.exists("data/bm25/manifest.json"):
+             print("DEBUG: BM25 index created successfully.")
         else:
-             print("DEBUG: BM25 pickle NOT found.")
+             print("DEBUG: BM25 index NOT found.")
              
     except Exception as e:
         print(f"DEBUG: Error during ingestion: {e}")
@@ -13,6 +13,7 @@ async def ingest_samples():
         print(f"✅ Ingested {chunks} chunks from directory: {dir_path}")
     else:
         print(f"❌ Directory not found: {dir_path}")
+    service.embedding_service.close()
 
 if __name__ == "__main__":
     asyncio.run(ingest_samples())
@@ -0,0 +1,109 @@
+"""
+Recall / latency trade-off of the rerank cascade on a labelled query set.
+
+For every question, hybrid candidates are reranked once by the cross-encoder
+alone (the reference) and then through the cascade for each threshold
+setting. Reported per setting:
+
+    - recall@k: share of the reference top-k the cascade also returns
+    - hit@k: share of questions with a relevant chunk in the top-k, when the
+      set labels them ("relevant_sources": chunk source paths)
+    - candidates cross-encoded and rerank latency (mean / p95)
+
+Questions are JSON lines with a "question" field, as in eval/. Score caching
+is disabled so every run pays for its cross-encoder calls. Every question is
+reranked once before timing, so all settings find the chunks' token ids
+cached alike.
+
+    python scripts/rerank_cascade_report.py --questions eval/eval_questions_sanity.jsonl --gaps 0.1 0.2 0.3
+"""
+import argparse
+import itertools
+import json
+import time
+import numpy as np
+from rag.cache.rerank_scores import RerankScoreCache
+from rag.embeddings.service import EmbeddingService
+from rag.rerank.service import RerankerService, RerankTrace
+from rag.retrieval.service import RetrievalService
+
+
+def load_questions(path: str):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def timed_rerank(reranker: RerankerService, question: str, candidates, top_k: int, cascade: bool):
+    """(result, seconds, candidates cross-encoded) of one rerank."""
+    chunks = [c.model_copy() for c in candidates]
+    trace = RerankTrace()
+    start = time.perf_counter()
+    result = reranker.rerank(question, chunks, top_k=top_k, cascade=cascade, trace=trace)
+    return result, time.perf_counter() - start, trace.cross_encoded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", default="eval/eval_questions_sanity.jsonl")
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--gaps", type=float, nargs="+", default=[0.1, 0.2, 0.3])
+    parser.add_argument("--min-scores", type=float, nargs="+", default=[0.0])
+    parser.add_argument("--max-survivors", type=int, nargs="+", default=[8, 12])
+    args = parser.parse_args()
+
+    embedding_service = EmbeddingService()
+    retrieval_service = RetrievalService(embedding_service=embedding_service)
+    reranker = RerankerService(score_cache=RerankScoreCache(max_size=0), embedding_service=embedding_service)
+
+    questions = load_questions(args.questions)
+    print(f"Retrieving {args.candidates} candidates for {len(questions)} questions...")
+    runs = []
+    for item in questions:
+        candidates = retrieval_service.hybrid_search(item["question"], top_k=args.candidates)
+        if candidates:
+            runs.append((item, candidates))
+    # Warm the models and the chunk token cache, so no setting is charged for
+    # tokenizing chunks another setting has already seen
+    for item, candidates in runs:
+        timed_rerank(reranker, item["question"], candidates, args.top_k, cascade=False)
+
+    def report(name, results, latencies, cross_encoded, reference):
+        recall = np.mean([
+            len({c.chunk_id for c in result} & {c.chunk_id for c in ref}) / max(1, len(ref))
+            for result, ref in zip(results, reference)
+        ])
+        labelled = [(item, result) for (item, _), result in zip(runs, results) if item.get("relevant_sources")]
+        hit = np.mean([
+            any(c.metadata.get("source") in item["relevant_sources"] for c in result) for item, result in labelled
+        ]) if labelled else float("nan")
+        ms = np.asarray(latencies) * 1000
+        print(
+            f"{name:<32} recall@{args.top_k}={recall:.3f}  hit@{args.top_k}={hit:.3f}  "
+            f"cross-encoded={np.mean(cross_encoded):5.1f}  "
+            f"latency mean={ms.mean():6.1f}ms p95={np.percentile(ms, 95):6.1f}ms"
+        )
+
+    reference, latencies, cross_encoded = [], [], []
+    for item, candidates in runs:
+        result, elapsed, scored = timed_rerank(reranker, item["question"], candidates, args.top_k, cascade=False)
+        reference.append(result)
+        latencies.append(elapsed)
+        cross_encoded.append(scored)
+    report("cross-encoder only", reference, latencies, cross_encoded, reference)
+
+    for gap, min_score, max_survivors in itertools.product(args.gaps, args.min_scores, args.max_survivors):
+        reranker.cascade_max_gap = gap
+        reranker.cascade_min_score = min_score
+        reranker.cascade_max_survivors = max_survivors
+        results, latencies, cross_encoded = [], [], []
+        for item, candidates in runs:
+            result, elapsed, scored = timed_rerank(reranker, item["question"], candidates, args.top_k, cascade=True)
+            results.append(result)
+            latencies.append(elapsed)
+            cross_encoded.append(scored)
+        report(f"gap={gap} min={min_score} max={max_survivors}", results, latencies, cross_encoded, reference)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Unit tests for the in-process caches.
+"""
+import sqlite3
+import time
+import numpy as np
+import pytest
+from apps.api.settings import settings
+from rag.cache.lru import LRUCache
+from rag.cache.generation import IndexGeneration
+from rag.cache.embedding_store import EmbeddingStore, content_hash
+from rag.cache.rerank_scores import RerankScoreCache, query_key
+from rag.embeddings import service as embedding_module
+
+
+class TestLRUCache:
+    """Tests for LRUCache eviction, expiry and counters."""
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1 and cache.get("c") == 3
+        assert cache.stats()["evictions"] == 1
+
+    def test_entries_expire(self):
+        cache = LRUCache(max_size=4, ttl=0.01)
+        cache.put("a", 1)
+        time.sleep(0.02)
+
+        assert cache.get("a") is None
+        assert cache.stats()["expirations"] == 1
+        assert len(cache) == 0
+
+    def test_counters(self):
+        cache = LRUCache(max_size=4)
+        cache.put("a", 1)
+        cache.get("a")
+        cache.get("missing")
+
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"]) == (1, 1)
+        assert stats["hit_rate"] == 0.5
+
+    def test_zero_size_disables(self):
+        cache = LRUCache(max_size=0)
+        cache.put("a", 1)
+        assert cache.get("a") is None
+
+
+class TestIndexGeneration:
+    """Tests for the index generation counter."""
+
+    def test_bump(self):
+        generation = IndexGeneration()
+        assert generation.value == 0
+        assert generation.bump() == 1
+        assert generation.value == 1
+
+
+class TestRerankScoreCache:
+    """Tests for the (query, chunk) cross-encoder score cache."""
+
+    def test_query_key_covers_model_and_model_input(self):
+        assert query_key("m@torch", [101, 7]) == query_key("m@torch", (101, 7))
+        assert query_key("m@torch", [101, 7]) != query_key("m@onnx-int8-avx2", [101, 7])
+        # Without token ids only the exact text matches
+        assert query_key("m@torch", "What is RAG?") != query_key("m@torch", "what is rag?")
+        assert query_key("m@torch", "1 2") != query_key("m@torch", [1, 2])
+
+    def test_scores_by_query_key(self):
+        cache = RerankScoreCache(max_size=10)
+        cache.put_many("k1", {"c1": 0.9, "c2": 0.1})
+
+        assert cache.get_many("k1", ["c1", "c2", "c3"]) == {"c1": 0.9, "c2": 0.1}
+        assert cache.get_many("k2", ["c1"]) == {}
+
+    def test_invalidate_chunks_and_sources(self):
+        cache = RerankScoreCache(max_size=10)
+        cache.put_many("q1", {"c1": 1.0, "c2": 2.0, "c3": 3.0}, sources={"c1": "a.txt", "c2": "a.txt", "c3": "b.txt"})
+        cache.put_many("q2", {"c1": 4.0})
+
+        assert cache.invalidate_chunks(["c1"]) == 2
+        assert cache.get_many("q1", ["c1", "c2"]) == {"c2": 2.0}
+        assert cache.invalidate_sources(["a.txt"]) == 1
+        assert cache.get_many("q1", ["c2", "c3"]) == {"c3": 3.0}
+        assert cache.stats()["invalidations"] == 3
+
+    def test_eviction_forgets_chunk_index(self):
+        cache = RerankScoreCache(max_size=2)
+        cache.put_many("q", {"c1": 1.0, "c2": 2.0, "c3": 3.0}, sources={"c1": "a.txt"})
+
+        assert len(cache) == 2 and cache.stats()["evictions"] == 1
+        assert cache.invalidate_sources(["a.txt"]) == 0
+        assert cache._queries_by_chunk.keys() == {"c2", "c3"} and cache._chunks_by_source == {}
+
+    def test_zero_size_disables(self):
+        cache = RerankScoreCache(max_size=0)
+        cache.put_many("q", {"c1": 1.0})
+        assert len(cache) == 0
+
+
+class FakeSentenceTransformer:
+    def __init__(self, model_name):
+        self.encoded = []
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True):
+        self.encoded.extend(texts)
+        return np.array([[len(t), 1.0, 0.5] for t in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    monkeypatch.setattr(embedding_module, "SentenceTransformer", FakeSentenceTransformer)
+
+
+class TestEmbeddingCaches:
+    """Tests for the query LRU and the persistent chunk embedding store."""
+
+    def test_store_is_namespaced_by_model(self, tmp_path):
+        path = str(tmp_path / "emb.sqlite3")
+        EmbeddingStore(path, namespace="model-a").put_many({content_hash("x"): [1.0, 2.0]})
+
+        assert EmbeddingStore(path, namespace="model-a").get_many([content_hash("x")]) == {content_hash("x"): [1.0, 2.0]}
+        assert EmbeddingStore(path, namespace="model-b").get_many([content_hash("x")]) == {}
+
+    def test_int8_vectors_are_namespaced_by_quantization_target(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(embedding_module, "load_model", lambda cls, name, backend: FakeSentenceTransformer(name))
+        path = str(tmp_path / "emb.sqlite3")
+        namespaces = {}
+        for target in ("avx2", "avx512_vnni"):
+            monkeypatch.setattr(settings, "ONNX_QUANTIZATION", target)
+            service = embedding_module.EmbeddingService("m", cache_path=path, backend="onnx-int8")
+            namespaces[target] = service.store.namespace
+        assert namespaces == {"avx2": "m@int8-avx2", "avx512_vnni": "m@int8-avx512_vnni"}
+
+    def test_reingest_skips_unchanged_chunks(self, tmp_path, fake_model):
+        path = str(tmp_path / "emb.sqlite3")
+        first = embedding_module.EmbeddingService("m", cache_path=path)
+        vectors = first.embed(["alpha", "beta"])
+
+        # A new process: same store on disk, one changed chunk
+        second = embedding_module.EmbeddingService("m", cache_path=path)
+        assert second.embed(["alpha", "beta", "gamma!"])[:2] == vectors
+        assert second.model.encoded == ["gamma!"]
+        assert second.cache_stats()["chunks"]["hits"] == 2
+
+    def test_embed_array_is_one_float32_matrix(self, tmp_path, fake_model):
+        path = str(tmp_path / "emb.sqlite3")
+        embedding_module.EmbeddingService("m", cache_path=path).embed(["alpha"])
+
+        service = embedding_module.EmbeddingService("m", cache_path=path)
+        matrix = service.embed_array(["alpha", "be", "alpha"])
+        assert matrix.dtype == np.float32 and matrix.shape == (3, 3) and matrix.flags.c_contiguous
+        assert matrix[:, 0].tolist() == [5.0, 2.0, 5.0]
+        assert service.model.encoded == ["be"]
+
+    def test_stored_array_is_not_counted_as_cache_lookups(self, tmp_path, fake_model):
+        """The rerank cascade peeks at stored vectors; that must not skew the store's hit rate."""
+        service = embedding_module.EmbeddingService("m", cache_path=str(tmp_path / "emb.sqlite3"))
+        service.embed(["alpha"])
+        before = service.cache_stats()["chunks"]
+
+        vectors, found = service.stored_array(["alpha", "unseen"])
+        assert found == [0] and vectors.shape == (1, 3)
+        assert service.cache_stats()["chunks"] == before
+
+    def test_close_releases_workers_and_store(self, tmp_path, fake_model, monkeypatch):
+        monkeypatch.setattr(settings, "EMBED_BATCH_WAIT_MS", 1.0)
+        service = embedding_module.EmbeddingService("m", cache_path=str(tmp_path / "emb.sqlite3"))
+        closed = []
+        monkeypatch.setattr(service.encoder_pool, "close", lambda: closed.append("pool"))
+
+        service.close()
+        assert closed == ["pool"]
+        assert not service.query_batcher._worker.is_alive()
+        with pytest.raises(sqlite3.ProgrammingError):
+            len(service.store)
+
+    def test_query_lru(self, fake_model):
+        service = embedding_module.EmbeddingService("m", cache_path="")
+        vector = service.embed_query("what is lisp")
+        vector.append(99.0)  # callers get their own list
+
+        assert service.embed_query("what is lisp") == [12.0, 1.0, 0.5]
+        assert service.model.encoded == ["what is lisp"]
+        assert service.cache_stats()["queries"]["hits"] == 1
+        assert service.cache_stats()["chunks"] is None
+
+    def test_embed_queries_encodes_misses_once(self, fake_model):
+        service = embedding_module.EmbeddingService("m", cache_path="")
+        service.embed_query("a")
+
+        vectors = service.embed_queries(["a", "bb", "bb", "ccc"])
+        assert [v[0] for v in vectors] == [1.0, 2.0, 2.0, 3.0]
+        assert service.model.encoded == ["a", "bb", "ccc"]
@@ -0,0 +1,189 @@
+"""
+Unit tests for inference backends, micro-batching and the ingestion encoder pool.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from apps.api.settings import settings
+from rag.inference.backends import load_model, quantized_file_name, resolve_backend
+from rag.inference.batching import MicroBatcher
+from rag.embeddings.pool import EncoderPool, plan_batches
+
+
+class FakeModel:
+    """Records how it was loaded; save_pretrained writes an ONNX file like sentence-transformers."""
+    loads = []
+
+    def __init__(self, name_or_path, backend="torch", model_kwargs=None):
+        self.name_or_path = name_or_path
+        self.backend = backend
+        self.model_kwargs = model_kwargs
+        FakeModel.loads.append((name_or_path, backend, model_kwargs))
+
+    def save_pretrained(self, path):
+        os.makedirs(os.path.join(path, "onnx"), exist_ok=True)
+        open(os.path.join(path, "onnx", "model.onnx"), "w").close()
+
+
+@pytest.fixture
+def export_root(tmp_path, monkeypatch):
+    FakeModel.loads = []
+    monkeypatch.setattr(settings, "ONNX_EXPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "ONNX_QUANTIZATION", "avx2")
+    quantized = []
+
+    def fake_quantize(model, target, path, file_suffix=None):
+        """Names the file like sentence-transformers: by default from the target's weight type."""
+        quantized.append((model.name_or_path, target))
+        file_suffix = file_suffix or f"{'quint8' if target == 'avx2' else 'qint8'}_{target}"
+        open(os.path.join(path, "onnx", f"model_{file_suffix}.onnx"), "w").close()
+
+    import sentence_transformers
+    monkeypatch.setattr(sentence_transformers, "export_dynamic_quantized_onnx_model", fake_quantize)
+    return tmp_path, quantized
+
+
+class TestInferenceBackends:
+    """Tests for torch / onnx / onnx-int8 model loading."""
+
+    def test_torch_loads_the_hub_model(self, export_root):
+        model = load_model(FakeModel, "org/model", "torch")
+        assert (model.name_or_path, model.backend) == ("org/model", "torch")
+
+    def test_onnx_exports_once(self, export_root):
+        root, _ = export_root
+        load_model(FakeModel, "org/model", "onnx")
+        model = load_model(FakeModel, "org/model", "onnx")
+
+        path = str(root / "org__model")
+        assert (model.name_or_path, model.backend) == (path, "onnx")
+        # Export from the hub id, then only ever the local copy
+        assert [name for name, _, _ in FakeModel.loads] == ["org/model", path, path]
+
+    def test_int8_quantizes_once(self, export_root):
+        root, quantized = export_root
+        load_model(FakeModel, "org/model", "onnx-int8")
+        model = load_model(FakeModel, "org/model", "onnx-int8")
+
+        assert quantized == [(str(root / "org__model"), "avx2")]
+        assert model.model_kwargs == {"file_name": os.path.join("onnx", "model_qint8_avx2.onnx")}
+
+    def test_unknown_backend_and_target(self, monkeypatch):
+        with pytest.raises(ValueError):
+            resolve_backend("tensorrt")
+        monkeypatch.setattr(settings, "INFERENCE_BACKEND", "onnx")
+        assert resolve_backend() == "onnx"
+        with pytest.raises(ValueError):
+            quantized_file_name("sse4")
+
+
+class RecordingModel:
+    """Batch function that squares numbers and remembers the batches it saw."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.batches = []
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        time.sleep(self.delay)
+        if "boom" in items:
+            raise RuntimeError("model failed")
+        return [x * x for x in items]
+
+
+def submit_concurrently(batcher, calls):
+    with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+        return list(pool.map(batcher.submit, calls))
+
+
+class TestMicroBatcher:
+    """Tests for coalescing concurrent inference calls."""
+
+    def test_concurrent_calls_share_a_batch(self):
+        model = RecordingModel()
+        batcher = MicroBatcher(model, max_batch_size=64, max_wait_ms=200)
+        calls = [[i, i + 100] for i in range(8)]
+
+        results = submit_concurrently(batcher, calls)
+
+        assert results == [[x * x for x in call] for call in calls]
+        assert len(model.batches) < len(calls)
+        stats = batcher.stats()
+        assert stats["calls"] == 8 and stats["items"] == 16
+        assert stats["queue_wait_ms"]["p99"] >= stats["queue_wait_ms"]["p50"] >= 0
+        batcher.close()
+
+    def test_batches_respect_max_size(self):
+        model = RecordingModel(delay=0.01)
+        batcher = MicroBatcher(model, max_batch_size=5, max_wait_ms=50)
+        calls = [[i] * 2 for i in range(10)] + [list(range(7))]
+
+        results = submit_concurrently(batcher, calls)
+
+        assert results == [[x * x for x in call] for call in calls]
+        # The oversized call is split into slices instead of running as one batch of 7
+        assert all(len(batch) <= 5 for batch in model.batches)
+        assert batcher.submit(list(range(12))) == [x * x for x in range(12)]
+        assert all(len(batch) <= 5 for batch in model.batches)
+        batcher.close()
+
+    def test_errors_reach_every_caller_in_the_batch(self):
+        batcher = MicroBatcher(RecordingModel(), max_batch_size=64, max_wait_ms=200)
+        barrier = threading.Barrier(2)
+
+        def call(items):
+            barrier.wait()
+            try:
+                return batcher.submit(items)
+            except RuntimeError as e:
+                return str(e)
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            results = list(pool.map(call, [["boom"], [3]]))
+        assert "model failed" in results
+        # The batcher keeps serving after a failed batch
+        assert batcher.submit([4]) == [16]
+        batcher.close()
+
+    def test_single_call_waits_at_most_the_window(self):
+        batcher = MicroBatcher(RecordingModel(), max_batch_size=64, max_wait_ms=5)
+        start = time.perf_counter()
+        assert batcher.submit([2, 3]) == [4, 9]
+        assert time.perf_counter() - start < 1.0
+        assert batcher.submit([]) == []
+        batcher.close()
+
+
+class TestEncoderPool:
+    """Tests for length-bucketed chunk encoding."""
+
+    def test_batches_longest_first_within_token_budget(self):
+        lengths = [10, 100, 20, 100, 10, 10, 600]
+        batches = plan_batches(lengths, token_budget=250, max_batch_size=3)
+
+        assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+        assert batches[0] == [6]  # longer than the budget: alone
+        assert batches[1] == [1, 3]  # a third would pad to 300 tokens
+        assert all(len(batch) <= 3 for batch in batches)
+        for batch in batches:
+            assert len(batch) == 1 or len(batch) * max(lengths[i] for i in batch) <= 250
+
+    def test_encode_restores_input_order(self):
+        calls = []
+
+        def encode(texts):
+            calls.append(list(texts))
+            return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+        pool = EncoderPool(encode, model_name="m", backend="torch", token_budget=8, max_batch_size=4)
+        texts = ["a", "bbbb", "cc", "dddddddd", "e"]
+        matrix = pool.encode(texts, lengths=[len(t) for t in texts])
+
+        assert matrix.dtype == np.float32 and matrix.shape == (5, 2)
+        assert matrix[:, 0].tolist() == [1.0, 4.0, 2.0, 8.0, 1.0]
+        assert calls[0] == ["dddddddd"]
+        assert len(calls) > 1
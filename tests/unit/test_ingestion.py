@@ -0,0 +1,96 @@
+"""
+Unit tests for the ingestion pipeline.
+"""
+import threading
+import numpy as np
+from apps.api.settings import settings
+from rag.cache.generation import IndexGeneration
+from rag.cache.rerank_scores import RerankScoreCache
+from rag.ingestion.service import IngestionService
+
+
+class FakeEmbeddingService:
+    def __init__(self):
+        self.batches = []
+
+    def embed_array(self, texts):
+        self.batches.append(len(texts))
+        return np.array([[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+
+
+class FakeQdrantService:
+    def __init__(self):
+        self.upserted = []
+        self.vectors = []
+        self.threads = set()
+
+    def upsert_chunks(self, chunks, vectors=None):
+        self.threads.add(threading.current_thread().name)
+        self.upserted.extend(chunks)
+        self.vectors.append(vectors)
+
+
+class FakeBM25Index:
+    def __init__(self):
+        self.added = []
+
+    def add(self, chunks):
+        self.added.extend(chunks)
+
+
+class TestIngestFile:
+    """Tests for IngestionService.ingest_file."""
+
+    def test_embeds_and_upserts_in_pipelined_batches(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(settings, "INGEST_BATCH_SIZE", 3)
+        path = tmp_path / "doc.txt"
+        path.write_text("\n\n".join(f"Paragraph {i} " + "word " * 150 for i in range(8)))
+        embedding, qdrant, bm25, generation = FakeEmbeddingService(), FakeQdrantService(), FakeBM25Index(), IndexGeneration()
+        service = IngestionService(
+            embedding_service=embedding, qdrant_service=qdrant, bm25_index=bm25, generation=generation
+        )
+
+        count = service.ingest_file(str(path))
+
+        assert count == len(qdrant.upserted) == len(bm25.added) > 3
+        assert max(embedding.batches) == 3
+        # Vectors travel as one float32 matrix per batch, aligned with its chunks
+        assert [len(v) for v in qdrant.vectors] == embedding.batches
+        assert all(v.dtype == np.float32 and v.flags.c_contiguous for v in qdrant.vectors)
+        assert np.concatenate(qdrant.vectors)[:, 0].tolist() == [float(len(c.content)) for c in qdrant.upserted]
+        assert [c.id for c in qdrant.upserted] == [c.id for c in bm25.added]
+        assert qdrant.threads == {"ingest-upload_0"}  # uploads run beside the embedder
+        assert generation.value == 1
+
+    def test_reingest_drops_rerank_scores_of_the_document(self, tmp_path):
+        path = tmp_path / "doc.txt"
+        path.write_text("Some text about retrieval.")
+        cache = RerankScoreCache(max_size=10)
+        cache.put_many("key", {"old": 0.5, "other": 0.7}, sources={"old": str(path), "other": "elsewhere.txt"})
+        service = IngestionService(
+            embedding_service=FakeEmbeddingService(), qdrant_service=FakeQdrantService(),
+            bm25_index=FakeBM25Index(), generation=IndexGeneration(), score_cache=cache
+        )
+
+        service.ingest_file(str(path))
+
+        assert cache.get_many("key", ["old", "other"]) == {"other": 0.7}
+
+
+class TestIngestDirectory:
+    """Tests for IngestionService.ingest_directory."""
+
+    def test_reports_throughput(self, tmp_path, capsys):
+        (tmp_path / "a.txt").write_text("First document.")
+        (tmp_path / "b.md").write_text("Second document.")
+        (tmp_path / "skip.csv").write_text("not,ingested")
+        service = IngestionService(
+            embedding_service=FakeEmbeddingService(), qdrant_service=FakeQdrantService(),
+            bm25_index=FakeBM25Index(), generation=IndexGeneration()
+        )
+
+        total = service.ingest_directory(str(tmp_path))
+
+        out = capsys.readouterr().out
+        assert total == 2
+        assert "Ingested 2 chunks from 2 files in" in out and "chunks/s)" in out
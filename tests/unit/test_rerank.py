@@ -0,0 +1,157 @@
+"""
+Unit tests for the cross-encoder reranker.
+"""
+import numpy as np
+import pytest
+from transformers import BertConfig, BertForSequenceClassification, BertTokenizerFast
+from rag.cache.rerank_scores import RerankScoreCache
+from rag.rerank.service import RerankerService, RerankTrace
+from rag.retrieval.models import ScoredChunk
+
+WORDS = ["the", "what", "is", "retrieval", "chunk", "query", "model", "rerank", "score", "of", "and", "token", "cache"]
+
+
+@pytest.fixture(scope="module")
+def tiny_cross_encoder(tmp_path_factory):
+    """A randomly initialised two-layer BERT cross-encoder saved locally (no download)."""
+    path = tmp_path_factory.mktemp("cross-encoder")
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *WORDS, *letters, *("##" + c for c in letters)]
+    (path / "vocab.txt").write_text("\n".join(vocab))
+    tokenizer = BertTokenizerFast(str(path / "vocab.txt"))
+    config = BertConfig(
+        vocab_size=len(vocab), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+        intermediate_size=64, max_position_embeddings=64, num_labels=1
+    )
+    BertForSequenceClassification(config).save_pretrained(str(path))
+    tokenizer.save_pretrained(str(path))
+    return str(path)
+
+
+@pytest.fixture
+def reranker(tiny_cross_encoder, monkeypatch):
+    monkeypatch.setenv("HF_HUB_OFFLINE", "1")
+    return RerankerService(tiny_cross_encoder, backend="torch", score_cache=RerankScoreCache(max_size=100))
+
+
+def chunk(content, i, source="doc.txt"):
+    return ScoredChunk(
+        content=content, score=0.0, doc_id="doc", chunk_index=i, metadata={"source": source}, chunk_id=f"c{i}"
+    )
+
+
+class TestPairTokenizer:
+    """Tests for cross-encoder scoring from cached chunk token ids."""
+
+    def test_scores_match_predict(self, reranker):
+        docs = ["the chunk of retrieval model " * n for n in (1, 4, 30)] + ["zqx"]
+        for query in ["what is the rerank score", "query token " * 40]:
+            expected = reranker.model.predict([[query, doc] for doc in docs])
+            scores = reranker._predict(query, [chunk(doc, i) for i, doc in enumerate(docs)])
+            np.testing.assert_allclose(scores, expected, atol=1e-5)
+
+    def test_chunks_are_tokenized_once(self, reranker):
+        calls = []
+        tokenizer = reranker.pair_tokenizer.tokenizer
+        reranker.pair_tokenizer.tokenizer = lambda texts, **kwargs: calls.append(texts) or tokenizer(texts, **kwargs)
+        chunks = [chunk(f"retrieval chunk {i}", i) for i in range(3)]
+
+        reranker.rerank("what is retrieval", chunks, top_k=2)
+        reranker.rerank("what is the cache", chunks + [chunk("token cache", 3)], top_k=2)
+
+        # Each rerank tokenizes its query; chunk texts only the first time they are seen
+        assert calls == [
+            "what is retrieval", [c.content for c in chunks], "what is the cache", ["token cache"]
+        ]
+        assert reranker.token_cache_stats()["hits"] == 3
+
+
+class TestRerankScoreCache:
+    """Tests for reusing cross-encoder scores across reranks."""
+
+    def test_only_uncached_pairs_reach_the_model(self, reranker):
+        predicted = []
+        predict = reranker._predict
+        reranker._predict = lambda query, chunks, *args: predicted.append([c.chunk_id for c in chunks]) or predict(query, chunks, *args)
+        chunks = [chunk(f"retrieval chunk {i}", i) for i in range(4)]
+
+        first = [c.score for c in reranker.rerank("What is  retrieval?", chunks, top_k=4)]
+        more = chunks + [chunk("token cache", 4)]
+        second = reranker.rerank("what is retrieval?", [c.model_copy() for c in more], top_k=5)
+
+        # The uncased tokenizer sees the same query: only the new candidate is scored
+        assert predicted == [["c0", "c1", "c2", "c3"], ["c4"]]
+        assert sorted(c.score for c in second if c.chunk_id != "c4") == sorted(first)
+        assert reranker.score_cache_stats()["hits"] == 4
+
+    def test_scores_are_kept_per_model_and_backend(self, reranker):
+        assert reranker.cache_model.endswith("@torch")
+        chunks = [chunk(f"retrieval chunk {i}", i) for i in range(2)]
+        reranker.rerank("what is retrieval", chunks, top_k=2)
+
+        reranker.cache_model = reranker.cache_model.replace("@torch", "@onnx")
+        reranker.rerank("what is retrieval", [c.model_copy() for c in chunks], top_k=2)
+        assert reranker.score_cache_stats()["hits"] == 0
+
+
+class FakeStoredEmbeddings:
+    """Stored chunk vectors by text; texts missing here are not in the store."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def stored_array(self, texts):
+        found = [i for i, text in enumerate(texts) if text in self.vectors]
+        return np.array([self.vectors[texts[i]] for i in found], dtype=np.float32), found
+
+    def embed_query(self, query):
+        return [1.0, 0.0]
+
+
+def unit(cosine):
+    return [cosine, float(np.sqrt(1 - cosine ** 2))]
+
+
+class TestRerankCascade:
+    """Tests for pruning candidates by bi-encoder cosine before the cross-encoder."""
+
+    @pytest.fixture
+    def cascade(self, reranker):
+        cosines = {"best": 0.9, "close": 0.8, "far": 0.3, "farther": 0.1, "low": 0.75}
+        reranker.embedding_service = FakeStoredEmbeddings({text: unit(c) for text, c in cosines.items()})
+        reranker.cascade_max_gap, reranker.cascade_min_score, reranker.cascade_max_survivors = 0.2, 0.0, 10
+        scored = []
+        predict = reranker._predict
+        reranker._predict = lambda query, chunks, *args: scored.append([c.content for c in chunks]) or predict(query, chunks, *args)
+        return reranker, scored
+
+    def test_prunes_by_gap_and_keeps_unjudged(self, cascade):
+        reranker, scored = cascade
+        chunks = [chunk(text, i) for i, text in enumerate(["far", "best", "unknown", "close", "farther", "low"])]
+
+        trace = RerankTrace()
+        result = reranker.rerank("query", chunks, top_k=1, cascade=True, trace=trace)
+
+        # Within 0.2 of the best cosine, plus the chunk with no stored vector
+        assert scored == [["best", "unknown", "close", "low"]]
+        assert len(result) == 1
+        assert (trace.candidates, trace.cross_encoded, trace.unjudged) == (6, 4, 1)
+
+    def test_thresholds_and_survivor_cap(self, cascade):
+        reranker, scored = cascade
+        chunks = [chunk(text, i) for i, text in enumerate(["far", "best", "close", "low"])]
+
+        reranker.cascade_min_score = 0.78
+        reranker.rerank("query", chunks, top_k=1, cascade=True)
+        reranker.cascade_min_score, reranker.cascade_max_survivors = 0.0, 1
+        reranker.rerank("query two", chunks, top_k=3, cascade=True)
+
+        assert scored[0] == ["best", "close"]
+        # top_k always survive, whatever the thresholds
+        assert scored[1] == ["best", "close", "low"]
+
+    def test_off_by_default(self, cascade):
+        reranker, scored = cascade
+        chunks = [chunk(text, i) for i, text in enumerate(["far", "best"])]
+        reranker.rerank("query", chunks, top_k=1)
+        assert scored == [["far", "best"]]
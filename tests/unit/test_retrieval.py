@@ -0,0 +1,475 @@
+"""
+Unit tests for hybrid retrieval.
+"""
+import asyncio
+import time
+import pytest
+from types import SimpleNamespace
+from qdrant_client.http import models
+from apps.api.settings import settings
+from rag.retrieval.service import RetrievalService
+from rag.retrieval.fusion import InvalidFusionError, get_fusion_strategy
+from rag.retrieval.filters import InvalidFilterError
+from rag.cache.generation import IndexGeneration
+from rag.sparse.analyzer import Analyzer
+from rag.sparse.encoder import SparseEncoder
+
+
+class FakeEmbeddingService:
+    def __init__(self):
+        self.batches = 0
+
+    def embed_query(self, query):
+        return [0.1, 0.2, 0.3]
+
+    def embed_queries(self, queries):
+        self.batches += 1
+        return [self.embed_query(q) for q in queries]
+
+
+class FakeQdrantService:
+    def __init__(self, delay: float = 0.0, error: Exception = None, retrieve_delay: float = 0.0, retrieve_error: Exception = None):
+        self.delay = delay
+        self.error = error
+        self.retrieve_delay = retrieve_delay
+        self.retrieve_error = retrieve_error
+        self.calls = 0
+        self.retrieves = 0
+
+    def _points(self):
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return [
+            SimpleNamespace(
+                id="c1",
+                score=0.9,
+                payload={"content": "Dense hit", "doc_id": "d1", "chunk_index": 0}
+            )
+        ]
+
+    def search(self, query_vector, limit=5, query_filter=None):
+        self.calls += 1
+        self.query_filter = query_filter
+        return self._points()
+
+    def search_batch(self, query_vectors, limit=5, query_filter=None):
+        self.calls += 1
+        self.query_filter = query_filter
+        return [self._points() for _ in query_vectors]
+
+    def retrieve(self, ids):
+        self.retrieves += 1
+        time.sleep(self.retrieve_delay)
+        if self.retrieve_error:
+            raise self.retrieve_error
+        records = {
+            "c2": SimpleNamespace(id="c2", payload={"content": "Sparse hit", "doc_id": "d2", "chunk_index": 1})
+        }
+        return [records[i] for i in ids if i in records]
+
+
+class FakeAsyncQdrantService:
+    """Async facade over FakeQdrantService; the delay is awaited, not slept."""
+
+    def __init__(self, delay: float = 0.0, error: Exception = None, retrieve_delay: float = 0.0):
+        self.sync = FakeQdrantService(error=error)
+        self.delay = delay
+        self.retrieve_delay = retrieve_delay
+
+    async def search(self, query_vector, limit=5, query_filter=None):
+        await asyncio.sleep(self.delay)
+        return self.sync.search(query_vector, limit, query_filter)
+
+    async def retrieve(self, ids):
+        await asyncio.sleep(self.retrieve_delay)
+        return self.sync.retrieve(ids)
+
+
+class FakeNativeQdrantService(FakeQdrantService):
+    """Collection with native sparse vectors: hybrid queries are fused by Qdrant."""
+
+    def __init__(self):
+        super().__init__()
+        self.sparse_encoder = SparseEncoder(analyzer=Analyzer())
+        self.requests = []
+
+    def hybrid_search_batch(self, query_vectors, sparse_vectors, limit=5, prefetch_limit=10, query_filter=None, fusion=None):
+        self.calls += 1
+        self.requests.append((query_vectors, sparse_vectors, limit, prefetch_limit, query_filter, fusion))
+        return [self._points() for _ in (query_vectors or sparse_vectors)]
+
+    def hybrid_search(self, query_vector, sparse_vector, **kwargs):
+        return self.hybrid_search_batch(
+            [query_vector] if query_vector is not None else None,
+            [sparse_vector] if sparse_vector is not None else None,
+            **kwargs
+        )[0]
+
+
+class FakeBM25Index:
+    def __init__(self):
+        self.calls = 0
+
+    def search(self, query, top_k=5, filters=None):
+        self.calls += 1
+        self.filters = filters
+        return [("c2", 3.2), ("gone", 1.0)]
+
+    def search_many(self, queries, top_k=5, filters=None):
+        self.calls += 1
+        self.filters = filters
+        return [[("c2", 3.2), ("gone", 1.0)] for _ in queries]
+
+
+def make_service(qdrant=None, bm25=None, generation=None, async_qdrant=None):
+    return RetrievalService(
+        embedding_service=FakeEmbeddingService(),
+        qdrant_service=qdrant or FakeQdrantService(),
+        bm25_index=bm25 or FakeBM25Index(),
+        generation=generation or IndexGeneration(),
+        async_qdrant_service=async_qdrant
+    )
+
+
+class TestHybridSearchLegs:
+    """Tests for concurrent dense/sparse legs."""
+
+    def test_both_legs_merged(self):
+        result = make_service().hybrid_search_with_status("query", top_k=5)
+        assert not result.degraded
+        assert {c.content for c in result.chunks} == {"Dense hit", "Sparse hit"}
+
+    def test_slow_leg_degrades(self, monkeypatch):
+        """A leg that misses its deadline is dropped and the result flagged."""
+        monkeypatch.setattr(settings, "DENSE_LEG_TIMEOUT", 0.05)
+        service = make_service(qdrant=FakeQdrantService(delay=0.5))
+        result = service.hybrid_search_with_status("query", top_k=5)
+        assert result.degraded
+        assert "dense" in result.failed_legs
+        assert [c.content for c in result.chunks] == ["Sparse hit"]
+
+    def test_failed_leg_degrades(self):
+        service = make_service(qdrant=FakeQdrantService(error=ConnectionError("down")))
+        result = service.hybrid_search_with_status("query", top_k=5)
+        assert result.degraded
+        assert [c.content for c in result.chunks] == ["Sparse hit"]
+
+    def test_payload_lookup_failure_degrades(self):
+        """Qdrant down: the dense leg and the payload lookup for BM25 hits both fail, BM25 hits still return."""
+        qdrant = FakeQdrantService(error=ConnectionError("down"), retrieve_error=ConnectionError("down"))
+        service = make_service(qdrant=qdrant)
+        result = service.hybrid_search_with_status("query", top_k=5)
+        assert result.degraded
+        assert set(result.failed_legs) == {"dense", "payload"}
+        assert [(c.chunk_id, c.content) for c in result.chunks] == [("c2", ""), ("gone", "")]
+        assert service.hybrid_search_with_status("query", top_k=5).degraded  # not cached
+
+    def test_slow_payload_lookup_degrades(self, monkeypatch):
+        monkeypatch.setattr(settings, "PAYLOAD_LEG_TIMEOUT", 0.05)
+        service = make_service(qdrant=FakeQdrantService(retrieve_delay=0.5))
+        start = time.monotonic()
+        result = service.hybrid_search_with_status("query", top_k=5)
+        assert time.monotonic() - start < 0.4
+        assert result.degraded and "payload" in result.failed_legs
+        assert {c.chunk_id: c.content for c in result.chunks} == {"c1": "Dense hit", "c2": "", "gone": ""}
+
+    def test_all_legs_failed_raises(self):
+        bm25 = FakeBM25Index()
+
+        def broken_search(query, top_k=5, filters=None):
+            raise ValueError("broken")
+
+        bm25.search = broken_search
+        service = make_service(qdrant=FakeQdrantService(error=ConnectionError("down")), bm25=bm25)
+        with pytest.raises(RuntimeError, match="All retrieval legs failed") as excinfo:
+            service.hybrid_search("query")
+        assert "broken" in str(excinfo.value) and "down" in str(excinfo.value)
+
+    def test_abandoned_legs_do_not_queue_later_requests(self, monkeypatch):
+        """A timed-out leg keeps its worker; with none free, the next leg fails fast instead of waiting."""
+        monkeypatch.setattr(settings, "RETRIEVAL_LEG_WORKERS", 2)
+        monkeypatch.setattr(settings, "DENSE_LEG_TIMEOUT", 0.05)
+        qdrant = FakeQdrantService(delay=0.5)
+        service = make_service(qdrant=qdrant)
+        assert "dense" in service.hybrid_search_with_status("query", top_k=5).failed_legs
+
+        qdrant.delay = 0.0
+        start = time.monotonic()
+        result = service.hybrid_search_with_status("other query", top_k=5)
+        assert time.monotonic() - start < 0.3
+        assert result.degraded and "no free retrieval leg worker" in result.failed_legs["sparse"]
+        assert [c.content for c in result.chunks] == ["Dense hit"]
+
+    def test_zero_weight_leg_skipped(self):
+        qdrant, bm25 = FakeQdrantService(), FakeBM25Index()
+        service = make_service(qdrant=qdrant, bm25=bm25)
+
+        service.hybrid_search("query", alpha=1.0)
+        assert (qdrant.calls, bm25.calls) == (1, 0)
+
+        service.hybrid_search("query", alpha=0.0)
+        assert (qdrant.calls, bm25.calls) == (1, 1)
+
+
+class TestFusion:
+    """Tests for id-keyed fusion strategies."""
+
+    dense = (["a", "b", "c"], [0.9, 0.5, 0.1])
+    sparse = (["c", "d"], [12.0, 3.0])
+
+    def test_weighted_matches_min_max(self):
+        fused = dict(get_fusion_strategy("weighted").fuse([self.dense, self.sparse], [0.5, 0.5], top_k=10))
+        assert fused["a"] == pytest.approx(0.5, abs=1e-5)
+        # "c" is last in dense (0) but first in sparse (1)
+        assert fused["c"] == pytest.approx(0.5, abs=1e-5)
+        assert fused["d"] == pytest.approx(0.0, abs=1e-5)
+
+    def test_rrf_rewards_agreement(self):
+        fused = get_fusion_strategy("rrf").fuse([self.dense, self.sparse], [0.5, 0.5], top_k=2)
+        assert [chunk_id for chunk_id, _ in fused] == ["c", "a"]
+
+    def test_zscore_top_k_sorted(self):
+        fused = get_fusion_strategy("zscore").fuse([self.dense, self.sparse], [0.7, 0.3], top_k=3)
+        scores = [score for _, score in fused]
+        assert len(fused) == 3
+        assert scores == sorted(scores, reverse=True)
+
+    def test_zero_weight_leg_ignored(self):
+        fused = get_fusion_strategy("weighted").fuse([self.dense, self.sparse], [1.0, 0.0], top_k=1)
+        assert fused[0][0] == "a"
+
+    def test_empty_legs(self):
+        assert get_fusion_strategy("rrf").fuse([([], []), ([], [])], [0.5, 0.5], top_k=5) == []
+
+    def test_unknown_strategy(self):
+        with pytest.raises(InvalidFusionError):
+            get_fusion_strategy("borda")
+
+
+class TestRetrievalCache:
+    """Tests for the retrieval result cache."""
+
+    def test_repeated_query_is_served_from_cache(self):
+        qdrant, bm25 = FakeQdrantService(), FakeBM25Index()
+        service = make_service(qdrant=qdrant, bm25=bm25)
+
+        first = service.hybrid_search("What is  LISP?", top_k=2)
+        second = service.hybrid_search("what is lisp?", top_k=2)
+
+        assert [c.chunk_id for c in second] == [c.chunk_id for c in first]
+        assert qdrant.calls == 1 and bm25.calls == 1
+        assert service.cache.stats()["hits"] == 1
+
+    def test_parameters_are_part_of_the_key(self):
+        qdrant = FakeQdrantService()
+        service = make_service(qdrant=qdrant)
+
+        service.hybrid_search("lisp", top_k=2, alpha=0.5)
+        service.hybrid_search("lisp", top_k=2, alpha=0.7)
+        service.hybrid_search("lisp", top_k=3, alpha=0.7)
+        service.search("lisp", top_k=3)
+
+        assert qdrant.calls == 4
+
+    def test_ingest_generation_invalidates(self):
+        qdrant, generation = FakeQdrantService(), IndexGeneration()
+        service = make_service(qdrant=qdrant, generation=generation)
+
+        service.search("lisp")
+        generation.bump()
+        service.search("lisp")
+
+        assert qdrant.calls == 2
+
+    def test_cached_results_are_copies(self):
+        service = make_service()
+        results = service.search("lisp")
+        results[0].score = -1.0  # e.g. overwritten by the reranker
+        assert service.search("lisp")[0].score == 0.9
+
+    def test_degraded_results_are_not_cached(self):
+        bm25 = FakeBM25Index()
+        service = make_service(qdrant=FakeQdrantService(error=ConnectionError("down")), bm25=bm25)
+
+        assert service.hybrid_search_with_status("lisp").degraded
+        assert service.hybrid_search_with_status("lisp").degraded
+        assert bm25.calls == 2
+
+
+class TestSearchMany:
+    """Tests for batched hybrid search."""
+
+    def test_matches_single_queries_with_one_call_per_backend(self):
+        qdrant, bm25 = FakeQdrantService(), FakeBM25Index()
+        service = make_service(qdrant=qdrant, bm25=bm25)
+        queries = ["what is lisp", "who wrote it", "why macros"]
+
+        results = service.search_many(queries, top_k=2)
+
+        assert len(results) == 3
+        assert qdrant.calls == 1 and bm25.calls == 1 and qdrant.retrieves == 1
+        assert service.embedding_service.batches == 1
+        expected = make_service().hybrid_search("what is lisp", top_k=2)
+        for chunks in results:
+            assert [(c.chunk_id, c.score) for c in chunks] == [(c.chunk_id, c.score) for c in expected]
+
+    def test_uses_and_fills_the_cache(self):
+        qdrant = FakeQdrantService()
+        service = make_service(qdrant=qdrant)
+        service.hybrid_search("what is lisp", top_k=2)
+
+        results = service.search_many(["what is lisp", "who wrote it"], top_k=2)
+        assert [c.chunk_id for c in results[0]] == ["c2", "c1"]
+        assert service.hybrid_search("who wrote it", top_k=2) == results[1]
+        assert qdrant.calls == 2
+
+    def test_dense_only_skips_bm25(self):
+        bm25 = FakeBM25Index()
+        service = make_service(bm25=bm25)
+        results = service.search_many(["a", "b"], top_k=2, alpha=1.0)
+        assert bm25.calls == 0
+        assert [[c.chunk_id for c in chunks] for chunks in results] == [["c1"], ["c1"]]
+
+
+class TestAsyncRetrieval:
+    """Tests for the async retrieval methods."""
+
+    def test_async_hybrid_matches_sync(self):
+        expected = make_service().hybrid_search("lisp", top_k=2)
+        for async_qdrant in (FakeAsyncQdrantService(), None):  # None: sync client on the executor
+            service = make_service(async_qdrant=async_qdrant)
+            result = asyncio.run(service.ahybrid_search_with_status("lisp", top_k=2))
+            assert not result.degraded
+            assert [(c.chunk_id, c.score) for c in result.chunks] == [(c.chunk_id, c.score) for c in expected]
+
+    def test_async_search(self):
+        service = make_service(async_qdrant=FakeAsyncQdrantService())
+        results = asyncio.run(service.asearch("lisp"))
+        assert [c.chunk_id for c in results] == ["c1"]
+
+    def test_slow_dense_leg_degrades_without_blocking_the_loop(self, monkeypatch):
+        monkeypatch.setattr(settings, "DENSE_LEG_TIMEOUT", 0.1)
+        service = make_service(async_qdrant=FakeAsyncQdrantService(delay=1.0))
+
+        async def main():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            task = asyncio.ensure_future(ticker())
+            result = await service.ahybrid_search_with_status("lisp", top_k=2)
+            task.cancel()
+            return result, ticks
+
+        result, ticks = asyncio.run(main())
+        assert result.degraded and "dense" in result.failed_legs
+        assert [c.chunk_id for c in result.chunks] == ["c2"]
+        assert ticks >= 5  # other coroutines kept running during the search
+
+    def test_slow_payload_lookup_degrades(self, monkeypatch):
+        monkeypatch.setattr(settings, "PAYLOAD_LEG_TIMEOUT", 0.05)
+        service = make_service(async_qdrant=FakeAsyncQdrantService(retrieve_delay=1.0))
+        result = asyncio.run(service.ahybrid_search_with_status("lisp", top_k=2))
+        assert result.degraded and set(result.failed_legs) == {"payload"}
+        assert {c.chunk_id: c.content for c in result.chunks} == {"c1": "Dense hit", "c2": ""}
+
+
+class TestFilterPushdown:
+    """Tests for metadata filters reaching both legs."""
+
+    def test_filters_reach_both_legs(self):
+        qdrant, bm25 = FakeQdrantService(), FakeBM25Index()
+        service = make_service(qdrant=qdrant, bm25=bm25)
+
+        service.hybrid_search("lisp", filters={"source": "a.pdf", "type": ["pdf", "md"]})
+
+        assert bm25.filters == {"source": ["a.pdf"], "type": ["md", "pdf"]}
+        conditions = {c.key: c.match for c in qdrant.query_filter.must}
+        assert conditions["source"].value == "a.pdf"
+        assert conditions["type"].any == ["md", "pdf"]
+
+    def test_filters_are_part_of_the_cache_key(self):
+        qdrant = FakeQdrantService()
+        service = make_service(qdrant=qdrant)
+
+        service.search("lisp", filters={"doc_id": "d1"})
+        service.search("lisp", filters={"doc_id": "d2"})
+        service.search("lisp", filters={"doc_id": ["d2"]})
+
+        assert qdrant.calls == 2
+
+    def test_unknown_filter_field(self):
+        with pytest.raises(InvalidFilterError):
+            make_service().search("lisp", filters={"author": "pg"})
+
+
+class TestNativeSparseRetrieval:
+    """Tests for hybrid search fused inside Qdrant (SPARSE_BACKEND=qdrant)."""
+
+    def make_native_service(self):
+        return RetrievalService(
+            embedding_service=FakeEmbeddingService(),
+            qdrant_service=FakeNativeQdrantService(),
+            generation=IndexGeneration()
+        )
+
+    def test_single_query_without_bm25_index(self):
+        service = self.make_native_service()
+        assert service.bm25_index is None
+
+        result = service.hybrid_search_with_status("lisp macros", top_k=3, fusion="rrf", filters={"type": "pdf"})
+
+        qdrant = service.qdrant_service
+        assert not result.degraded and [c.chunk_id for c in result.chunks] == ["c1"]
+        assert qdrant.calls == 1 and qdrant.retrieves == 0
+        dense, sparse, limit, prefetch_limit, query_filter, fusion = qdrant.requests[0]
+        assert dense == [[0.1, 0.2, 0.3]] and sparse == [qdrant.sparse_encoder.encode_query("lisp macros")]
+        assert (limit, prefetch_limit, fusion) == (3, 6, models.Fusion.RRF)
+        assert query_filter.must[0].key == "type"
+
+    def test_zero_weight_leg_and_fusion_mapping(self):
+        service = self.make_native_service()
+        service.search_many(["a", "b"], top_k=2, alpha=0.0, fusion="zscore")
+        dense, sparse, _, _, _, fusion = service.qdrant_service.requests[0]
+        assert dense is None and len(sparse) == 2 and fusion == models.Fusion.DBSF
+        assert service.embedding_service.batches == 0
+
+    def test_weighted_fusion_normalises_both_legs(self):
+        """Raw cosine and BM25 scores are not comparable; weighted goes through DBSF like zscore."""
+        service = self.make_native_service()
+        service.hybrid_search_with_status("lisp", top_k=2, fusion="weighted")
+        *_, fusion = service.qdrant_service.requests[0]
+        assert fusion == models.Fusion.DBSF
+
+    def test_uneven_alpha_rejected(self):
+        service = self.make_native_service()
+        for fusion in ("weighted", "rrf"):
+            with pytest.raises(InvalidFusionError):
+                service.hybrid_search_with_status("lisp", top_k=2, alpha=0.8, fusion=fusion)
+        assert service.qdrant_service.calls == 0
+
+    def test_qdrant_failure_degrades(self):
+        """A failed server-side query flags the result as degraded and is not cached."""
+        service = self.make_native_service()
+        service.qdrant_service.error = ConnectionError("down")
+        for result in (
+            service.hybrid_search_with_status("lisp", top_k=2, fusion="rrf"),
+            asyncio.run(service.ahybrid_search_with_status("lisp", top_k=2, fusion="rrf")),
+        ):
+            assert result.degraded and result.chunks == []
+            assert result.failed_legs == {"hybrid": "down"}
+
+        service.qdrant_service.error = None
+        assert not service.hybrid_search_with_status("lisp", top_k=2, fusion="rrf").degraded
+
+    def test_async_uses_one_query(self):
+        service = self.make_native_service()
+        result = asyncio.run(service.ahybrid_search_with_status("lisp", top_k=2, alpha=1.0))
+        assert [c.chunk_id for c in result.chunks] == ["c1"]
+        dense, sparse, _, _, _, _ = service.qdrant_service.requests[0]
+        assert dense == [[0.1, 0.2, 0.3]] and sparse is None
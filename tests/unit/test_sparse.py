@@ -0,0 +1,375 @@
+"""
+Unit tests for the sparse (BM25) index.
+"""
+import math
+import json
+import os
+import pickle
+import sys
+import types
+from collections import Counter
+import random
+import numpy as np
+import pytest
+from rag.sparse.analyzer import Analyzer, Vocabulary
+from rag.sparse import inverted
+from rag.sparse.inverted import CorpusStats, Segment, SearchTrace
+from rag.sparse.index import BM25Index
+from rag.sparse.encoder import SparseEncoder
+from rag.cache.generation import IndexGeneration
+from rag.ingestion.models import Chunk
+
+
+def brute_force_bm25(corpus, query, k1=1.5, b=0.75):
+    """Reference BM25 that scores every document."""
+    n = len(corpus)
+    avgdl = sum(len(doc) for doc in corpus) / n
+    scores = []
+    for doc in corpus:
+        score = 0.0
+        for term in query:
+            df = sum(1 for d in corpus if term in d)
+            if df == 0:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            tf = doc.count(term)
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avgdl))
+        scores.append(score)
+    return scores
+
+
+@pytest.fixture
+def random_corpus():
+    rng = random.Random(7)
+    words = [f"w{i}" for i in range(50)]
+    return [[rng.choice(words) for _ in range(rng.randint(3, 40))] for _ in range(200)]
+
+
+@pytest.fixture
+def zipf_corpus():
+    """Skewed term frequencies, like real text, so pruning has something to skip."""
+    rng = np.random.default_rng(11)
+    ranks = np.arange(1, 301)
+    probs = (1 / ranks) / (1 / ranks).sum()
+    return [[f"w{i}" for i in rng.choice(300, size=rng.integers(5, 60), p=probs)] for _ in range(1500)]
+
+
+def make_segment(corpus, name="seg"):
+    vocabulary = Vocabulary()
+    term_ids = [vocabulary.intern(doc) for doc in corpus]
+    segment = Segment.from_tokens(name, [f"{name}-{i}" for i in range(len(corpus))], term_ids)
+    stats = CorpusStats()
+    stats.add(segment)
+    return segment, stats, vocabulary
+
+
+def make_chunks(texts):
+    return [Chunk(doc_id="d", content=text, chunk_index=i) for i, text in enumerate(texts)]
+
+
+class TestInvertedIndex:
+    """Tests for inverted-index BM25 scoring."""
+
+    def test_matches_brute_force(self, random_corpus):
+        segment, stats, vocabulary = make_segment(random_corpus)
+        query = ["w1", "w7", "w7", "w42", "unknown"]
+        expected = brute_force_bm25(random_corpus, query)
+
+        results = segment.search(Counter(vocabulary.lookup(query)), stats, top_k=10)
+        top_expected = sorted(range(len(expected)), key=lambda i: -expected[i])[:10]
+
+        assert [doc for doc, _ in results] == top_expected
+        for doc, score in results:
+            assert score == pytest.approx(expected[doc])
+
+    def test_unmatched_query(self, random_corpus):
+        segment, stats, _ = make_segment(random_corpus)
+        assert segment.search(Counter([10_000]), stats, top_k=5) == []
+
+    def test_postings_sorted_by_doc(self, random_corpus):
+        segment, _, vocabulary = make_segment(random_corpus)
+        ids, tfs = segment.postings(vocabulary.get("w3"))
+        assert list(ids) == sorted(ids)
+        assert all(tf >= 1 for tf in tfs)
+
+    def test_merge_keeps_fields_missing_from_some_segments(self):
+        """A field absent from one input segment must survive the merge."""
+        with_type = Segment.from_tokens("a", ["a-0", "a-1"], [[1], [2]], fields={"type": ["pdf", "text"]})
+        without = Segment.from_tokens("b", ["b-0"], [[1]])
+
+        merged = Segment.merge("m", [with_type, without])
+        assert set(merged.fields) == {"type"}
+        assert list(merged.field_values("type")) == ["pdf", "text", ""]
+        assert list(merged.filter_mask({"type": ["pdf"]})) == [True, False, False]
+
+    @pytest.mark.parametrize("top_k", [1, 3, 10, 50])
+    def test_pruning_matches_exhaustive(self, zipf_corpus, monkeypatch, top_k):
+        monkeypatch.setattr(inverted, "BLOCK_SIZE", 16)
+        segment, stats, vocabulary = make_segment(zipf_corpus)
+        segment.deleted[::7] = True
+        rng = random.Random(3)
+        for _ in range(20):
+            query = Counter(vocabulary.lookup([f"w{rng.randrange(300)}" for _ in range(rng.randint(2, 12))]))
+            exhaustive = segment.search(query, stats, top_k=top_k, prune=False)
+            pruned = segment.search(query, stats, top_k=top_k, prune=True)
+            assert pruned == exhaustive
+
+    def test_pruning_scores_fewer_postings(self, zipf_corpus, monkeypatch):
+        monkeypatch.setattr(inverted, "BLOCK_SIZE", 16)
+        segment, stats, vocabulary = make_segment(zipf_corpus)
+        query = Counter(vocabulary.lookup([f"w{i}" for i in (0, 1, 2, 3, 5, 8, 150, 220)]))
+        exhaustive, pruned = SearchTrace(), SearchTrace()
+        segment.search(query, stats, top_k=5, prune=False, trace=exhaustive)
+        segment.search(query, stats, top_k=5, prune=True, trace=pruned)
+        assert exhaustive.postings_scored == exhaustive.postings_total
+        assert pruned.postings_scored < exhaustive.postings_scored
+
+
+class TestAnalyzer:
+    """Tests for text analysis and term interning."""
+
+    def test_normalises_punctuation_case_and_stopwords(self):
+        analyzer = Analyzer()
+        assert analyzer.analyze("The Transformer, and the TRANSFORMER!") == ["transformer", "transformer"]
+
+    def test_unicode_normalisation(self):
+        assert Analyzer().analyze("ｆｕｌｌｗｉｄｔｈ café") == ["fullwidth", "café"]
+
+    def test_stopwords_optional(self):
+        assert Analyzer(stopwords=None).analyze("the model") == ["the", "model"]
+
+    def test_vocabulary_appends(self, tmp_path):
+        path = str(tmp_path / "vocab.txt")
+        vocabulary = Vocabulary(path)
+        assert vocabulary.intern(["lisp", "python", "lisp"]) == [0, 1, 0]
+        vocabulary.save()
+        vocabulary.intern(["rust"])
+        vocabulary.save()
+
+        reloaded = Vocabulary(path)
+        assert reloaded.lookup(["python", "rust", "cobol"]) == [1, 2]
+
+
+class TestSparseEncoder:
+    """Tests for BM25 sparse vectors stored in Qdrant."""
+
+    def test_document_weights_are_bm25_term_frequencies(self):
+        encoder = SparseEncoder(analyzer=Analyzer(), k1=1.5, b=0.75, avg_len=4)
+        vector = encoder.encode_document("The lisp, lisp macros")
+        weights = dict(zip(vector.indices, vector.values))
+
+        norm = 1.5 * (1 - 0.75 + 0.75 * 3 / 4)
+        assert vector.indices == sorted(vector.indices)
+        assert weights[encoder.term_id("lisp")] == pytest.approx(2 * 2.5 / (2 + norm))
+        assert weights[encoder.term_id("macros")] == pytest.approx(2.5 / (1 + norm))
+        assert encoder.term_id("the") not in weights
+
+    def test_query_weights_are_term_counts(self):
+        encoder = SparseEncoder(analyzer=Analyzer())
+        vector = encoder.encode_query("LISP macros lisp")
+        assert dict(zip(vector.indices, vector.values)) == {
+            encoder.term_id("lisp"): 2.0, encoder.term_id("macros"): 1.0
+        }
+        assert encoder.encode_query("the and of").indices == []
+
+    def test_dot_product_with_idf_is_bm25(self, random_corpus):
+        """Qdrant's IDF times the stored weights reproduces brute-force BM25."""
+        avg_len = sum(len(doc) for doc in random_corpus) / len(random_corpus)
+        encoder = SparseEncoder(analyzer=Analyzer(stopwords=None), avg_len=avg_len)
+        docs = [dict(zip(v.indices, v.values)) for v in encoder.encode_documents([" ".join(d) for d in random_corpus])]
+        query = ["w1", "w7", "w7"]
+        query_vector = encoder.encode_query(" ".join(query))
+        n = len(docs)
+        scores = []
+        for doc in docs:
+            score = 0.0
+            for term, count in zip(query_vector.indices, query_vector.values):
+                df = sum(1 for d in docs if term in d)
+                score += count * math.log(1 + (n - df + 0.5) / (df + 0.5)) * doc.get(term, 0.0)
+            scores.append(score)
+        assert scores == pytest.approx(brute_force_bm25(random_corpus, query))
+
+
+class TestBM25Index:
+    """Tests for the segment-based BM25 index."""
+
+    def test_search_returns_chunks(self, tmp_path):
+        index = BM25Index(persistence_dir=str(tmp_path / "bm25"))
+        chunks = make_chunks(["Lisp was designed by John McCarthy", "Python is a dynamic language"])
+        index.build(chunks)
+
+        reloaded = BM25Index(persistence_dir=str(tmp_path / "bm25"))
+        results = reloaded.search("who designed lisp", top_k=1)
+        assert results[0][0] == chunks[0].id
+        assert results[0][1] > 0
+
+    def test_unreadable_index_refuses_to_load(self, tmp_path):
+        """An index that cannot be opened must not be replaced by an empty one."""
+        path = tmp_path / "bm25"
+        BM25Index(persistence_dir=str(path)).build(make_chunks(["alpha beta", "beta gamma"]))
+        manifest = json.loads((path / "manifest.json").read_text())
+
+        (path / "manifest.json").write_text(json.dumps({**manifest, "version": 2}))
+        with pytest.raises(RuntimeError, match="format 2"):
+            BM25Index(persistence_dir=str(path))
+
+        (path / "manifest.json").write_text(json.dumps(manifest))
+        os.remove(path / manifest["segments"][0]["name"] / "tfs.npy")
+        with pytest.raises(RuntimeError, match="Failed to load"):
+            BM25Index(persistence_dir=str(path))
+        assert json.loads((path / "manifest.json").read_text()) == manifest
+
+    def test_legacy_pickle_is_migrated(self, tmp_path, monkeypatch):
+        """A pre-segment bm25.pkl loads without rank-bm25 installed; its chunks are re-indexed."""
+        rank_bm25 = types.ModuleType("rank_bm25")
+
+        class BM25Okapi:
+            def __init__(self, corpus):
+                self.doc_freqs = [Counter(doc) for doc in corpus]
+                self.idf = np.ones(3)
+
+        BM25Okapi.__module__, BM25Okapi.__qualname__ = "rank_bm25", "BM25Okapi"
+        rank_bm25.BM25Okapi = BM25Okapi
+        monkeypatch.setitem(sys.modules, "rank_bm25", rank_bm25)
+        chunks = make_chunks(["Lisp was designed by John McCarthy", "Python is a dynamic language"])
+        with open(tmp_path / "bm25.pkl", "wb") as f:
+            pickle.dump({"bm25": BM25Okapi([c.content.split() for c in chunks]), "chunks": chunks}, f)
+        monkeypatch.delitem(sys.modules, "rank_bm25")
+
+        index = BM25Index(persistence_dir=str(tmp_path / "bm25"))
+        assert index.num_docs == 2
+        assert index.search("who designed lisp", top_k=1)[0][0] == chunks[0].id
+        assert os.path.exists(tmp_path / "bm25" / "manifest.json")
+
+    def test_unreadable_legacy_pickle_refuses_to_load(self, tmp_path):
+        (tmp_path / "bm25.pkl").write_bytes(b"not a pickle")
+        with pytest.raises(RuntimeError, match="legacy BM25 index"):
+            BM25Index(persistence_dir=str(tmp_path / "bm25"))
+        assert not os.path.exists(tmp_path / "bm25" / "manifest.json")
+
+    def test_on_disk_format_is_memory_mapped(self, tmp_path):
+        index = BM25Index(persistence_dir=str(tmp_path / "bm25"))
+        index.build(make_chunks(["alpha beta", "beta gamma"]))
+
+        segment = BM25Index(persistence_dir=str(tmp_path / "bm25")).segments[0]
+        assert isinstance(segment.doc_ids, np.memmap)
+        assert isinstance(segment.chunk_ids, np.memmap)
+        files = set(os.listdir(tmp_path / "bm25" / segment.name))
+        assert {"terms.npy", "doc_len.npy"} <= files
+        assert os.path.exists(tmp_path / "bm25" / "vocab.txt")
+
+    def test_incremental_matches_full_build(self, tmp_path, random_corpus):
+        chunks = make_chunks([" ".join(doc) for doc in random_corpus])
+        full = BM25Index(persistence_dir=str(tmp_path / "full"))
+        full.build(chunks)
+
+        incremental = BM25Index(persistence_dir=str(tmp_path / "incremental"), max_segments=100)
+        for start in range(0, len(chunks), 30):
+            incremental.add(chunks[start:start + 30])
+        assert len(incremental.segments) == 7
+
+        query = "w1 w7 w42"
+        expected = [(c, pytest.approx(s)) for c, s in full.search(query, top_k=10)]
+        assert incremental.search(query, top_k=10) == expected
+
+    def test_delete_and_merge(self, tmp_path, random_corpus):
+        chunks = make_chunks([" ".join(doc) for doc in random_corpus])
+        index = BM25Index(persistence_dir=str(tmp_path / "bm25"), max_segments=3, merge_factor=3)
+        top = None
+        for start in range(0, len(chunks), 50):
+            index.add(chunks[start:start + 50])
+            index.wait_for_merges()
+            if top is None:
+                top = index.search("w5", top_k=1)[0][0]
+
+        # Four adds with max_segments=3 triggers one background merge
+        assert len(index.segments) == 2
+
+        assert index.delete([top]) == 1
+        assert top not in [c for c, _ in index.search("w5", top_k=200)]
+        assert index.num_docs == len(chunks) - 1
+
+        reloaded = BM25Index(persistence_dir=str(tmp_path / "bm25"))
+        assert reloaded.num_docs == len(chunks) - 1
+        assert reloaded.search("w5 w9", top_k=5) == index.search("w5 w9", top_k=5)
+
+    def test_delete_bumps_generation(self, tmp_path):
+        """Deleting chunks must invalidate cached retrieval results."""
+        generation = IndexGeneration()
+        index = BM25Index(persistence_dir=str(tmp_path / "bm25"), generation=generation)
+        chunks = make_chunks(["alpha beta", "beta gamma"])
+        index.build(chunks)
+
+        assert index.delete(["no-such-chunk"]) == 0
+        assert generation.value == 0
+        assert index.delete([chunks[0].id]) == 1
+        assert generation.value == 1
+
+    def test_sharded_scores_match_unsharded(self, tmp_path, random_corpus):
+        chunks = make_chunks([" ".join(doc) for doc in random_corpus])
+        single = BM25Index(persistence_dir=str(tmp_path / "single"), num_shards=1)
+        sharded = BM25Index(persistence_dir=str(tmp_path / "sharded"), num_shards=4)
+        for start in range(0, len(chunks), 70):
+            single.add(chunks[start:start + 70])
+            sharded.add(chunks[start:start + 70])
+
+        assert {s.shard for s in sharded.segments} == {0, 1, 2, 3}
+        for query in ["w1 w7 w42", "w3", "w10 w11 w12 w13 w14"]:
+            expected = dict(single.search(query, top_k=len(chunks)))
+            assert dict(sharded.search(query, top_k=len(chunks))) == expected
+            assert [s for _, s in sharded.search(query, top_k=10)] == \
+                [s for _, s in single.search(query, top_k=10)]
+
+    def test_pruned_index_matches_exhaustive_across_segments(self, tmp_path, zipf_corpus):
+        chunks = make_chunks([" ".join(doc) for doc in zipf_corpus])
+        pruned = BM25Index(persistence_dir=str(tmp_path / "pruned"), prune=True, max_segments=100)
+        exhaustive = BM25Index(persistence_dir=str(tmp_path / "exhaustive"), prune=False, max_segments=100)
+        for start in range(0, len(chunks), 300):
+            pruned.add(chunks[start:start + 300])
+            exhaustive.add(chunks[start:start + 300])
+
+        for query in ["w0 w1 w2 w3 w4 w5 w6 w7", "w40 w2 w250", "w9 w17"]:
+            assert pruned.search(query, top_k=10) == exhaustive.search(query, top_k=10)
+
+    def test_search_many_matches_search(self, tmp_path, random_corpus):
+        index = BM25Index(persistence_dir=str(tmp_path / "bm25"), num_shards=3)
+        index.add(make_chunks([" ".join(doc) for doc in random_corpus]))
+        queries = ["w1 w7 w42", "unknown", "w3", "w10 w11 w12"]
+
+        assert index.search_many(queries, top_k=5) == [index.search(q, top_k=5) for q in queries]
+
+    def test_filters_match_post_filtering(self, tmp_path, zipf_corpus):
+        chunks = make_chunks([" ".join(doc) for doc in zipf_corpus])
+        for i, chunk in enumerate(chunks):
+            chunk.metadata = {"source": f"file{i % 10}.txt", "type": "pdf" if i % 3 == 0 else "text"}
+        index = BM25Index(persistence_dir=str(tmp_path / "bm25"), max_segments=100)
+        for start in range(0, len(chunks), 400):
+            index.add(chunks[start:start + 400])
+        meta = {c.id: c.metadata for c in chunks}
+
+        for filters in [{"source": ["file3.txt"]}, {"type": ["pdf"]}, {"source": ["file1.txt", "file2.txt"], "type": ["text"]}]:
+            everything = index.search("w0 w1 w5 w20", top_k=len(chunks))
+            expected = [
+                hit for hit in everything
+                if all(meta[hit[0]][field] in values for field, values in filters.items())
+            ][:10]
+            assert index.search("w0 w1 w5 w20", top_k=10, filters=filters) == expected
+
+        assert index.search("w0", filters={"source": ["nope.txt"]}) == []
+        reloaded = BM25Index(persistence_dir=str(tmp_path / "bm25"))
+        assert reloaded.search("w0 w1", top_k=5, filters={"type": ["pdf"]}) == \
+            index.search("w0 w1", top_k=5, filters={"type": ["pdf"]})
+
+    def test_selective_filter_scores_fewer_postings(self, tmp_path, zipf_corpus):
+        chunks = make_chunks([" ".join(doc) for doc in zipf_corpus])
+        for i, chunk in enumerate(chunks):
+            chunk.metadata = {"source": f"file{i % 100}.txt"}
+        index = BM25Index(persistence_dir=str(tmp_path / "bm25"), prune=False)
+        index.add(chunks)
+        unfiltered, filtered = SearchTrace(), SearchTrace()
+
+        index.search("w0 w1 w2", top_k=5, trace=unfiltered)
+        hits = index.search("w0 w1 w2", top_k=5, trace=filtered, filters={"source": ["file7.txt"]})
+
+        assert len(hits) == 5
+        assert filtered.postings_scored * 10 < unfiltered.postings_scored
@@ -0,0 +1,285 @@
+"""
+Unit tests for the Qdrant vector store wrapper.
+"""
+import threading
+import numpy as np
+import pytest
+from types import SimpleNamespace
+from rag.ingestion.models import Chunk
+from rag.retrieval.filters import to_qdrant_filter
+from rag.vector_store.flat import FlatVectorStore
+from qdrant_client.http import models
+from rag.sparse.encoder import SPARSE_VECTOR_NAME
+from rag.vector_store.qdrant import QdrantService, hybrid_request
+from rag.vector_store.profiles import PROFILES, get_profile
+
+
+class FakeClient:
+    def __init__(self, failures: int = 0, sparse_vectors=None):
+        self.failures = failures
+        self.sparse_vectors = sparse_vectors
+        self.batches = []
+        self.upserts = []
+        self.indexed = []
+        self.created = {}
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def get_collections(self):
+        return SimpleNamespace(collections=[SimpleNamespace(name="rag_foundry_dense")])
+
+    def create_collection(self, collection_name, vectors_config, sparse_vectors_config=None, on_disk_payload=None):
+        self.created[collection_name] = (vectors_config, on_disk_payload)
+        self.sparse_vectors = sparse_vectors_config
+
+    def query_points(self, collection_name, query, query_filter=None, search_params=None, limit=5):
+        self.queries.append(search_params)
+        return SimpleNamespace(points=[])
+
+    def get_collection(self, collection_name):
+        return SimpleNamespace(
+            payload_schema={"doc_id": "keyword"},
+            config=SimpleNamespace(params=SimpleNamespace(sparse_vectors=self.sparse_vectors))
+        )
+
+    def create_payload_index(self, collection_name, field_name, field_schema):
+        self.indexed.append(field_name)
+
+    def upsert(self, collection_name, points, wait=True):
+        with self._lock:
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("flaky")
+            self.upserts.append((list(points.ids), wait))
+            self.batches.append(points)
+
+
+def make_chunks(n):
+    return [Chunk(doc_id="d", content=f"text {i}", chunk_index=i, vector=[0.1, 0.2]) for i in range(n)]
+
+
+@pytest.fixture
+def service():
+    def build(failures=0, batch_size=4, retries=2):
+        qdrant = QdrantService(url="http://unused", client=FakeClient(failures))
+        qdrant.upsert_batch_size = batch_size
+        qdrant.upsert_retries = retries
+        qdrant.upsert_backoff = 0.0
+        return qdrant
+    return build
+
+
+class TestBulkUpsert:
+    """Tests for batched, parallel upserts."""
+
+    def test_batches_with_final_barrier(self, service):
+        qdrant = service()
+        chunks = make_chunks(10)
+        qdrant.upsert_chunks(chunks)
+
+        upserts = qdrant.client.upserts
+        assert sorted(len(ids) for ids, _ in upserts) == [2, 4, 4]
+        assert sorted(i for ids, _ in upserts for i in ids) == sorted(c.id for c in chunks)
+        # Only the last request waits for indexing, after all others were acknowledged
+        assert [wait for _, wait in upserts] == [False, False, True]
+        assert upserts[-1][0] == [c.id for c in chunks[8:]]
+
+    def test_retries_failed_batches(self, service):
+        qdrant = service(failures=2)
+        qdrant.upsert_chunks(make_chunks(10))
+        assert sum(len(ids) for ids, _ in qdrant.client.upserts) == 10
+
+    def test_gives_up_after_retries(self, service):
+        qdrant = service(failures=10, retries=1)
+        with pytest.raises(ConnectionError):
+            qdrant.upsert_chunks(make_chunks(3))
+
+    def test_vectors_as_one_matrix(self, service):
+        qdrant = service()
+        chunks = [Chunk(doc_id="d", content=f"text {i}", chunk_index=i) for i in range(6)]
+        vectors = make_vectors(6, dim=2)
+        qdrant.upsert_chunks(chunks, vectors)
+
+        batches = qdrant.client.batches
+        assert [i for batch in batches for i in batch.ids] == [c.id for c in chunks]
+        assert np.array([v for batch in batches for v in batch.vectors], dtype=np.float32).tolist() == vectors.tolist()
+        assert batches[0].payloads[0]["content"] == "text 0"
+        assert all(chunk.vector is None for chunk in chunks)
+        with pytest.raises(ValueError):
+            qdrant.upsert_chunks(chunks, vectors[:3])
+
+    def test_skips_chunks_without_vectors(self, service):
+        qdrant = service()
+        qdrant.upsert_chunks([Chunk(doc_id="d", content="x", chunk_index=0)])
+        assert qdrant.client.upserts == []
+
+
+class TestCollectionSetup:
+    """Tests for collection and payload index creation."""
+
+    def test_creates_missing_payload_indexes(self, service):
+        qdrant = service()
+        assert qdrant.client.indexed == ["type", "source"]
+
+
+class TestCollectionProfiles:
+    """Tests for named collection tuning profiles."""
+
+    def test_low_memory_profile(self):
+        client = FakeClient()
+        qdrant = QdrantService(url="http://unused", collection_name="new", client=client, profile="low-memory")
+
+        vectors_config, on_disk_payload = client.created["new"]
+        assert vectors_config.on_disk and on_disk_payload
+        assert vectors_config.quantization_config.binary.always_ram
+        qdrant.search([0.1, 0.2], limit=3)
+        assert client.queries[-1].quantization.rescore
+        assert client.queries[-1].hnsw_ef == 128
+
+    def test_default_profile_keeps_qdrant_defaults(self):
+        client = FakeClient()
+        qdrant = QdrantService(url="http://unused", collection_name="new", client=client, profile="default")
+
+        vectors_config, on_disk_payload = client.created["new"]
+        assert vectors_config.hnsw_config is None and vectors_config.quantization_config is None
+        assert not vectors_config.on_disk and not on_disk_payload
+        qdrant.search([0.1, 0.2])
+        assert client.queries[-1] is None
+
+    def test_profiles_are_valid(self):
+        for name in PROFILES:
+            profile = get_profile(name)
+            profile.vectors_config(384)
+            profile.search_params()
+        with pytest.raises(ValueError):
+            get_profile("turbo")
+
+
+class TestNativeSparseVectors:
+    """Tests for BM25 sparse vectors and server-side fusion."""
+
+    def test_new_collection_gets_idf_sparse_vector(self):
+        client = FakeClient()
+        qdrant = QdrantService(url="http://unused", collection_name="new", client=client, sparse=True)
+        assert client.sparse_vectors[SPARSE_VECTOR_NAME].modifier == models.Modifier.IDF
+
+        qdrant.upsert_chunks(make_chunks(2))
+        vectors = client.batches[0].vectors
+        assert vectors[""][0] == pytest.approx([0.1, 0.2])
+        assert vectors[SPARSE_VECTOR_NAME][0] == qdrant.sparse_encoder.encode_document("text 0")
+
+    def test_existing_collection_without_sparse_vector(self):
+        with pytest.raises(ValueError):
+            QdrantService(url="http://unused", client=FakeClient(), sparse=True)
+        QdrantService(url="http://unused", client=FakeClient(), sparse=False)
+
+    def test_hybrid_request_prefetches_both_legs(self):
+        sparse = models.SparseVector(indices=[1, 5], values=[1.0, 2.0])
+        query_filter = to_qdrant_filter({"type": ["pdf"]})
+        request = hybrid_request(
+            get_profile("low-latency"), [0.1, 0.2], sparse, limit=5, prefetch_limit=10,
+            query_filter=query_filter, fusion=models.Fusion.RRF
+        )
+        assert request.query.fusion == models.Fusion.RRF and request.limit == 5
+        dense_leg, sparse_leg = request.prefetch
+        assert dense_leg.query == [0.1, 0.2] and dense_leg.params.hnsw_ef == 64
+        assert sparse_leg.using == SPARSE_VECTOR_NAME and sparse_leg.query == sparse
+        assert dense_leg.filter == sparse_leg.filter == query_filter
+        assert {dense_leg.limit, sparse_leg.limit} == {10}
+
+    def test_single_leg_is_queried_directly(self):
+        sparse = models.SparseVector(indices=[1], values=[1.0])
+        request = hybrid_request(
+            get_profile("default"), None, sparse, limit=3, prefetch_limit=6,
+            query_filter=None, fusion=models.Fusion.DBSF
+        )
+        assert request.prefetch is None
+        assert request.query == sparse and request.using == SPARSE_VECTOR_NAME and request.limit == 3
+
+
+def make_vectors(n, dim=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def make_typed_chunks(vectors):
+    return [
+        Chunk(
+            doc_id=f"doc{i % 3}", content=f"text {i}", chunk_index=i, vector=vector.tolist(),
+            metadata={"type": "pdf" if i % 2 else "markdown", "source": f"doc{i % 3}.txt"}
+        )
+        for i, vector in enumerate(vectors)
+    ]
+
+
+def brute_force(vectors, query, k):
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normed @ (query / np.linalg.norm(query))
+    return list(np.argsort(-scores, kind="stable")[:k])
+
+
+class TestFlatVectorStore:
+    """Tests for the embedded memory-mapped vector backend."""
+
+    def test_search_matches_brute_force(self, tmp_path, monkeypatch):
+        # Small scan blocks so the per-block top-k merge is exercised
+        monkeypatch.setattr("rag.vector_store.flat.SCAN_BLOCK", 7)
+        vectors = make_vectors(50)
+        chunks = make_typed_chunks(vectors)
+        store = FlatVectorStore(persistence_dir=str(tmp_path), vector_size=8)
+        store.upsert_chunks(chunks)
+
+        queries = make_vectors(4, seed=1)
+        results = store.search_batch(queries.tolist(), limit=5)
+        for query, points in zip(queries, results):
+            assert [p.id for p in points] == [chunks[i].id for i in brute_force(vectors, query, 5)]
+            assert points[0].payload["content"].startswith("text")
+            assert points[0].score >= points[-1].score
+
+    def test_filters_use_payload_fields(self, tmp_path):
+        vectors = make_vectors(30)
+        chunks = make_typed_chunks(vectors)
+        store = FlatVectorStore(persistence_dir=str(tmp_path), vector_size=8)
+        store.upsert_chunks(chunks)
+
+        points = store.search(vectors[0].tolist(), limit=30, query_filter=to_qdrant_filter({"type": ["pdf"]}))
+        assert len(points) == 15 and all(p.payload["type"] == "pdf" for p in points)
+        points = store.search(
+            vectors[0].tolist(), limit=30,
+            query_filter=to_qdrant_filter({"doc_id": ["doc1"], "type": ["markdown", "pdf"]})
+        )
+        assert {p.payload["doc_id"] for p in points} == {"doc1"} and len(points) == 10
+        assert store.search(vectors[0].tolist(), query_filter=to_qdrant_filter({"source": ["none"]})) == []
+
+    def test_upsert_overwrites_and_persists(self, tmp_path):
+        vectors = make_vectors(1500)  # past the initial capacity
+        chunks = make_typed_chunks(vectors)
+        store = FlatVectorStore(persistence_dir=str(tmp_path), vector_size=8, dtype="float16")
+        store.upsert_chunks(chunks[:1000])
+        store.upsert_chunks(chunks[1000:])
+        chunks[0].content = "rewritten"
+        store.upsert_chunks([chunks[0]])
+        assert store.count == 1500
+
+        reopened = FlatVectorStore(persistence_dir=str(tmp_path), vector_size=8)
+        assert reopened.count == 1500 and reopened.dtype == np.float16
+        top = reopened.search(vectors[0].tolist(), limit=1)[0]
+        assert top.id == chunks[0].id and top.payload["content"] == "rewritten"
+        assert top.score == pytest.approx(1.0, abs=1e-2)
+        assert [r.id for r in reopened.retrieve([chunks[5].id, "missing"])] == [chunks[5].id]
+
+    def test_upsert_leaves_search_snapshots_alone(self, tmp_path):
+        """A search keeps the ids and payloads it took, even if an upsert overwrites those rows."""
+        chunks = make_typed_chunks(make_vectors(10))
+        store = FlatVectorStore(persistence_dir=str(tmp_path), vector_size=8)
+        store.upsert_chunks(chunks)
+        ids, payloads = store._ids, store._payloads
+
+        chunks[0].content = "rewritten"
+        store.upsert_chunks(chunks[:1] + make_typed_chunks(make_vectors(1, seed=2)))
+        assert len(ids) == 10 and payloads[0]["content"] == "text 0"
+        assert store.retrieve([chunks[0].id])[0].payload["content"] == "rewritten"
+
+    def test_rejects_wrong_dimension(self, tmp_path):
+        store = FlatVectorStore(persistence_dir=str(tmp_path), vector_size=8)
+        with pytest.raises(ValueError):
+            store.upsert_chunks(make_chunks(1))